@@ -0,0 +1,46 @@
+##Small caches shared by satbox and utils (imports neither, so either can load first)
+
+import collections
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=128):
+        """
+        Dictionary with bounded size that evicts the least recently used entry
+
+        Parameters
+        ----------
+        maxsize: int
+            Maximum number of entries kept
+        """
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        "Returns the entry for key (marking it as recently used) or default"
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        "Adds an entry, evicting the least recently used one if full"
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
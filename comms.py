@@ -182,3 +182,112 @@ def slantRange_fromAltEle(alt, ele, re = poliastro.constants.general.R_earth):
 	D = re * (np.sin(lam) / np.sin(nu)) 
 
 	return lam, nu, D
+
+####################### Link budget (arrays) #######################
+
+BOLTZMANN_DB = 10 * np.log10(1.380649e-23) #Boltzmann constant (dBW/K/Hz)
+
+def fspl_dB(D, wavelength):
+	"""
+	Free space path loss. Works elementwise on arrays
+
+	Inputs
+	D : slant range (m)
+	wavelength : wavelength (m)
+
+	Outputs
+	L_fs : free space loss (dB)
+	"""
+	return 20 * np.log10(4 * np.pi * np.asarray(D, dtype=float) / wavelength)
+
+def CN0_fromSlantRange(EIRP_dB, GonT_dB, D, wavelength, otherLoss_dB=0):
+	"""
+	Carrier to noise density ratio of a link at slant range D. Works elementwise on arrays
+
+	Inputs
+	EIRP_dB : effective isotropic radiated power (dBW)
+	GonT_dB : receive figure of merit (dB/K)
+	D : slant range (m)
+	wavelength : wavelength (m)
+	otherLoss_dB : pointing, atmospheric and system losses (dB)
+
+	Outputs
+	CN0_dB : carrier to noise density ratio (dB-Hz)
+	"""
+	return EIRP_dB - fspl_dB(D, wavelength) - otherLoss_dB + GonT_dB - BOLTZMANN_DB
+
+def dataRate_fromCN0(CN0_dB, EbN0_req=None, bandwidth=None, margin=0, maxRate=None):
+	"""
+	Achievable data rate from the carrier to noise density ratio. Works elementwise on arrays
+
+	If bandwidth is None, the rate is the one that closes the link at the
+	required Eb/N0 plus margin (CN0 - EbN0_req - margin in dB-Hz). Otherwise it
+	is the Shannon capacity B log2(1 + SNR), with SNR = CN0 - margin - 10 log10(B)
+
+	Inputs
+	CN0_dB : carrier to noise density ratio (dB-Hz)
+	EbN0_req : required Eb/N0 of the modulation and coding (dB)
+	bandwidth : receiver noise bandwidth (Hz)
+	margin : link margin (dB)
+	maxRate : maximum rate of the modem (bit/s). No cap if None
+
+	Outputs
+	rate : data rate (bit/s)
+	SNR_dB : signal to noise ratio in the bandwidth (dB). None if bandwidth is None
+	"""
+	CN0_dB = np.asarray(CN0_dB, dtype=float)
+	if bandwidth is None:
+		assert EbN0_req is not None, "EbN0_req or bandwidth must be given"
+		rate = 10**((CN0_dB - EbN0_req - margin) / 10)
+		SNR_dB = None
+	else:
+		SNR_dB = CN0_dB - margin - 10 * np.log10(bandwidth)
+		rate = bandwidth * np.log2(1 + 10**(SNR_dB / 10))
+	if maxRate is not None:
+		rate = np.minimum(rate, maxRate)
+	return rate, SNR_dB
+
+def pass_data_volumes(tSec, rate, mask):
+	"""
+	Integrates a data rate over every pass (contiguous run of True in mask)
+	with the trapezoid rule on the samples of the pass. Rows are independent
+	links (ex: satellite/ground station pairs) sharing or not the time samples
+
+	A pass with a single sample has no trapezoid, its volume is the rate times
+	the sample spacing around it (rectangle rule)
+
+	Inputs
+	tSec : (T,) or (N, T) sample times (s)
+	rate : (T,) or (N, T) data rate (bit/s)
+	mask : (T,) or (N, T) True where the link is available
+
+	Outputs
+	rowIdx : row of each pass
+	startIdx : index of the first sample of each pass
+	endIdx : index of the last sample of each pass
+	bits : data volume of each pass (bit)
+	"""
+	mask = np.atleast_2d(np.asarray(mask, dtype=bool))
+	rate = np.where(mask, np.atleast_2d(rate), 0.)
+	tSec = np.broadcast_to(np.asarray(tSec, dtype=float), rate.shape)
+
+	#Cumulative volume per row, zero rate outside of passes
+	steps = 0.5 * (rate[:, 1:] + rate[:, :-1]) * np.diff(tSec, axis=1)
+	cumBits = np.concatenate((np.zeros((rate.shape[0], 1)), np.cumsum(steps, axis=1)), axis=1)
+
+	#Pass edges (row major order so starts and stops pair up)
+	edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+	rowIdx, startIdx = np.nonzero(edges == 1)
+	_, stopIdx = np.nonzero(edges == -1)
+	endIdx = stopIdx - 1
+
+	bits = cumBits[rowIdx, endIdx] - cumBits[rowIdx, startIdx]
+
+	single = startIdx == endIdx
+	if single.any() and rate.shape[1] > 1:
+		row, idx = rowIdx[single], startIdx[single]
+		prevIdx = np.maximum(idx - 1, 0)
+		nextIdx = np.minimum(idx + 1, rate.shape[1] - 1)
+		dt = (tSec[row, nextIdx] - tSec[row, prevIdx]) / (nextIdx - prevIdx)
+		bits[single] = rate[row, idx] * dt
+	return rowIdx, startIdx, endIdx, bits
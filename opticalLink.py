@@ -0,0 +1,273 @@
+##Optical link availability along propagated passes (OpticalLinkBudget on DataAccessSat time series)
+
+import numpy as np
+import astropy.units as u
+from astropy.time import Time
+
+import OpticalLinkBudget.OLBtools as olb
+
+
+class OpticalTerminal():
+    """
+    Optical link terminals (transmit and receive side), as defined in
+    OpticalLinkBudget/Exemple 1.py
+
+    Args:
+        p_tx (W) : Transmit power
+        wavelength (m) : Laser wavelength
+        beamWidth (rad) : FWHM beam width
+        pointingErr (rad) : Pointing error
+        sysLoss_tx (dB) : Transmit system loss
+        aperture (m) : Receive aperture diameter
+        sysLoss_rx (dB) : Receive system loss
+        NEP (W/Hz^0.5) : Noise equivalent power of the detector
+        bandwidth (Hz) : Detector bandwidth
+        sensitivity (W) : Received power threshold of the outage probability
+        uplink (bool) : If True, ground to space (untracked uplink scintillation), else space to ground
+        Cn2 : Cn2 model, function of h (m). Default is Hufnagel-Valley 5/7
+        atmModel (int) : LOWTRAN model for the atmospheric transmittance. None for no atmospheric loss
+    """
+    def __init__(self, p_tx, wavelength, beamWidth, pointingErr=0, sysLoss_tx=0,
+                 aperture=None, sysLoss_rx=0, NEP=None, bandwidth=None,
+                 sensitivity=None, uplink=False, Cn2=olb.Cn2_HV_57, atmModel=None):
+        self.p_tx = p_tx
+        self.wavelength = wavelength
+        self.beamWidth = beamWidth
+        self.pointingErr = pointingErr
+        self.sysLoss_tx = sysLoss_tx
+        self.aperture = aperture
+        self.sysLoss_rx = sysLoss_rx
+        self.NEP = NEP
+        self.bandwidth = bandwidth
+        self.sensitivity = sensitivity
+        self.uplink = uplink
+        self.Cn2 = Cn2
+        self.atmModel = atmModel
+
+        self.W_0 = olb.fwhm_to_radius(beamWidth, wavelength)
+        self.k = olb.angular_wave_number(wavelength)
+
+    def print_instance_attributes(self):
+        for attribute, value in self.__dict__.items():
+            print(attribute, '=', value)
+
+def get_zenith_tables(terminal, h_0, H, zenithMax, numZenith=721, numTransmittance=19):
+    """
+    Lookup tables over zenith angle of the turbulence and transmittance terms
+    of a terminal, for a ground station altitude and a satellite altitude
+
+    Parameters
+    ----------
+    terminal: ~opticalLink.OpticalTerminal
+        Optical terminals of the link
+    h_0: float
+        Ground station altitude (m)
+    H: float
+        Satellite altitude (m)
+    zenithMax: float
+        Largest zenith angle of the table (rad)
+    numZenith: int
+        Number of zenith angles of the scintillation tables
+    numTransmittance: int
+        Number of zenith angles of the transmittance table (LOWTRAN runs)
+
+    Returns
+    -------
+    tables: Dict
+        'zenith' (rad), 'sig2_x', 'sig2_y' (small and large scale scintillation),
+        'zenithT' (rad) and 'T' (atmospheric transmittance)
+    """
+    zenith = np.linspace(0, zenithMax, numZenith)
+    if terminal.uplink:
+        linkRange = olb.slant_range(h_0, H, zenith, olb.Re)
+        r = np.tan(terminal.pointingErr) * linkRange #Pointing offset at the satellite
+        sig2_x, sig2_y = olb.get_scintillation_uplink_untracked_xy(h_0, H, zenith, terminal.k,
+                                                                   terminal.W_0, terminal.Cn2, r)
+    else:
+        sig2_x, sig2_y = olb.get_scintillation_downlink_xy(h_0, H, zenith, terminal.k,
+                                                           terminal.W_0, terminal.Cn2)
+
+    zenithT = np.linspace(0, zenithMax, numTransmittance)
+    if terminal.atmModel is None:
+        T = np.ones(numTransmittance)
+    else:
+        T = np.array([olb.transmittance(z, terminal.wavelength, terminal.atmModel, h_0)[0, 0]
+                      for z in zenithT])
+
+    tables = {'zenith': zenith,
+              'sig2_x': np.broadcast_to(sig2_x, zenith.shape),
+              'sig2_y': np.broadcast_to(sig2_y, zenith.shape),
+              'zenithT': zenithT,
+              'T': T}
+    return tables
+
+def calc_optical_link(terminal, zenith, slantRange, tables):
+    """
+    Received power, scintillation, BER and outage probability of an optical
+    link at every sample. Turbulence and transmittance are interpolated from
+    the zenith tables (see get_zenith_tables), everything else is evaluated on
+    the sample arrays
+
+    Parameters
+    ----------
+    terminal: ~opticalLink.OpticalTerminal
+        Optical terminals of the link
+    zenith: ~np.array
+        Zenith angles (rad)
+    slantRange: ~np.array
+        Slant ranges (m)
+    tables: Dict
+        Output of get_zenith_tables
+
+    Returns
+    -------
+    link: Dict
+        'P_rx' (W) mean received power, 'sig2_x', 'sig2_y', 'scintIdx'
+        (scintillation index), 'BER' (None without NEP and bandwidth),
+        'outage' (probability of received power below terminal.sensitivity,
+        None without sensitivity)
+    """
+    #Scintillation grows like a power of sec(zenith), interpolated in log
+    sig2_x = np.exp(np.interp(zenith, tables['zenith'], np.log(tables['sig2_x'])))
+    sig2_y = np.exp(np.interp(zenith, tables['zenith'], np.log(tables['sig2_y'])))
+    T = np.interp(zenith, tables['zenithT'], tables['T'])
+
+    rangeLoss = olb.path_loss_gaussian(terminal.W_0, terminal.wavelength, slantRange,
+                                       terminal.aperture, terminal.pointingErr)
+    allLosses = rangeLoss - terminal.sysLoss_tx - terminal.sysLoss_rx
+    P_rx = terminal.p_tx * 10**(allLosses / 10) * T
+
+    #Gamma-gamma scintillation index
+    scintIdx = (1 + sig2_x) * (1 + sig2_y) - 1
+
+    #BER of the normalized intensity (I/P_rx), detector noise at the received power (Exemple 2.py)
+    BER = None
+    if terminal.NEP is not None and terminal.bandwidth is not None:
+        BER = olb.gamma_gamma_BER_NEP_fast(sig2_x, sig2_y, 1.0, terminal.NEP / P_rx, terminal.bandwidth)
+
+    outage = None
+    if terminal.sensitivity is not None:
+        outage = olb.gamma_gamma_distrib_cdf_fast(sig2_x, sig2_y, P_rx, terminal.sensitivity)
+
+    link = {'P_rx': P_rx,
+            'sig2_x': sig2_x,
+            'sig2_y': sig2_y,
+            'scintIdx': scintIdx,
+            'BER': BER,
+            'outage': outage}
+    return link
+
+def calc_optical_access(accessData, terminal, maxBER=None, maxOutage=None, zenithMax=None, verbose=False):
+    """
+    Optical link budget at every access sample of every pass of satellite/ground
+    location pairs (DataAccessSat.calc_access elevations and slant ranges)
+
+    Access samples of all pairs are gathered into flat arrays and evaluated in
+    one call per ground station altitude, with the turbulence and transmittance
+    tables built once at the median satellite altitude
+
+    Parameters
+    ----------
+    accessData: ~satbox.DataAccessConstellation or list of ~satbox.DataAccessSat
+        Access data (calc_access already run)
+    terminal: ~opticalLink.OpticalTerminal
+        Optical terminals of the link
+    maxBER: float
+        If given, a sample is available if its BER is below maxBER
+    maxOutage: float
+        If given, a sample is available if its outage probability is below maxOutage
+    zenithMax: float
+        Largest zenith angle of the tables (rad). Default is the largest access zenith
+    verbose: Boolean
+        Prints out progress if True
+
+    Returns
+    -------
+    linkData: Dict
+        Flat arrays over every access sample: 'satID', 'groundLocID', 'passIdx'
+        (global pass number), 'time' (~astropy.time.Time), 'elevation' (rad),
+        'slantRange' (m), calc_optical_link outputs, 'available' (if maxBER or
+        maxOutage is given)
+        'passAvailability' fraction of available samples of each pass
+        None if there are no access samples
+    """
+    assert maxBER is None or (terminal.NEP is not None and terminal.bandwidth is not None), ('maxBER '
+                                                   'needs a terminal with NEP and bandwidth')
+    assert maxOutage is None or terminal.sensitivity is not None, ('maxOutage '
+                                                   'needs a terminal with sensitivity')
+
+    if hasattr(accessData, 'allAccessData'):
+        accessData = accessData.allAccessData
+
+    #Gather access samples of every pair
+    cols = {'satID': [], 'groundLocID': [], 'passIdx': [], 'time': [],
+            'elevation': [], 'slantRange': [], 'h_0': []}
+    numPasses = 0
+    for data in accessData:
+        assert data.accessSlantRanges is not None, "run calc_access() first"
+        mask = np.asarray(data.accessMask, dtype=bool)
+        if not mask.any():
+            continue
+        rising = np.diff(np.concatenate(([False], mask)).astype(np.int8)) == 1
+        passIdx = numPasses + np.cumsum(rising) - 1
+        numPasses += rising.sum()
+
+        cols['satID'].append(np.full(mask.sum(), data.satID))
+        cols['groundLocID'].append(np.full(mask.sum(), data.groundLocID))
+        cols['passIdx'].append(passIdx[mask])
+        cols['time'].append(data.time[mask].utc.mjd)
+        cols['elevation'].append(data.accessElevations[mask].to_value(u.rad))
+        cols['slantRange'].append(data.accessSlantRanges[mask].to_value(u.m))
+        cols['h_0'].append(np.full(mask.sum(), data.groundLoc.h.to_value(u.m)))
+
+    if numPasses == 0:
+        if verbose:
+            print("No access samples")
+        return
+
+    linkData = {'satID': np.concatenate(cols['satID']),
+                'groundLocID': np.concatenate(cols['groundLocID']),
+                'passIdx': np.concatenate(cols['passIdx']),
+                'time': Time(np.concatenate(cols['time']), format='mjd', scale='utc')}
+    elevation = np.concatenate(cols['elevation'])
+    slantRange = np.concatenate(cols['slantRange'])
+    h_0 = np.concatenate(cols['h_0'])
+    zenith = np.pi / 2 - elevation
+    linkData['elevation'] = elevation
+    linkData['slantRange'] = slantRange
+
+    #Satellite altitude above the atmosphere reference from range and elevation
+    R_0 = olb.Re + h_0
+    H = np.sqrt(R_0**2 + slantRange**2 + 2 * R_0 * slantRange * np.sin(elevation)) - olb.Re
+
+    if zenithMax is None:
+        zenithMax = zenith.max()
+
+    keys = ['P_rx', 'sig2_x', 'sig2_y', 'scintIdx', 'BER', 'outage']
+    for key in keys:
+        linkData[key] = np.full(len(zenith), np.nan)
+    for h_0_gs in np.unique(h_0):
+        gsMask = h_0 == h_0_gs
+        tables = get_zenith_tables(terminal, h_0_gs, np.median(H[gsMask]), zenithMax)
+        link = calc_optical_link(terminal, zenith[gsMask], slantRange[gsMask], tables)
+        for key in keys:
+            if link[key] is not None:
+                linkData[key][gsMask] = link[key]
+        if verbose:
+            print(f"Ground station altitude {h_0_gs:.0f} m: {gsMask.sum()} samples")
+    if terminal.NEP is None or terminal.bandwidth is None:
+        linkData['BER'] = None
+    if terminal.sensitivity is None:
+        linkData['outage'] = None
+
+    #Availability per sample and per pass
+    if maxBER is not None or maxOutage is not None:
+        available = np.ones(len(zenith), dtype=bool)
+        if maxBER is not None:
+            available &= linkData['BER'] < maxBER
+        if maxOutage is not None:
+            available &= linkData['outage'] < maxOutage
+        linkData['available'] = available
+        linkData['passAvailability'] = (np.bincount(linkData['passIdx'], weights=available, minlength=numPasses)
+                                        / np.bincount(linkData['passIdx'], minlength=numPasses))
+    return linkData
@@ -1,8 +1,20 @@
+from functools import lru_cache
+
 import numpy as np
 import poliastro
 from poliastro import constants
 import astropy
 from astropy import units as u
+
+import orbitalMechanicsFast as fast #Unit-free SI versions of the functions below
+def _si(x, unit):
+    "Value of x in the given SI unit. Plain numbers are assumed to already be SI"
+    if isinstance(x, u.quantity.Quantity):
+        return x.to_value(unit)
+    return x
+
+MU_UNIT = u.m**3 / u.s**2
+
 ####################### Earth Environment #######################
 
 
@@ -78,28 +90,14 @@ def a_ecc_hohmann(a1, a2):
         Eccentricity of the Hohmann transfer orbit
     muPlanet: Gravitation parameter (Earth default)
     """
-    if not isinstance(a1, astropy.units.quantity.Quantity):
-       a1 = a1 * u.m
-    if not isinstance(a2, astropy.units.quantity.Quantity):
-       a2 = a2 * u.m
-
-    a = (a1 + a2)/2
-
-    #Find periapsis and apoapsis
-    if a1 > a2:
-        apoapsis = a1
-        periapsis = a2 
-    elif a1 < a2:
-        apoapsis = a2 
-        periapsis = a1
-    else:
+    a1 = _si(a1, u.m)
+    a2 = _si(a2, u.m)
+    if np.ndim(a1) == 0 and np.ndim(a2) == 0 and a1 == a2:
         print("Hohmann orbits must be different")
         return
 
-    eccNum = apoapsis - periapsis
-    eccDen = apoapsis + periapsis
-    ecc = eccNum / eccDen
-    return a, ecc
+    a, ecc = fast.a_ecc_hohmann(a1, a2)
+    return a * u.m, ecc * u.one
 
 def circ2elip_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
     """
@@ -109,12 +107,8 @@ def circ2elip_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
     a2: semi major axis of final orbit (m) 
     muPlanet: Gravitation parameter (Earth default)
     """
-    if not isinstance(a1, astropy.units.quantity.Quantity):
-       a1 = a1 * u.m
-    if not isinstance(a2, astropy.units.quantity.Quantity):
-       a2 = a2 * u.m
-    v1 = np.sqrt(muPlanet/a1) * (np.sqrt(2*a2/(a1 + a2)) - 1)
-    return np.abs(v1)
+    v1 = fast.circ2elip_Hohmann(_si(a1, u.m), _si(a2, u.m), _si(muPlanet, MU_UNIT))
+    return v1 * u.m / u.s
 
 
 def elip2circ_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
@@ -125,12 +119,8 @@ def elip2circ_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
     a2: radii of arrival of final circular orbit (Assuming Hohmann) (m)
     muPlanet: Gravitation parameter (Earth default)
     """
-    if not isinstance(a1, astropy.units.quantity.Quantity):
-       a1 = a1 * u.m
-    if not isinstance(a2, astropy.units.quantity.Quantity):
-       a2 = a2 * u.m
-    v2 = np.sqrt(muPlanet/a2) * (1 - np.sqrt(2*a1/(a1 + a2)))
-    return np.abs(v2)
+    v2 = fast.elip2circ_Hohmann(_si(a1, u.m), _si(a2, u.m), _si(muPlanet, MU_UNIT))
+    return v2 * u.m / u.s
 
 
 def delV_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
@@ -141,14 +131,8 @@ def delV_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
     a2: radii of arrival of final circular orbit (Assuming Hohmann) (m)
     muPlanet: Gravitation parameter (Earth default)
     """
-    if not isinstance(a1, astropy.units.quantity.Quantity):
-       a1 = a1 * u.m
-    if not isinstance(a2, astropy.units.quantity.Quantity):
-       a2 = a2 * u.m
-    v1 = circ2elip_Hohmann(a1, a2)
-    v2 = elip2circ_Hohmann(a1, a2)
-    delV = v1 + v2
-    return delV.decompose()
+    delV = fast.delV_Hohmann(_si(a1, u.m), _si(a2, u.m), _si(muPlanet, MU_UNIT))
+    return delV * u.m / u.s
 
 
 def t_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
@@ -159,12 +143,8 @@ def t_Hohmann(a1, a2, muPlanet=poliastro.constants.GM_earth):
     a2: semi major axis of desired circular orbit (m)
     muPlanet: Gravitation parameter (Earth default)
     """
-    if not isinstance(a1, astropy.units.quantity.Quantity):
-       a1 = a1 * u.m
-    if not isinstance(a2, astropy.units.quantity.Quantity):
-       a2 = a2 * u.m
-    t = np.pi * np.sqrt((a1 + a2)**3 / (8 * muPlanet))
-    return t
+    t = fast.t_Hohmann(_si(a1, u.m), _si(a2, u.m), _si(muPlanet, MU_UNIT))
+    return t * u.s
 
 
 def delV_HohmannPlaneChange(a1, a2, theta, muPlanet=poliastro.constants.GM_earth):
@@ -381,38 +361,17 @@ def coplanar_phase_different_orbs(v_i, a_int, a_tgt, mu=constants.GM_earth):
     assert isinstance(mu, astropy.units.quantity.Quantity), ('mu' 
                                          ' must be astropy.units.quantity.Quantity')
     
-    pi = np.pi
-    
-    w_tgt = np.sqrt(mu / a_tgt**3)
-    w_int = np.sqrt(mu / a_int**3)
-    
-    a_trans = (a_int + a_tgt)/2
-    
-    t_trans = pi * np.sqrt(a_trans**3 / mu)
-    
-    alpha = w_tgt * t_trans #lead angle
-    alpha = alpha % (2*pi) #modulo to ensure angle from 0 to 2pi
-    
-    v = alpha - pi
-
-    if w_tgt < w_int:
-        vDiff = v - v_i.to(u.rad).value
-    elif w_tgt > w_int:
-        vDiff = v_i.to(u.rad).value - v
-    else:
-        vDiff = 0
+    if np.ndim(a_int) == 0 and np.ndim(a_tgt) == 0 and a_int == a_tgt:
         print("In the same orbit")
-    k = 0
-    
-    t_wait = (vDiff + 2 * pi * k) / (abs(w_int - w_tgt))
-    while t_wait < 0:
-        k += 1
-        t_wait = (vDiff + 2 * pi * k) / (abs(w_int - w_tgt))
-    
-    delV1 = circ2elip_Hohmann(a_int, a_tgt)
-    delV2 = elip2circ_Hohmann(a_int, a_tgt)
 
-    delVTot =  delV1 + delV2
+    t_trans, delVTot, a_trans, t_wait = fast.coplanar_phase_different_orbs(v_i.to_value(u.rad),
+                                                                           a_int.to_value(u.m),
+                                                                           a_tgt.to_value(u.m),
+                                                                           mu.to_value(MU_UNIT))
+    t_trans = t_trans * u.s
+    delVTot = delVTot * u.m / u.s
+    a_trans = a_trans * u.m
+    t_wait = t_wait * u.s
     return t_trans.to(u.s), delVTot.to(u.km/u.s), a_trans.to(u.km), t_wait.to(u.min)
     
 ####################### Keplarian Orbital Mechanics #######################
@@ -468,10 +427,9 @@ def precRate_RAAN(a, e, i,J2=constants.J2_earth, rPlanet=constants.R_earth.to(u.
     move in opposite directions
 
     """
-    n = np.sqrt(muPlanet/a**3)
-    p = (a * (1 - e**2))
-    dRaan = -(3 * n * rPlanet**2 * J2 * np.cos(i)) / (2 * p**2)
-    return dRaan
+    dRaan = fast.precRate_RAAN(_si(a, u.m), _si(e, u.one), _si(i, u.rad),
+                               _si(J2, u.one), _si(rPlanet, u.m), _si(muPlanet, MU_UNIT))
+    return dRaan / u.s
 
 def delPrecRate_RAAN(a, e, w, i, J2=constants.J2_earth, rPlanet=constants.R_earth.to(u.m).value):
     """
@@ -536,10 +494,9 @@ def precRate_omega(a, e, i, J2=constants.J2_earth, rPlanet=constants.R_earth.to(
     delOmega: ~astropy.unit.Quantity
         precession rate of the argument of perigee in rad/s
     """
-    n = np.sqrt(muPlanet/a**3)
-    p = (a * (1 - e**2))
-    delOmega = -(3 * n * rPlanet**2 * J2 * np.cos(i)) / (2 * p**2)
-    return delOmega
+    delOmega = fast.precRate_omega(_si(a, u.m), _si(e, u.one), _si(i, u.rad),
+                                   _si(J2, u.one), _si(rPlanet, u.m), _si(muPlanet, MU_UNIT))
+    return delOmega / u.s
 
 def precRate_anom(a, e, i, J2=constants.J2_earth, rPlanet=constants.R_earth.to(u.m), muPlanet=poliastro.constants.GM_earth):
     """
@@ -565,10 +522,39 @@ def precRate_anom(a, e, i, J2=constants.J2_earth, rPlanet=constants.R_earth.to(u
     delAnom: ~astropy.unit.Quantity
         precession rate of the mean anomaly in rad/s
     """
-    n = np.sqrt(muPlanet/a**3)
-    p = (a * (1 - e**2))
-    delAnom = -(3 * n * rPlanet**2 * J2 * np.sqrt(1 - e**2) * (3 * np.sin(i)**2 - 2)) / (4 * p**2)
-    return delAnom
+    delAnom = fast.precRate_anom(_si(a, u.m), _si(e, u.one), _si(i, u.rad),
+                                 _si(J2, u.one), _si(rPlanet, u.m), _si(muPlanet, MU_UNIT))
+    return delAnom / u.s
+
+def precRate_argLat(a, e, i, J2=constants.J2_earth, rPlanet=constants.R_earth.to(u.m), muPlanet=poliastro.constants.GM_earth):
+    """
+    Calculates the secular rate of the argument of latitude (mean motion plus
+    the J2 drift of the argument of perigee and of the mean anomaly)
+    Vallado 4th ed 9-41
+
+    Parameters
+    ----------
+    a: ~astropy.unit.Quantity
+        semi-major axis of the orbit
+    e: float
+        eccentricity of the orbit
+    i: ~astropy.unit.Quantity
+        inclination of the orbit
+    J2: float
+        second dynamic form factor of body. Default poliastro constant for earth
+    rPlanet: ~astropy.unit.Quantity
+        body's equatorial radius. Default poliastro constant for earth
+    muPlanet: ~astropy.unit.Quantity
+        body's gravitational constant. Default poliastro constant for earth
+
+    Returns
+    -------
+    argLatDot: ~astropy.unit.Quantity
+        rate of the argument of latitude in rad/s
+    """
+    argLatDot = fast.precRate_argLat(_si(a, u.m), _si(e, u.one), _si(i, u.rad),
+                                     _si(J2, u.one), _si(rPlanet, u.m), _si(muPlanet, MU_UNIT))
+    return argLatDot * u.rad / u.s
 
 def orbitalPeriod_fromAlt(alt, rPlanet=constants.R_earth, muPlanet=poliastro.constants.GM_earth):
     """
@@ -606,10 +592,8 @@ def circVel_fromRad(r, muPlanet=poliastro.constants.GM_earth):
     Inputs (orbit radius, Gravitation parameter of planet-Earth is default)
     alt unit is in meters
     """
-    if not isinstance(r, u.quantity.Quantity):
-        r = r * u.m
-    v = np.sqrt(muPlanet/r)
-    return v
+    v = fast.circVel_fromRad(_si(r, u.m), _si(muPlanet, MU_UNIT))
+    return v * u.m / u.s
 
 
 def orbitalPeriod_fromA(a, muPlanet=poliastro.constants.GM_earth):
@@ -623,10 +607,8 @@ def orbitalPeriod_fromA(a, muPlanet=poliastro.constants.GM_earth):
     Output
     t : Orbital period
     """
-    if not isinstance(a, u.quantity.Quantity):
-        a = a * u.m
-    t = 2*np.pi*np.sqrt(a**3/muPlanet)
-    return t
+    t = fast.orbitalPeriod_fromA(_si(a, u.m), _si(muPlanet, MU_UNIT))
+    return t * u.s
 
 
 def vis_viva(r, a, muPlanet=poliastro.constants.GM_earth.value):
@@ -711,7 +693,8 @@ def getSSOA_fromEI(e, i, dRAAN = 1.991063853e-7, re = constants.R_earth.to(u.m).
 def getRGTOrbit(k_r, k_d, e, i, detectThresh=10, maxIters=100):
     """
     Gets Repeat Ground Track (RGT) orbit semi-major axis for a specified eccentricity, inclination,
-    and repeat track parameters.
+    and repeat track parameters. Results are memoized (bounded LRU) since the same
+    RGT is requested for every satellite with the same inclination
 
     Inputs
     k_r (integer): Number of revolutions until repeat ground track
@@ -730,36 +713,85 @@ def getRGTOrbit(k_r, k_d, e, i, detectThresh=10, maxIters=100):
         i_astro = i * u.rad
         i_clean = i_astro.to(u.rad).value
     else:
-        i_clean = i
-
-    # Constants
-    periodEarth = poliastro.constants.rotational_period_earth
-    w_earth = 2 * np.pi / periodEarth.to(u.s).value
-    mu = poliastro.constants.GM_earth.value
-    j2 = poliastro.constants.J2_earth.value
-    r_earth = poliastro.constants.R_earth.to(u.m).value
-    
-    k_revPerDay = k_r / k_d
-    n = k_revPerDay * w_earth
-    a_new = (mu * (1/n)**2)**(1/3)
-    delLam = 2 * np.pi * k_d / k_r #Change in successive node arrivals (radians)
-    for idx in range(maxIters):
-        a = a_new
-        p = a * (1 - e**2)
-        OmegaDot = - 3 * n * j2 * np.cos(i_clean) / 2 * (r_earth / p)**2 #Change in RAAN due to perturbations
-        delLamPeriod = 2 * np.pi * OmegaDot / n #Change in lambda by period
-        delLon = delLam + delLamPeriod
-        n = 2 * np.pi * w_earth / delLon
-        a_new = (mu * (1/n)**2)**(1/3)
-        diff = np.abs(a - a_new)
-        if diff < detectThresh:
-            break
-    alt = a_new - r_earth #altitude
+        i_clean = i.to(u.rad).value
+
+    a_new, alt = _getRGTOrbit_si(int(k_r), int(k_d), float(e), float(i_clean), detectThresh, maxIters)
 
     alt_out = alt * u.m
     a_new_out = a_new * u.m
     return a_new_out, alt_out
 
+def getRGTOrbits(k_r, k_d, e, i, detectThresh=10, maxIters=100):
+    """
+    Vectorized getRGTOrbit: solves all combinations of arrays of k_r, k_d, e and i
+    (broadcast together) in one fixed point iteration
+
+    Inputs
+    k_r (integer array): Number of revolutions until repeat ground track
+    k_d (integer array): Number of days to to repeat ground track
+    e : eccentricity
+    i (radians) : inclination
+    detectThresh (m) : Difference between current and previous semi-major axis guess that will stop search loop
+    maxIters (integer) : Maximum number of iterations before loop ends if no solution is found
+
+    Outputs
+    a_new (m) : semi-major axes of RGT
+    alt (m) : altitudes of RGT
+    """
+    a_new, alt = fast.getRGTOrbit(k_r, k_d, _si(e, u.one), _si(i, u.rad), _si(detectThresh, u.m), maxIters)
+    return a_new * u.m, alt * u.m
+
+def getRGTOrbit_table(k_r, k_d, e, i, numInc=1801, newtonIters=1):
+    """
+    Gets RGT semi-major axes for many inclinations from a cached table over a dense
+    inclination grid (built once per k_r, k_d, e), interpolated and polished with
+    Newton steps. Accurate to well under a meter with the defaults
+
+    Inputs
+    k_r (integer): Number of revolutions until repeat ground track
+    k_d (integer): Number of days to to repeat ground track
+    e : eccentricity
+    i (radians) : inclinations
+    numInc (integer) : Number of inclinations in the table (0 to 180 deg)
+    newtonIters (integer) : Newton steps after interpolation
+
+    Outputs
+    a_new (m) : semi-major axes of RGT
+    alt (m) : altitudes of RGT
+    """
+    a_new, alt = fast.getRGTOrbit_table(k_r, k_d, _si(e, u.one), _si(i, u.rad), numInc, newtonIters)
+    return a_new * u.m, alt * u.m
+
+def getRGTCandidates(e, i, kdMax=3, altMin=300*u.km, altMax=1200*u.km):
+    """
+    Gets every RGT orbit repeating within kdMax days (k_r, k_d coprime) with an
+    altitude between altMin and altMax, solved in a single array call
+
+    Inputs
+    e : eccentricity
+    i (radians) : inclination
+    kdMax (integer) : Largest number of days to repeat ground track
+    altMin (m) : Lowest altitude
+    altMax (m) : Highest altitude
+
+    Outputs
+    candidates (dict) : k_r, k_d, a (m) and alt (m) arrays sorted by altitude
+    """
+    k_r, k_d, a, alt = fast.getRGTCandidates(_si(e, u.one), _si(i, u.rad), kdMax,
+                                             _si(altMin, u.m), _si(altMax, u.m))
+    candidates = {
+        'k_r': k_r,
+        'k_d': k_d,
+        'a': a * u.m,
+        'alt': alt * u.m
+    }
+    return candidates
+
+@lru_cache(maxsize=256)
+def _getRGTOrbit_si(k_r, k_d, e, i_clean, detectThresh, maxIters):
+    "Fixed point iteration of getRGTOrbit on floats (SI units)"
+    return fast.getRGTOrbit(k_r, k_d, e, i_clean, detectThresh, maxIters)
+
 # Nodal period of satellite
 def get_nodal_period(a, i, J2=constants.J2_earth, Re=constants.R_earth, mu=constants.GM_earth):
     """
@@ -781,14 +813,8 @@ def get_nodal_period(a, i, J2=constants.J2_earth, Re=constants.R_earth, mu=const
         Nodal period of satellite
     """
     
-    n = np.sqrt(mu / a**3)
-    
-    term1 = 2 * np.pi / n
-    
-    term2 = 1 - 3 / 2 * J2 * (Re / a)**2 * (4 * np.cos(i)**2 - 1)
-    
-    Pn = term1 * term2
-    return Pn
+    Pn = fast.get_nodal_period(_si(a, u.m), _si(i, u.rad), _si(J2, u.one), _si(Re, u.m), _si(mu, MU_UNIT))
+    return Pn * u.s
 
 def nodal_period_displacement(pn0, aRGT, eRGT, iRGT, aSat):
     """
@@ -815,17 +841,9 @@ def nodal_period_displacement(pn0, aRGT, eRGT, iRGT, aSat):
         ground track displacement per nodal period (radians)
     """
     
-    # Get earth rotation rate
-    siderealDaySec = 86164.0905 * u.s #Sidereal day in seconds
-    we = (2*np.pi)/siderealDaySec #Rotation rate of the earth
-    
-    deltaA = abs(aSat - aRGT)
-    
-    omegaDot = precRate_RAAN(aRGT, eRGT, iRGT)
-    
-    deltaL = 3/2 * pn0 * (we - omegaDot) * deltaA / aRGT
-    
-    return deltaL
+    deltaL = fast.nodal_period_displacement(_si(pn0, u.s), _si(aRGT, u.m), _si(eRGT, u.one),
+                                            _si(iRGT, u.rad), _si(aSat, u.m))
+    return deltaL * u.one
 
 ####################### Eclipse Calculation #######################
 
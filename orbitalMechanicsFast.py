@@ -0,0 +1,215 @@
+##Unit-free orbital mechanics on float64 SI values (available as orbitalMechanics.fast)
+##All inputs and outputs are plain floats or numpy arrays (broadcast like ufuncs):
+##m, s, rad, m/s, m^3/s^2
+
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from poliastro import constants
+
+MU_EARTH = constants.GM_earth.to_value('m3 / s2') #Gravitational parameter (m^3/s^2)
+R_EARTH = constants.R_earth.to_value('m') #Equatorial radius (m)
+J2_EARTH = float(constants.J2_earth.value) #Second dynamic form factor
+W_EARTH = 2 * np.pi / constants.rotational_period_earth.to_value('s') #Earth rotation rate (rad/s)
+W_EARTH_SIDEREAL = 2 * np.pi / 86164.0905 #Rotation rate from the sidereal day (rad/s)
+
+
+def a_ecc_hohmann(a1, a2):
+    """
+    Semi-major axis (m) and eccentricity of the Hohmann transfer orbit between
+    circular orbits of radii a1 and a2 (m)
+    """
+    a1 = np.asarray(a1, dtype=float)
+    a2 = np.asarray(a2, dtype=float)
+    a = (a1 + a2) / 2
+    ecc = np.abs(a2 - a1) / (a1 + a2)
+    return a, ecc
+
+def circ2elip_Hohmann(a1, a2, muPlanet=MU_EARTH):
+    "Delta V (m/s) to go from circular orbit a1 (m) into the Hohmann ellipse to a2 (m)"
+    return np.abs(np.sqrt(muPlanet / a1) * (np.sqrt(2 * a2 / (a1 + a2)) - 1))
+
+def elip2circ_Hohmann(a1, a2, muPlanet=MU_EARTH):
+    "Delta V (m/s) to circularize at a2 (m) at the end of a Hohmann transfer from a1 (m)"
+    return np.abs(np.sqrt(muPlanet / a2) * (1 - np.sqrt(2 * a1 / (a1 + a2))))
+
+def delV_Hohmann(a1, a2, muPlanet=MU_EARTH):
+    "Total delta V (m/s) of a Hohmann transfer between circular orbits a1 and a2 (m)"
+    return circ2elip_Hohmann(a1, a2, muPlanet) + elip2circ_Hohmann(a1, a2, muPlanet)
+
+def t_Hohmann(a1, a2, muPlanet=MU_EARTH):
+    "Time (s) of a Hohmann transfer between circular orbits a1 and a2 (m)"
+    return np.pi * np.sqrt((a1 + a2)**3 / (8 * muPlanet))
+
+def orbitalPeriod_fromA(a, muPlanet=MU_EARTH):
+    "Orbital period (s) from the semi-major axis (m)"
+    return 2 * np.pi * np.sqrt(a**3 / muPlanet)
+
+def circVel_fromRad(r, muPlanet=MU_EARTH):
+    "Circular velocity (m/s) at orbit radius r (m)"
+    return np.sqrt(muPlanet / r)
+
+def coplanar_phase_different_orbs(v_i, a_int, a_tgt, mu=MU_EARTH):
+    """
+    Phasing between circular coplanar orbits (Vallado 4th ed Algorithm 45) on arrays.
+    v_i (rad) phase of the chaser ahead of the target, a_int and a_tgt (m).
+    Returns t_trans (s), delVTot (m/s), a_trans (m), t_wait (s).
+    t_wait is nan when both orbits are the same
+    """
+    v_i, a_int, a_tgt = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (v_i, a_int, a_tgt)])
+    w_tgt = np.sqrt(mu / a_tgt**3)
+    w_int = np.sqrt(mu / a_int**3)
+
+    a_trans = (a_int + a_tgt) / 2
+    t_trans = np.pi * np.sqrt(a_trans**3 / mu)
+
+    alpha = (w_tgt * t_trans) % (2 * np.pi) #lead angle
+    v = alpha - np.pi
+    vDiff = np.where(w_tgt < w_int, v - v_i, v_i - v)
+
+    #Smallest number of extra revolutions k >= 0 making the wait positive
+    k = np.maximum(0, np.ceil(-vDiff / (2 * np.pi)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_wait = np.where(w_int == w_tgt, np.nan, (vDiff + 2 * np.pi * k) / np.abs(w_int - w_tgt))
+
+    delVTot = delV_Hohmann(a_int, a_tgt, mu)
+    return t_trans, delVTot, a_trans, t_wait
+
+def precRate_RAAN(a, e, i, J2=J2_EARTH, rPlanet=R_EARTH, muPlanet=MU_EARTH):
+    "J2 precession rate of the RAAN (rad/s). a (m), i (rad)"
+    n = np.sqrt(muPlanet / a**3)
+    p = a * (1 - e**2)
+    return -(3 * n * rPlanet**2 * J2 * np.cos(i)) / (2 * p**2)
+
+def precRate_omega(a, e, i, J2=J2_EARTH, rPlanet=R_EARTH, muPlanet=MU_EARTH):
+    """
+    J2 precession rate of the argument of perigee (rad/s). a (m), i (rad)
+    (same expression as orbitalMechanics.precRate_omega)
+    """
+    n = np.sqrt(muPlanet / a**3)
+    p = a * (1 - e**2)
+    return -(3 * n * rPlanet**2 * J2 * np.cos(i)) / (2 * p**2)
+
+def precRate_anom(a, e, i, J2=J2_EARTH, rPlanet=R_EARTH, muPlanet=MU_EARTH):
+    "J2 precession rate of the mean anomaly (rad/s). a (m), i (rad)"
+    n = np.sqrt(muPlanet / a**3)
+    p = a * (1 - e**2)
+    return -(3 * n * rPlanet**2 * J2 * np.sqrt(1 - e**2) * (3 * np.sin(i)**2 - 2)) / (4 * p**2)
+
+def precRate_argLat(a, e, i, J2=J2_EARTH, rPlanet=R_EARTH, muPlanet=MU_EARTH):
+    "Secular rate of the argument of latitude with J2 (rad/s). a (m), i (rad). Vallado 4th ed 9-41"
+    n = np.sqrt(muPlanet / a**3)
+    p = a * (1 - e**2)
+    fac = 3 / 4 * n * J2 * (rPlanet / p)**2
+    argpDot = fac * (5 * np.cos(i)**2 - 1)
+    anomDot = fac * np.sqrt(1 - e**2) * (3 * np.cos(i)**2 - 1)
+    return n + argpDot + anomDot
+
+def get_nodal_period(a, i, J2=J2_EARTH, Re=R_EARTH, mu=MU_EARTH):
+    "Nodal period (s). a (m), i (rad). Vallado 4th ed 11-24"
+    n = np.sqrt(mu / a**3)
+    return 2 * np.pi / n * (1 - 3 / 2 * J2 * (Re / a)**2 * (4 * np.cos(i)**2 - 1))
+
+def nodal_period_displacement(pn0, aRGT, eRGT, iRGT, aSat):
+    """
+    Ground track displacement per nodal period (rad) of a satellite at aSat (m)
+    relative to an RGT orbit with nodal period pn0 (s), aRGT (m), eRGT, iRGT (rad).
+    Aorpimai eqn 20
+    """
+    deltaA = np.abs(aSat - aRGT)
+    omegaDot = precRate_RAAN(aRGT, eRGT, iRGT)
+    return 3 / 2 * pn0 * (W_EARTH_SIDEREAL - omegaDot) * deltaA / aRGT
+
+def getRGTOrbit(k_r, k_d, e, i, detectThresh=10, maxIters=100):
+    """
+    Repeat ground track semi-major axis and altitude (m) by fixed point iteration,
+    for arrays of k_r (revolutions), k_d (days), e and i (rad). Each element stops
+    updating once its change is below detectThresh (m)
+    """
+    k_r, k_d, e, i = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (k_r, k_d, e, i)])
+
+    n = k_r / k_d * W_EARTH
+    a_new = (MU_EARTH / n**2)**(1/3)
+    delLam = 2 * np.pi * k_d / k_r #Change in successive node arrivals (radians)
+    done = np.zeros(a_new.shape, dtype=bool)
+    for idx in range(maxIters):
+        a = a_new
+        p = a * (1 - e**2)
+        OmegaDot = - 3 * n * J2_EARTH * np.cos(i) / 2 * (R_EARTH / p)**2 #Change in RAAN due to perturbations
+        delLon = delLam + 2 * np.pi * OmegaDot / n
+        nNext = 2 * np.pi * W_EARTH / delLon
+        aNext = (MU_EARTH / nNext**2)**(1/3)
+        #Converged elements keep their value
+        a_new = np.where(done, a, aNext)
+        n = np.where(done, n, nNext)
+        done |= np.abs(a - aNext) < detectThresh
+        if done.all():
+            break
+    alt = a_new - R_EARTH
+    if a_new.ndim == 0:
+        return float(a_new), float(alt)
+    return a_new, alt
+
+def rgt_newton_polish(a, k_r, k_d, e, i, iters=1):
+    """
+    Newton steps on the repeat ground track condition a = g(a) solved by
+    getRGTOrbit, where g(a) = (mu (delLon(a) / (2 pi we))^2)^(1/3) and
+    delLon(a) = 2 pi k_d / k_r - 3 pi J2 cos(i) (Re / (a (1 - e^2)))^2.
+    Converges quadratically from a close guess (ex: getRGTOrbit_table)
+    """
+    c = 3 * np.pi * J2_EARTH * R_EARTH**2 * np.cos(i) / (1 - np.asarray(e, dtype=float)**2)**2
+    delLam = 2 * np.pi * np.asarray(k_d, dtype=float) / k_r
+    for idx in range(iters):
+        delLon = delLam - c / a**2
+        g = (MU_EARTH * (delLon / (2 * np.pi * W_EARTH))**2)**(1/3)
+        dg = 2 / 3 * g / delLon * (2 * c / a**3)
+        a = a - (a - g) / (1 - dg)
+    return a
+
+@lru_cache(maxsize=64)
+def _rgt_table(k_r, k_d, e, numInc):
+    "RGT semi-major axes (m) on an inclination grid from 0 to pi (rad)"
+    incGrid = np.linspace(0, np.pi, numInc)
+    aGrid, _ = getRGTOrbit(k_r, k_d, e, incGrid, detectThresh=1e-6)
+    incGrid.setflags(write=False)
+    aGrid.setflags(write=False)
+    return incGrid, aGrid
+
+def getRGTOrbit_table(k_r, k_d, e, i, numInc=1801, newtonIters=1):
+    """
+    Repeat ground track semi-major axis and altitude (m) for an array of
+    inclinations i (rad), interpolated from a cached table over a dense
+    inclination grid (one per k_r, k_d, e) and refined with Newton steps
+    (see rgt_newton_polish)
+    """
+    incGrid, aGrid = _rgt_table(int(k_r), int(k_d), float(e), int(numInc))
+    a = np.interp(i, incGrid, aGrid)
+    a = rgt_newton_polish(a, k_r, k_d, e, i, iters=newtonIters)
+    if np.ndim(a) == 0:
+        return float(a), float(a - R_EARTH)
+    return a, a - R_EARTH
+
+def getRGTCandidates(e, i, kdMax=3, altMin=300e3, altMax=1200e3):
+    """
+    All repeat ground track orbits with k_d <= kdMax days (k_r and k_d
+    coprime) whose altitude is between altMin and altMax (m), solved in a
+    single array call of getRGTOrbit. Sorted by altitude
+
+    Returns k_r, k_d, a (m), alt (m) arrays
+    """
+    #Revolutions per day bracketing the altitude range (Keplerian, J2 shifts are small)
+    revsLow = np.sqrt(MU_EARTH / (R_EARTH + altMax)**3) / W_EARTH * 0.95
+    revsHigh = np.sqrt(MU_EARTH / (R_EARTH + altMin)**3) / W_EARTH * 1.05
+    pairs = [(k_r, k_d) for k_d in range(1, kdMax + 1)
+             for k_r in range(int(np.floor(revsLow * k_d)), int(np.ceil(revsHigh * k_d)) + 1)
+             if k_r > 0 and gcd(k_r, k_d) == 1]
+    k_r = np.array([pair[0] for pair in pairs], dtype=int)
+    k_d = np.array([pair[1] for pair in pairs], dtype=int)
+
+    a, alt = getRGTOrbit(k_r, k_d, e, i)
+    a = np.atleast_1d(a)
+    alt = np.atleast_1d(alt)
+    keep = (alt >= altMin) & (alt <= altMax)
+    order = np.argsort(alt[keep])
+    return k_r[keep][order], k_d[keep][order], a[keep][order], alt[keep][order]
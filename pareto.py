@@ -0,0 +1,165 @@
+##Pareto (skyline) functions for trade space results
+
+import numpy as np
+
+
+def _oriented_points(points, maximize):
+    """
+    Float copy of points with maximized objectives negated so every objective is minimized
+
+    Parameters
+    ----------
+    points: ~np.array
+        (n, k) array of objective values
+    maximize: bool or list of bool
+        Objectives to maximize. A single bool applies to all objectives
+
+    Returns
+    -------
+    pts: ~np.array
+        (n, k) array where every objective is minimized
+    """
+    pts = np.array(points, dtype=float, copy=True)
+    if pts.ndim == 1:
+        pts = pts[:, np.newaxis]
+    assert pts.ndim == 2, "points must be a (n, k) array"
+    if maximize is None:
+        return pts
+    maximize = np.broadcast_to(np.asarray(maximize, dtype=bool), (pts.shape[1],))
+    pts[:, maximize] *= -1
+    return pts
+
+def _unique_rows(pts):
+    """
+    Unique rows of pts and the index of each row's unique row
+
+    Parameters
+    ----------
+    pts: ~np.array
+        (n, k) array
+
+    Returns
+    -------
+    uniquePts: ~np.array
+        (m, k) array of unique rows sorted lexicographically (first column first)
+    inverse: ~np.array
+        (n,) index into uniquePts of every row of pts
+    """
+    uniquePts, inverse = np.unique(pts, axis=0, return_inverse=True)
+    return uniquePts, inverse.reshape(-1)
+
+def _front_mask_2d(uniquePts):
+    """
+    Non-dominated mask of lexicographically sorted unique 2 objective points (minimized)
+
+    With unique points sorted by the first then the second objective, a point
+    is dominated only by an earlier point, which it is if any earlier second
+    objective is lower or equal
+    """
+    y = uniquePts[:, 1]
+    prevMin = np.minimum.accumulate(np.concatenate(([np.inf], y[:-1])))
+    return y < prevMin
+
+def _front_mask_kd(uniquePts, blockSize=256):
+    """
+    Non-dominated mask of lexicographically sorted unique k objective points (minimized)
+
+    Sort-filter-skyline: lexicographic order guarantees a point is only
+    dominated by earlier points, so candidates are compared in blocks against
+    the front found so far and against the earlier points of their own block
+    """
+    n = uniquePts.shape[0]
+    mask = np.zeros(n, dtype=bool)
+    front = uniquePts[:0]
+    for start in range(0, n, blockSize):
+        block = uniquePts[start:start + blockSize]
+
+        #Dominated by the front found so far (points are unique so <= everywhere is domination)
+        if len(front):
+            dominated = np.zeros(len(block), dtype=bool)
+            for frontStart in range(0, len(front), blockSize):
+                frontBlock = front[frontStart:frontStart + blockSize]
+                dominated |= np.any(np.all(frontBlock[:, np.newaxis, :] <= block[np.newaxis, :, :], axis=2), axis=0)
+        else:
+            dominated = np.zeros(len(block), dtype=bool)
+
+        #Dominated by an earlier point of the block (only the remaining candidates are compared)
+        candIdx = np.flatnonzero(~dominated)
+        cand = block[candIdx]
+        lessEq = np.all(cand[:, np.newaxis, :] <= cand[np.newaxis, :, :], axis=2) #[j, i]: j dominates i
+        dominated[candIdx[np.any(np.triu(lessEq, k=1), axis=0)]] = True
+
+        mask[start:start + len(block)] = ~dominated
+        front = np.concatenate((front, block[~dominated]))
+    return mask
+
+def pareto_indices(points, maximize=False, unique=False):
+    """
+    Gets the indices of the non-dominated (Pareto efficient) points
+
+    2 objectives are solved in O(n log n) with a sort and a running minimum.
+    More objectives use a block vectorized sort-filter-skyline
+
+    Parameters
+    ----------
+    points: ~np.array
+        (n, k) array of objective values, one row per candidate
+        (ex: time to pass, delta V, cost)
+    maximize: bool or list of bool
+        Objectives to maximize instead of minimize. A single bool applies to
+        all objectives
+    unique: bool
+        If True, only the first index of duplicated points is returned.
+        Otherwise every copy of a non-dominated point is returned
+
+    Returns
+    -------
+    idx: ~np.array
+        Indices into points of the non-dominated points, sorted by the first
+        objective (then the next ones, in the maximize/minimize sense), ties by index
+    """
+    pts = _oriented_points(points, maximize)
+    n, k = pts.shape
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    assert not np.isnan(pts).any(), "points can't contain NaN"
+
+    uniquePts, inverse = _unique_rows(pts)
+    if k == 1:
+        uniqueMask = np.zeros(len(uniquePts), dtype=bool)
+        uniqueMask[0] = True
+    elif k == 2:
+        uniqueMask = _front_mask_2d(uniquePts)
+    else:
+        uniqueMask = _front_mask_kd(uniquePts)
+
+    mask = uniqueMask[inverse]
+    if unique: #Keep first copy of each unique point
+        firstIdx = np.full(len(uniquePts), n, dtype=int)
+        np.minimum.at(firstIdx, inverse, np.arange(n))
+        mask &= firstIdx[inverse] == np.arange(n)
+
+    idx = np.flatnonzero(mask)
+    order = np.lexsort((idx,) + tuple(pts[idx, col] for col in reversed(range(k))))
+    return idx[order]
+
+def pareto_mask(points, maximize=False):
+    """
+    Boolean mask of the non-dominated points (see pareto_indices)
+
+    Parameters
+    ----------
+    points: ~np.array
+        (n, k) array of objective values
+    maximize: bool or list of bool
+        Objectives to maximize instead of minimize
+
+    Returns
+    -------
+    mask: ~np.array
+        (n,) True for non-dominated points
+    """
+    pts = np.asarray(points)
+    mask = np.zeros(pts.shape[0], dtype=bool)
+    mask[pareto_indices(pts, maximize=maximize)] = True
+    return mask
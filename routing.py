@@ -0,0 +1,1132 @@
+##Routing functions for delay tolerant networks (DTN)
+
+import heapq
+
+import numpy as np
+import astropy.units as u
+from astropy.time import Time, TimeDelta
+
+
+def get_mask_runs(mask):
+    """
+    Gets the start and stop indices of every run of True values in a boolean mask
+
+    Parameters
+    ----------
+    mask: ~np.array
+        Array of booleans
+
+    Returns
+    -------
+    startIdx: ~np.array
+        Index of the first True sample of each run
+    stopIdx: ~np.array
+        Index of the last True sample of each run (inclusive)
+    """
+    maskInt = np.asarray(mask, dtype=np.int8)
+    padded = np.concatenate(([0], maskInt, [0]))
+    edges = np.diff(padded)
+    startIdx = np.flatnonzero(edges == 1)
+    stopIdx = np.flatnonzero(edges == -1) - 1
+    return startIdx, stopIdx
+
+def time_to_seconds(times, refTime):
+    """
+    Converts astropy times to float seconds measured from a reference time
+
+    Parameters
+    ----------
+    times: ~astropy.time.Time
+        Times to convert (scalar or array)
+    refTime: ~astropy.time.Time
+        Reference time (zero of the float time axis)
+
+    Returns
+    -------
+    seconds: ~np.array or float
+        Seconds from refTime
+    """
+    return np.asarray((times - refTime).sec, dtype=float)
+
+def seconds_to_time(seconds, refTime):
+    """
+    Converts float seconds measured from a reference time back into astropy times
+
+    Parameters
+    ----------
+    seconds: ~np.array or float
+        Seconds from refTime
+    refTime: ~astropy.time.Time
+        Reference time (zero of the float time axis)
+
+    Returns
+    -------
+    times: ~astropy.time.Time
+        Absolute times in the scale of refTime
+    """
+    return refTime + TimeDelta(np.asarray(seconds, dtype=float) * u.s)
+
+#ContactGraph arrays that are put in shared memory for worker processes
+_SHARED_ARRAYS = ('indptr', 'indices', 'windowPtr', 'windowStarts', 'windowStops',
+                  'edgeLastContact', 'sampleTimes', 'edgeSamplePtr')
+
+class ContactGraph(object):
+    def __init__(self, contacts, nodes, refTime=None):
+        """
+        Adjacency index of a time varying graph, built once from the contact
+        masks. Nodes get integer IDs, neighbors are stored as compressed sparse
+        rows (CSR) and each edge stores the start/stop times of its contact
+        windows as float seconds, so neighbor queries are O(degree) and the
+        next contact on an edge is found with a binary search.
+
+        Parameters
+        ----------
+        contacts: ~dict
+            Dictionary with keys 'contacts' and 'time' (same format as the
+            input to utils.TimeVaryingGraph)
+            -----
+            'contacts' is a dictionary of boolean arrays of when contacts are
+            available between nodes. Node keys are of the form 'i-j'
+            -----
+            'time' is a dictionary of astropy times associated with each pair
+            of nodes
+            -----
+        nodes: ~list
+            List of node IDs that can be used in routing. Edges to other
+            nodes are dropped
+        refTime: ~astropy.time.Time
+            Zero of the float time axis. Defaults to first contact time
+
+        Attributes
+        ----------
+        nodes: ~list
+            Node IDs (strings). Position in the list is the integer node ID
+        nodeIndex: ~dict
+            Maps node ID string to integer node ID
+        indptr: ~np.array
+            CSR row pointer. Edges leaving node i are indptr[i]:indptr[i+1]
+        indices: ~np.array
+            Integer node ID of the destination of each edge
+        edgeKeys: ~list
+            'i-j' contact key of each edge
+        windowPtr: ~np.array
+            Windows of edge e are windowPtr[e]:windowPtr[e+1]
+        windowStarts, windowStops: ~np.array
+            Time of first/last contact sample of each window (seconds from refTime)
+        edgeTimes: ~list
+            Sample times of each edge (seconds from refTime). Views into
+            sampleTimes, edge e uses sampleTimes[edgeSamplePtr[e,0]:edgeSamplePtr[e,1]]
+        """
+        contactMasks = contacts.get('contacts')
+        contactTimes = contacts.get('time')
+
+        self.nodes = [str(n) for n in nodes]
+        self.nodeIndex = {node: idx for idx, node in enumerate(self.nodes)}
+
+        if refTime is None:
+            firstKey = next(iter(contactTimes))
+            refTime = contactTimes[firstKey][0]
+        self.refTime = refTime
+
+        #Collect edges by source node
+        rows = [[] for _ in self.nodes]
+        secondsCache = {} #Edges usually share the same time array
+        timeArrays = []
+        for key, mask in contactMasks.items():
+            source, destination = key.split('-')
+            if source not in self.nodeIndex or destination not in self.nodeIndex:
+                continue
+            mask = np.asarray(mask, dtype=bool)
+            if not mask.any():
+                continue
+
+            times = contactTimes.get(key)
+            timesID = id(times)
+            if timesID not in secondsCache:
+                secondsCache[timesID] = len(timeArrays)
+                timeArrays.append(time_to_seconds(times, refTime))
+            timesNum = secondsCache[timesID]
+            timesSec = timeArrays[timesNum]
+
+            startIdx, stopIdx = get_mask_runs(mask)
+            rows[self.nodeIndex[source]].append((self.nodeIndex[destination], key,
+                                                 timesSec[startIdx], timesSec[stopIdx], timesNum))
+
+        #Flatten to CSR
+        degrees = [len(row) for row in rows]
+        self.indptr = np.concatenate(([0], np.cumsum(degrees))).astype(np.int64)
+        edges = [edge for row in rows for edge in row]
+        self.indices = np.array([e[0] for e in edges], dtype=np.int64)
+        self.edgeKeys = [e[1] for e in edges]
+        self.edgeIndex = {key: idx for idx, key in enumerate(self.edgeKeys)}
+        windowCounts = [len(e[2]) for e in edges]
+        self.windowPtr = np.concatenate(([0], np.cumsum(windowCounts))).astype(np.int64)
+        if edges:
+            self.windowStarts = np.concatenate([e[2] for e in edges])
+            self.windowStops = np.concatenate([e[3] for e in edges])
+        else:
+            self.windowStarts = np.array([])
+            self.windowStops = np.array([])
+
+        #Sample times stored once per distinct time array
+        timesPtr = np.concatenate(([0], np.cumsum([len(t) for t in timeArrays]))).astype(np.int64)
+        self.sampleTimes = np.concatenate(timeArrays) if timeArrays else np.array([])
+        self.edgeSamplePtr = np.array([[timesPtr[e[4]], timesPtr[e[4] + 1]] for e in edges],
+                                      dtype=np.int64).reshape(-1, 2)
+
+        #Last contact sample of each edge, used to drop edges with no future contacts
+        self.edgeLastContact = self.windowStops[self.windowPtr[1:] - 1] if edges else np.array([])
+        self.__set_edge_times()
+
+    def __set_edge_times(self):
+        "Sets edgeTimes as views into sampleTimes"
+        self.edgeTimes = [self.sampleTimes[p0:p1] for p0, p1 in self.edgeSamplePtr]
+
+    def share(self):
+        """
+        Copies the index arrays into shared memory so that worker processes
+        can attach to them with ContactGraph.from_shared instead of receiving
+        a pickled copy per task
+
+        multiprocessing.shared_memory needs python 3.8. On older versions the
+        arrays are put in spec itself and pickled to each worker instead
+
+        Returns
+        -------
+        spec: ~dict
+            Picklable description of the graph to pass to from_shared
+        shms: ~list
+            multiprocessing.shared_memory.SharedMemory blocks. The caller owns
+            them and must close() and unlink() them when the workers are done.
+            Empty without shared_memory
+        """
+        try:
+            from multiprocessing import shared_memory
+        except ImportError: #python < 3.8
+            shared_memory = None
+
+        spec = {
+            'nodes': self.nodes,
+            'edgeKeys': self.edgeKeys,
+            'refTime': self.refTime,
+            'arrays': {},
+        }
+        shms = []
+        for name in _SHARED_ARRAYS:
+            array = np.ascontiguousarray(getattr(self, name))
+            if shared_memory is None:
+                spec['arrays'][name] = array
+                continue
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            spec['arrays'][name] = (shm.name, array.shape, array.dtype.str)
+            shms.append(shm)
+        return spec, shms
+
+    @classmethod
+    def from_shared(cls, spec):
+        """
+        Attaches to a graph that was put in shared memory with share()
+
+        Parameters
+        ----------
+        spec: ~dict
+            Output of ContactGraph.share()
+
+        Returns
+        -------
+        graph: ~routing.ContactGraph
+            Graph whose arrays are views of the shared memory blocks (read only)
+        """
+        graph = cls.__new__(cls)
+        graph.nodes = spec['nodes']
+        graph.nodeIndex = {node: idx for idx, node in enumerate(graph.nodes)}
+        graph.edgeKeys = spec['edgeKeys']
+        graph.edgeIndex = {key: idx for idx, key in enumerate(graph.edgeKeys)}
+        graph.refTime = spec['refTime']
+        graph._shms = [] #Keep the blocks alive as long as the graph
+        for name, value in spec['arrays'].items():
+            if isinstance(value, np.ndarray): #Pickled copy, see share()
+                array = value
+            else:
+                from multiprocessing import shared_memory
+                shmName, shape, dtype = value
+                shm = shared_memory.SharedMemory(name=shmName)
+                array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+                array.flags.writeable = False
+                graph._shms.append(shm)
+            setattr(graph, name, array)
+        graph.__set_edge_times()
+        return graph
+
+    def get_relay_sats(self):
+        "Returns the nodes of the graph."
+        return self.nodes
+
+    def get_outgoing_edges(self, node, currentTime=None):
+        """
+        Returns the neighbors of a node
+
+        Parameters
+        ----------
+        node: ~str
+            node to get the neighbors of
+        currentTime: float
+            If given (seconds from self.refTime), only neighbors with a contact
+            after this time are returned
+        """
+        nodeIdx = self.nodeIndex.get(str(node))
+        if nodeIdx is None:
+            return []
+        edgeIdx = np.arange(self.indptr[nodeIdx], self.indptr[nodeIdx + 1])
+        if currentTime is not None:
+            edgeIdx = edgeIdx[self.edgeLastContact[edgeIdx] > currentTime]
+        return [self.nodes[n] for n in self.indices[edgeIdx]]
+
+    def next_contact_edge(self, edgeIdx, currentTime):
+        """
+        Gets the time of the first contact sample on an edge that is strictly
+        after currentTime
+
+        Parameters
+        ----------
+        edgeIdx: int
+            Integer edge ID
+        currentTime: float
+            Time that the source node has the information (seconds from self.refTime)
+
+        Returns
+        -------
+        tContact: float
+            Time of contact (seconds from self.refTime). np.inf if no contact
+        """
+        w0 = self.windowPtr[edgeIdx]
+        w1 = self.windowPtr[edgeIdx + 1]
+
+        #First window that is still open after currentTime
+        windowIdx = w0 + np.searchsorted(self.windowStops[w0:w1], currentTime, side='right')
+        if windowIdx == w1:
+            return np.inf
+        if self.windowStarts[windowIdx] > currentTime:
+            return self.windowStarts[windowIdx]
+
+        #currentTime falls inside the window, take the next sample in it
+        timesSec = self.edgeTimes[edgeIdx]
+        sampleIdx = np.searchsorted(timesSec, currentTime, side='right')
+        return timesSec[sampleIdx]
+
+    def next_contact(self, node1, node2, currentTime):
+        """
+        Gets the time of the first contact sample from node1 to node2 that
+        is strictly after currentTime
+
+        Parameters
+        ----------
+        node1: ~str
+            Source node
+        node2: ~str
+            Destination node
+        currentTime: float
+            Time that node1 has the information (seconds from self.refTime)
+
+        Returns
+        -------
+        tContact: float
+            Time of contact (seconds from self.refTime). np.inf if no contact
+        """
+        edgeIdx = self.edgeIndex.get(f'{node1}-{node2}')
+        if edgeIdx is None:
+            return np.inf
+        return self.next_contact_edge(edgeIdx, currentTime)
+
+def _earliest_arrival(graph, startIdx, t0, maxValue, allowed=None):
+    """
+    Heap based earliest arrival search on integer node IDs
+
+    Parameters
+    ----------
+    graph: ~routing.ContactGraph
+        Precomputed contact windows
+    startIdx: int
+        Integer ID of the start node (None if it is not in the graph)
+    t0: float
+        Start time (seconds from graph.refTime)
+    maxValue: float
+        Maximum arrival time (seconds from graph.refTime)
+    allowed: ~np.array
+        Boolean mask of the nodes that can be used. All nodes if None
+
+    Returns
+    -------
+    arrival: ~np.array
+        Earliest arrival at each node (seconds from graph.refTime)
+    previousIdx: ~np.array
+        Previous node on the fastest route to each node (-1 if none)
+    """
+    numNodes = len(graph.nodes)
+    arrival = np.full(numNodes, maxValue)
+    previousIdx = np.full(numNodes, -1, dtype=np.int64)
+    visited = np.zeros(numNodes, dtype=bool)
+    if allowed is not None:
+        visited |= ~allowed #Never relax edges into nodes that are not allowed
+
+    heap = []
+    if startIdx is not None:
+        arrival[startIdx] = t0
+        heap.append((t0, startIdx))
+
+    indptr = graph.indptr
+    indices = graph.indices
+    while heap:
+        tNode, nodeIdx = heapq.heappop(heap)
+        if visited[nodeIdx]:
+            continue
+        visited[nodeIdx] = True
+
+        for edgeIdx in range(indptr[nodeIdx], indptr[nodeIdx + 1]):
+            neighborIdx = indices[edgeIdx]
+            if visited[neighborIdx]:
+                continue
+            tentative_value = graph.next_contact_edge(edgeIdx, tNode)
+            if tentative_value < arrival[neighborIdx]:
+                arrival[neighborIdx] = tentative_value
+                previousIdx[neighborIdx] = nodeIdx
+                heapq.heappush(heap, (tentative_value, neighborIdx))
+
+    return arrival, previousIdx
+
+def _arrival_dicts(graph, arrival, previousIdx, start_node, start_time, allowed=None):
+    "Converts the output of _earliest_arrival to previous_nodes and shortest_path dicts"
+    nodes = graph.nodes
+    previous_nodes = {nodes[n]: nodes[p] for n, p in enumerate(previousIdx) if p >= 0}
+
+    #Convert back to astropy times in one call
+    arrivalTimes = seconds_to_time(arrival, graph.refTime)
+    shortest_path = {node: arrivalTimes[idx] for idx, node in enumerate(nodes)
+                     if allowed is None or allowed[idx]}
+    if start_node not in graph.nodeIndex:
+        shortest_path[start_node] = start_time
+    return previous_nodes, shortest_path
+
+def _allowed_mask(graph, nodes):
+    "Boolean mask over graph.nodes of the nodes in a list (None if nodes is None)"
+    if nodes is None:
+        return None
+    allowed = np.zeros(len(graph.nodes), dtype=bool)
+    for node in nodes:
+        nodeIdx = graph.nodeIndex.get(str(node))
+        if nodeIdx is not None:
+            allowed[nodeIdx] = True
+    return allowed
+
+def earliest_arrival_dijkstra(graph, start_node, start_time, sim_start_time, sim_time=3*u.day, nodes=None):
+    """
+    Earliest arrival routing over a ContactGraph using a binary heap.
+    Drop in replacement for utils.time_varying_dijkstra_algorithm with the
+    same inputs and outputs. Each edge relaxation is a binary search over
+    the contact windows of the edge.
+
+    Parameters
+    ----------
+    graph: ~routing.ContactGraph
+        Precomputed contact windows
+    start_node: ~str
+        This is the string SatID that conducts the pass to retrieve the remote sensing data
+    start_time: ~astropy.time.Time
+        This is time when imaging data first enters the satellite constellation
+    sim_start_time: ~astropy.time.Time
+        Simulation start time
+    sim_time: ~astropy.unit.Quantity
+        Simulation time, which defines the maximum cost value in the graph
+    nodes: ~list
+        If given, only these nodes are used in routing (same as building the
+        graph with only these nodes)
+
+    Returns
+    -------
+    previous_nodes: ~dict
+        The previous node that leads to the fastest route to each node
+    shortest_path: ~dict
+        Earliest arrival time (astropy time) at each node
+    """
+    start_node = str(start_node)
+    refTime = graph.refTime
+
+    t0 = float(time_to_seconds(start_time, refTime))
+    max_value = float(time_to_seconds(sim_start_time + sim_time, refTime))
+    allowed = _allowed_mask(graph, nodes)
+    startIdx = graph.nodeIndex.get(start_node)
+    if allowed is not None and startIdx is not None and not allowed[startIdx]:
+        startIdx = None
+
+    arrival, previousIdx = _earliest_arrival(graph, startIdx, t0, max_value, allowed)
+    return _arrival_dicts(graph, arrival, previousIdx, start_node, start_time, allowed)
+
+#Graph attached by each worker process of earliest_arrival_pool
+_POOL_GRAPH = None
+
+def _pool_init(spec):
+    global _POOL_GRAPH
+    _POOL_GRAPH = ContactGraph.from_shared(spec)
+
+def _pool_route(args):
+    startIdx, t0, maxValue, allowed = args
+    return _earliest_arrival(_POOL_GRAPH, startIdx, t0, maxValue, allowed)
+
+def earliest_arrival_pool(graph, start_nodes, start_times, sim_start_time, sim_time=3*u.day,
+                          nodes=None, workers=None):
+    """
+    Runs earliest_arrival_dijkstra for many independent (start node, start time)
+    queries on a process pool. The graph arrays are put in shared memory once
+    (ContactGraph.share) and attached by every worker, so only the query and
+    the arrival arrays are sent between processes. Before python 3.8 the
+    arrays are pickled once to each worker instead.
+
+    Parameters
+    ----------
+    graph: ~routing.ContactGraph
+        Precomputed contact windows
+    start_nodes: ~list
+        Start node of each query
+    start_times: ~list
+        Start time (astropy time) of each query
+    sim_start_time: ~astropy.time.Time
+        Simulation start time
+    sim_time: ~astropy.unit.Quantity
+        Simulation time, which defines the maximum cost value in the graph
+    nodes: ~list
+        Optional list (one entry per query) of the nodes each query can use.
+        An entry of None uses every node
+    workers: int
+        Number of worker processes. Defaults to os.cpu_count()
+
+    Returns
+    -------
+    results: ~list
+        (previous_nodes, shortest_path) of each query, as returned by
+        earliest_arrival_dijkstra
+    """
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    refTime = graph.refTime
+    max_value = float(time_to_seconds(sim_start_time + sim_time, refTime))
+    if nodes is None:
+        nodes = [None] * len(start_nodes)
+
+    tasks = []
+    queryInfo = []
+    for start_node, start_time, queryNodes in zip(start_nodes, start_times, nodes):
+        start_node = str(start_node)
+        allowed = _allowed_mask(graph, queryNodes)
+        startIdx = graph.nodeIndex.get(start_node)
+        if allowed is not None and startIdx is not None and not allowed[startIdx]:
+            startIdx = None
+        t0 = float(time_to_seconds(start_time, refTime))
+        tasks.append((startIdx, t0, max_value, allowed))
+        queryInfo.append((start_node, start_time, allowed))
+
+    if not tasks:
+        return []
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (4 * workers))
+
+    spec, shms = graph.share()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_pool_init,
+                                 initargs=(spec,)) as pool:
+            output = list(pool.map(_pool_route, tasks, chunksize=chunksize))
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    results = []
+    for (arrival, previousIdx), (start_node, start_time, allowed) in zip(output, queryInfo):
+        results.append(_arrival_dicts(graph, arrival, previousIdx, start_node, start_time, allowed))
+    return results
+
+def earliest_arrival_sweep(contacts, targetNodes, sourceNodes, startTimes,
+                           sim_start_time, sim_time=3*u.day, nodes=None):
+    """
+    Earliest arrival at any target node for many (source, start time) queries
+    with a single backward sweep over the time sorted contact samples
+    (profile connection scan). Every node's earliest arrival for every start
+    time is carried through the sweep, so all passes of all sensing satellites
+    are answered at once instead of running one Dijkstra per pass.
+
+    Uses the same contact semantics as utils.time_varying_dijkstra_algorithm:
+    data at a node can cross an edge at any contact sample strictly after the
+    time it arrived, and target nodes (ground stations) end the route.
+
+    Parameters
+    ----------
+    contacts: ~dict
+        Dictionary with keys 'contacts' and 'time' (same format as the
+        input to utils.TimeVaryingGraph)
+    targetNodes: ~list
+        Nodes to route to, usually ground stations. Ties are broken by list order
+    sourceNodes: ~list
+        Source node of each query
+    startTimes: ~astropy.time.Time or list
+        Start time of each query (time that source has the data)
+    sim_start_time: ~astropy.time.Time
+        Simulation start time
+    sim_time: ~astropy.unit.Quantity
+        Simulation time, which defines the maximum arrival time
+    nodes: ~list
+        Nodes that can be used in routing. If None, all nodes are used
+
+    Returns
+    -------
+    arrivalTimes: ~astropy.time.Time
+        Earliest arrival time at a target for each query. Capped at
+        sim_start_time + sim_time if no target is reached before then
+    arrivalNodes: ~list
+        Target node reached for each query
+    """
+    targetNodes = [str(n) for n in targetNodes]
+    sourceNodes = [str(n) for n in sourceNodes]
+    refTime = sim_start_time
+    maxSec = float(time_to_seconds(sim_start_time + sim_time, refTime))
+
+    if nodes is None:
+        nodes = get_contact_nodes(contacts)
+    nodes = [str(n) for n in nodes]
+    for node in targetNodes + sourceNodes:
+        if node not in nodes:
+            nodes.append(node)
+    nodeIndex = {node: idx for idx, node in enumerate(nodes)}
+
+    numTargets = len(targetNodes)
+    isTarget = np.zeros(len(nodes), dtype=bool)
+    targetIdx = np.zeros(len(nodes), dtype=np.int64)
+    for idx, node in enumerate(targetNodes):
+        isTarget[nodeIndex[node]] = True
+        targetIdx[nodeIndex[node]] = idx
+
+    #Flatten every contact sample into (source, destination, time) connections
+    contactMasks = contacts.get('contacts')
+    contactTimes = contacts.get('time')
+    secondsCache = {}
+    connSrc = []
+    connDst = []
+    connSec = []
+    for key, mask in contactMasks.items():
+        source, destination = key.split('-')
+        if source not in nodeIndex or destination not in nodeIndex:
+            continue
+        if isTarget[nodeIndex[source]]: #Routes end at targets
+            continue
+        mask = np.asarray(mask, dtype=bool)
+        if not mask.any():
+            continue
+        times = contactTimes.get(key)
+        timesID = id(times)
+        if timesID not in secondsCache:
+            secondsCache[timesID] = np.round(time_to_seconds(times, refTime), 6)
+        sampleSec = secondsCache[timesID][mask]
+        connSrc.append(np.full(len(sampleSec), nodeIndex[source], dtype=np.int64))
+        connDst.append(np.full(len(sampleSec), nodeIndex[destination], dtype=np.int64))
+        connSec.append(sampleSec)
+
+    if connSec:
+        connSrc = np.concatenate(connSrc)
+        connDst = np.concatenate(connDst)
+        connSec = np.concatenate(connSec)
+    else:
+        connSrc = connDst = np.array([], dtype=np.int64)
+        connSec = np.array([])
+
+    #Group connections by the sample (step) they happen on
+    stepTimes, connStep = np.unique(connSec, return_inverse=True)
+    order = np.argsort(connStep, kind='stable')
+    connSrc = connSrc[order]
+    connDst = connDst[order]
+    numSteps = len(stepTimes)
+    stepPtr = np.concatenate(([0], np.cumsum(np.bincount(connStep, minlength=numSteps)))).astype(np.int64)
+
+    #Queries start at the first step strictly after their start time
+    if isinstance(startTimes, Time):
+        startSec = np.atleast_1d(time_to_seconds(startTimes, refTime))
+    else:
+        startSec = np.array([float(time_to_seconds(t, refTime)) for t in startTimes])
+    firstStep = np.searchsorted(stepTimes, np.round(startSec, 6), side='right')
+    querySrc = np.array([nodeIndex[n] for n in sourceNodes], dtype=np.int64)
+    queryOrder = np.argsort(-firstStep, kind='stable')
+
+    # Arrivals are encoded as step * numTargets + target index, so one integer
+    # minimum picks the earliest step and then the first target in list order
+    infCode = (numSteps + 1) * numTargets
+    best = np.full(len(nodes), infCode, dtype=np.int64)
+    answers = np.full(len(sourceNodes), infCode, dtype=np.int64)
+
+    queryPtr = 0
+    numQueries = len(sourceNodes)
+    for step in range(numSteps - 1, -1, -1):
+        #best holds arrivals for data that can first move at step + 1
+        while queryPtr < numQueries and firstStep[queryOrder[queryPtr]] > step:
+            q = queryOrder[queryPtr]
+            answers[q] = best[querySrc[q]]
+            queryPtr += 1
+
+        src = connSrc[stepPtr[step]:stepPtr[step + 1]]
+        dst = connDst[stepPtr[step]:stepPtr[step + 1]]
+        #Gather before scatter so each step allows exactly one hop
+        candidates = np.where(isTarget[dst], step * numTargets + targetIdx[dst], best[dst])
+        np.minimum.at(best, src, candidates)
+
+    while queryPtr < numQueries:
+        q = queryOrder[queryPtr]
+        answers[q] = best[querySrc[q]]
+        queryPtr += 1
+
+    #Decode
+    reached = answers < infCode
+    arrivalSec = np.full(numQueries, maxSec)
+    arrivalSec[reached] = stepTimes[answers[reached] // numTargets]
+    arrivalTarget = np.where(reached, answers % max(numTargets, 1), 0)
+    pastEnd = arrivalSec >= maxSec #Same as the maximum cost in the Dijkstra graph
+    arrivalSec[pastEnd] = maxSec
+    arrivalTarget[pastEnd] = 0
+
+    arrivalTimes = seconds_to_time(arrivalSec, refTime)
+    arrivalNodes = [targetNodes[t] for t in arrivalTarget]
+    return arrivalTimes, arrivalNodes
+
+def get_contact_delta(oldContacts, newContacts):
+    """
+    Gets the contact samples that were added and removed between two contact
+    dictionaries (e.g. before and after changing one satellite's schedule)
+
+    Parameters
+    ----------
+    oldContacts: ~dict
+        Contacts used in the previous routing (keys 'contacts' and 'time')
+    newContacts: ~dict
+        Updated contacts. Keys that are missing keep their old contacts
+
+    Returns
+    -------
+    contactDelta: ~dict
+        Dictionary with keys
+        added   - Boolean arrays of contact samples that are new. Structure[i-j]
+        removed - Boolean arrays of contact samples that are gone. Structure[i-j]
+        time    - astropy times of the arrays above. Structure[i-j]
+    """
+    contactDelta = {'added': {}, 'removed': {}, 'time': {}}
+    oldMasks = oldContacts.get('contacts')
+    for key, newMask in newContacts.get('contacts').items():
+        newMask = np.asarray(newMask, dtype=bool)
+        oldMask = oldMasks.get(key)
+        if oldMask is None:
+            oldMask = np.zeros_like(newMask)
+        oldMask = np.asarray(oldMask, dtype=bool)
+        assert len(oldMask) == len(newMask), f"Contacts {key} must use the same time steps"
+
+        added = newMask & ~oldMask
+        removed = oldMask & ~newMask
+        if added.any():
+            contactDelta['added'][key] = added
+        if removed.any():
+            contactDelta['removed'][key] = removed
+        if added.any() or removed.any():
+            contactDelta['time'][key] = newContacts.get('time')[key]
+    return contactDelta
+
+def apply_contact_delta(contacts, contactDelta):
+    """
+    Applies a contact delta (see get_contact_delta) to a contact dictionary
+
+    Parameters
+    ----------
+    contacts: ~dict
+        Contacts (keys 'contacts' and 'time'). Not modified
+    contactDelta: ~dict
+        Added and removed contact samples
+
+    Returns
+    -------
+    newContacts: ~dict
+        Updated contacts. Unchanged masks are shared with contacts
+    """
+    newContacts = {
+        'contacts': dict(contacts.get('contacts')),
+        'time': dict(contacts.get('time')),
+    }
+    changedKeys = set(contactDelta.get('added')) | set(contactDelta.get('removed'))
+    for key in changedKeys:
+        times = contactDelta.get('time').get(key, newContacts['time'].get(key))
+        mask = newContacts['contacts'].get(key)
+        if mask is None:
+            mask = np.zeros(len(times), dtype=bool)
+        mask = np.array(mask, dtype=bool)
+        if key in contactDelta.get('added'):
+            mask |= contactDelta.get('added')[key]
+        if key in contactDelta.get('removed'):
+            mask &= ~contactDelta.get('removed')[key]
+        newContacts['contacts'][key] = mask
+        newContacts['time'][key] = times
+    return newContacts
+
+def get_delta_seconds(contactDelta, refTime):
+    """
+    Converts a contact delta to sorted float sample times per edge, as used
+    by is_route_affected
+
+    Returns
+    -------
+    deltaSeconds: ~dict
+        Keys 'added' and 'removed', each mapping 'i-j' to sample times
+        (seconds from refTime)
+    """
+    deltaSeconds = {'added': {}, 'removed': {}}
+    for change in ('added', 'removed'):
+        for key, mask in contactDelta.get(change).items():
+            times = contactDelta.get('time')[key]
+            deltaSeconds[change][key] = np.sort(time_to_seconds(times, refTime)[np.asarray(mask, dtype=bool)])
+    return deltaSeconds
+
+def is_route_affected(previous_nodes, shortest_path, deltaSeconds, refTime):
+    """
+    Checks if an earliest arrival tree (output of earliest_arrival_dijkstra)
+    can change because of a contact delta. A tree changes only if
+
+    - one of its edges used a contact sample that was removed, or
+    - an added sample on edge i-j is after the arrival at i and before the
+      arrival at j, so j could now be reached earlier
+
+    Removing contacts the tree does not use cannot make it faster, and the
+    arrivals of the tree are still reachable, so every other tree is still
+    optimal.
+
+    Parameters
+    ----------
+    previous_nodes: ~dict
+        Previous node on the fastest route to each node
+    shortest_path: ~dict
+        Earliest arrival time (astropy time) at each node
+    deltaSeconds: ~dict
+        Output of get_delta_seconds
+    refTime: ~astropy.time.Time
+        Reference time used in get_delta_seconds
+
+    Returns
+    -------
+    affected: bool
+        True if the tree has to be recomputed
+    """
+    arrivalCache = {}
+    def arrival(node):
+        if node not in arrivalCache:
+            arrivalCache[node] = float(time_to_seconds(shortest_path[node], refTime))
+        return arrivalCache[node]
+
+    for key, removedSec in deltaSeconds.get('removed').items():
+        source, destination = key.split('-')
+        if previous_nodes.get(destination) != source:
+            continue
+        sampleIdx = np.searchsorted(removedSec, arrival(destination) - 1e-6)
+        if sampleIdx < len(removedSec) and abs(removedSec[sampleIdx] - arrival(destination)) <= 1e-6:
+            return True
+
+    for key, addedSec in deltaSeconds.get('added').items():
+        source, destination = key.split('-')
+        if source not in shortest_path or destination not in shortest_path:
+            continue
+        #First added sample strictly after the arrival at source
+        sampleIdx = np.searchsorted(addedSec, arrival(source), side='right')
+        if sampleIdx < len(addedSec) and addedSec[sampleIdx] < arrival(destination):
+            return True
+    return False
+
+class ContactPlan(object):
+    def __init__(self, fromNodes, toNodes, starts, stops, rates=None, latencies=None, refTime=None):
+        """
+        Interval based contact plan. Each contact is a record of
+        (from, to, start, stop, rate, latency), so memory and routing cost
+        scale with the number of contacts rather than the number of time samples.
+
+        Parameters
+        ----------
+        fromNodes: ~list
+            Transmitting node of each contact
+        toNodes: ~list
+            Receiving node of each contact
+        starts: ~np.array
+            Start time of each contact (seconds from refTime)
+        stops: ~np.array
+            Stop time of each contact (seconds from refTime)
+        rates: ~np.array
+            Data rate of each contact (bits/s). Defaults to infinite (no transmission time)
+        latencies: ~np.array
+            One way latency of each contact (s). Defaults to 0
+        refTime: ~astropy.time.Time
+            Zero of the float time axis
+        """
+        fromNodes = [str(n) for n in fromNodes]
+        toNodes = [str(n) for n in toNodes]
+        numContacts = len(fromNodes)
+
+        self.refTime = refTime
+        self.nodes = sorted(set(fromNodes) | set(toNodes))
+        self.nodeIndex = {node: idx for idx, node in enumerate(self.nodes)}
+
+        fromIdx = np.array([self.nodeIndex[n] for n in fromNodes], dtype=np.int64)
+        toIdx = np.array([self.nodeIndex[n] for n in toNodes], dtype=np.int64)
+        starts = np.asarray(starts, dtype=float)
+        stops = np.asarray(stops, dtype=float)
+        if rates is None:
+            rates = np.full(numContacts, np.inf)
+        if latencies is None:
+            latencies = np.zeros(numContacts)
+        rates = np.broadcast_to(np.asarray(rates, dtype=float), (numContacts,))
+        latencies = np.broadcast_to(np.asarray(latencies, dtype=float), (numContacts,))
+
+        #Sort contacts by transmitting node, then by start time
+        order = np.lexsort((starts, fromIdx))
+        self.fromIdx = fromIdx[order]
+        self.toIdx = toIdx[order]
+        self.starts = starts[order]
+        self.stops = stops[order]
+        self.rates = np.array(rates[order])
+        self.latencies = np.array(latencies[order])
+
+        #Contacts leaving node i are nodePtr[i]:nodePtr[i+1]
+        counts = np.bincount(self.fromIdx, minlength=len(self.nodes))
+        self.nodePtr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_contacts(cls, contacts, nodes=None, refTime=None, rates=None, latencies=None):
+        """
+        Creates a contact plan from sampled contact masks (the contacts dictionary
+        built in utils.run_dijkstra_routing). Each run of True samples becomes one
+        contact that starts at its first sample and stops at its last sample.
+
+        Parameters
+        ----------
+        contacts: ~dict
+            Dictionary with keys 'contacts' and 'time' (same format as the
+            input to utils.TimeVaryingGraph)
+        nodes: ~list
+            Nodes to keep. If None, all nodes are kept
+        refTime: ~astropy.time.Time
+            Zero of the float time axis. Defaults to first contact time
+        rates: ~dict
+            Data rate (bits/s) keyed by contact key 'i-j'. Missing keys are infinite
+        latencies: ~dict
+            One way latency (s) keyed by contact key 'i-j'. Missing keys are 0
+
+        Returns
+        -------
+        contactPlan: ~routing.ContactPlan
+        """
+        contactGraph = ContactGraph(contacts, nodes if nodes is not None else
+                                    get_contact_nodes(contacts), refTime=refTime)
+        return cls.from_contact_graph(contactGraph, rates=rates, latencies=latencies)
+
+    @classmethod
+    def from_contact_graph(cls, contactGraph, rates=None, latencies=None):
+        """
+        Creates a contact plan from the windows of a routing.ContactGraph
+
+        Parameters
+        ----------
+        contactGraph: ~routing.ContactGraph
+            Adjacency index with precomputed contact windows
+        rates: ~dict
+            Data rate (bits/s) keyed by contact key 'i-j'. Missing keys are infinite
+        latencies: ~dict
+            One way latency (s) keyed by contact key 'i-j'. Missing keys are 0
+
+        Returns
+        -------
+        contactPlan: ~routing.ContactPlan
+        """
+        rates = rates or {}
+        latencies = latencies or {}
+        windowCounts = np.diff(contactGraph.windowPtr)
+        edgeOfWindow = np.repeat(np.arange(len(contactGraph.edgeKeys)), windowCounts)
+        sources = np.repeat(np.arange(len(contactGraph.nodes)), np.diff(contactGraph.indptr))
+
+        fromNodes = [contactGraph.nodes[sources[e]] for e in edgeOfWindow]
+        toNodes = [contactGraph.nodes[contactGraph.indices[e]] for e in edgeOfWindow]
+        keys = [contactGraph.edgeKeys[e] for e in edgeOfWindow]
+        contactRates = [rates.get(k, np.inf) for k in keys]
+        contactLatencies = [latencies.get(k, 0.) for k in keys]
+        return cls(fromNodes, toNodes, contactGraph.windowStarts, contactGraph.windowStops,
+                   rates=contactRates, latencies=contactLatencies, refTime=contactGraph.refTime)
+
+def get_contact_nodes(contacts):
+    "Gets every node named in the keys of a contacts dictionary"
+    nodes = []
+    for key in contacts.get('contacts').keys():
+        for node in key.split('-'):
+            if node not in nodes:
+                nodes.append(node)
+    return nodes
+
+class ContactGraphRouter(object):
+    def __init__(self, contactPlan):
+        """
+        Contact Graph Routing (CGR) over an interval based contact plan.
+        Routes from a source are found with a single earliest arrival search
+        over the contacts, and every route found is cached and reused for later
+        requests until one of its contacts expires or a better route may exist.
+
+        Parameters
+        ----------
+        contactPlan: ~routing.ContactPlan
+            Interval based contact plan
+        """
+        self.contactPlan = contactPlan
+        self.routeCache = {} #Key is (source, destination)
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+    def clear_cache(self):
+        "Removes all cached routes"
+        self.routeCache = {}
+
+    def get_route(self, source, destination, currentTime, bundleSize=0):
+        """
+        Gets the earliest arrival route from source to destination
+
+        Parameters
+        ----------
+        source: ~str
+            Node that has the data
+        destination: ~str
+            Node to deliver the data to
+        currentTime: float
+            Time that source has the data (seconds from contactPlan.refTime)
+        bundleSize: float
+            Size of the data (bits). Sets the transmission time on each contact
+
+        Returns
+        -------
+        route: ~dict
+            Dictionary with keys (None if destination is unreachable)
+            contacts  - Index of each contact used in contactPlan (sorted order)
+            path      - Nodes visited from source to destination
+            departure - Time data leaves source
+            arrival   - Time data arrives at destination
+            expiry    - Time that the first contact of the route closes
+        """
+        source = str(source)
+        destination = str(destination)
+        key = (source, destination)
+
+        cached = self.routeCache.get(key)
+        if cached is not None:
+            computedAt, cachedRoute = cached
+            if currentTime >= computedAt and cachedRoute['bundleSize'] == bundleSize:
+                replay = self.__build_route(cachedRoute['contacts'], currentTime, bundleSize)
+                # Earliest arrival can only get later as currentTime increases, so a
+                # cached route that still arrives at the same time is still optimal
+                if replay is not None and replay['arrival'] <= cachedRoute['arrival']:
+                    self.cacheHits += 1
+                    return replay
+            if currentTime > cachedRoute['expiry']: #Contact has closed
+                self.routeCache.pop(key)
+
+        self.cacheMisses += 1
+        routes = self.compute_routes(source, currentTime, bundleSize)
+        for dest, route in routes.items():
+            self.routeCache[(source, dest)] = (currentTime, route)
+        return routes.get(destination)
+
+    def compute_routes(self, source, currentTime, bundleSize=0):
+        """
+        Earliest arrival search over the contact plan from a source node at
+        currentTime. Cost is O(C log C) for C contacts.
+
+        Parameters
+        ----------
+        source: ~str
+            Node that has the data
+        currentTime: float
+            Time that source has the data (seconds from contactPlan.refTime)
+        bundleSize: float
+            Size of the data (bits). Sets the transmission time on each contact
+
+        Returns
+        -------
+        routes: ~dict
+            Route (see get_route) to every reachable node, keyed by node
+        """
+        plan = self.contactPlan
+        sourceIdx = plan.nodeIndex.get(str(source))
+        if sourceIdx is None:
+            return {}
+
+        numNodes = len(plan.nodes)
+        arrival = np.full(numNodes, np.inf)
+        viaContact = np.full(numNodes, -1, dtype=np.int64)
+        visited = np.zeros(numNodes, dtype=bool)
+        txTimes = bundleSize / plan.rates
+
+        arrival[sourceIdx] = currentTime
+        heap = [(currentTime, sourceIdx)]
+        while heap:
+            tNode, nodeIdx = heapq.heappop(heap)
+            if visited[nodeIdx]:
+                continue
+            visited[nodeIdx] = True
+
+            c0 = plan.nodePtr[nodeIdx]
+            c1 = plan.nodePtr[nodeIdx + 1]
+            departs = np.maximum(tNode, plan.starts[c0:c1])
+            feasible = departs + txTimes[c0:c1] <= plan.stops[c0:c1]
+            arrivals = departs + txTimes[c0:c1] + plan.latencies[c0:c1]
+            for offset in np.flatnonzero(feasible):
+                contactIdx = c0 + offset
+                neighborIdx = plan.toIdx[contactIdx]
+                if visited[neighborIdx] or arrivals[offset] >= arrival[neighborIdx]:
+                    continue
+                arrival[neighborIdx] = arrivals[offset]
+                viaContact[neighborIdx] = contactIdx
+                heapq.heappush(heap, (arrivals[offset], neighborIdx))
+
+        routes = {}
+        for nodeIdx in np.flatnonzero(viaContact >= 0):
+            contactsUsed = []
+            n = nodeIdx
+            while n != sourceIdx:
+                contactsUsed.append(viaContact[n])
+                n = plan.fromIdx[viaContact[n]]
+            contactsUsed.reverse()
+            route = self.__build_route(contactsUsed, currentTime, bundleSize)
+            routes[plan.nodes[nodeIdx]] = route
+        return routes
+
+    def __build_route(self, contactsUsed, currentTime, bundleSize):
+        "Forward pass over a list of contacts to get the route timing. None if not feasible"
+        plan = self.contactPlan
+        t = currentTime
+        departure = None
+        for contactIdx in contactsUsed:
+            txTime = bundleSize / plan.rates[contactIdx]
+            depart = max(t, plan.starts[contactIdx])
+            if depart + txTime > plan.stops[contactIdx]:
+                return None
+            if departure is None:
+                departure = depart
+            t = depart + txTime + plan.latencies[contactIdx]
+
+        path = [plan.nodes[plan.fromIdx[contactsUsed[0]]]]
+        path.extend(plan.nodes[plan.toIdx[c]] for c in contactsUsed)
+        route = {
+                    'contacts': list(contactsUsed),
+                    'path': path,
+                    'departure': departure,
+                    'arrival': t,
+                    'expiry': plan.stops[contactsUsed[0]],
+                    'bundleSize': bundleSize,
+        }
+        return route
@@ -15,9 +15,6 @@ from poliastro.czml.extract_czml import CZMLExtractor
 import matplotlib.pyplot as plt
 from poliastro.plotting.static import StaticOrbitPlotter
 from poliastro.plotting import OrbitPlotter3D, OrbitPlotter2D
-from poliastro.twobody.events import(
-    NodeCrossEvent,
-)
 # import cartopy.crs as ccrs
 
 import seaborn as sns
@@ -30,13 +27,29 @@ from CZMLExtractor_MJD import CZMLExtractor_MJD
 import utils as utils
 import orbitalMechanics as om
 import comms as com
-from copy import deepcopy
+from cache import LRUCache
+from copy import deepcopy, copy
+from collections import namedtuple
 
 import dill
 
 # Constellation Class
 
 
+#Ghost RGT orbits (Satellite.get_rgt) and their node crossings only depend on
+#the orbit plane and ground location, so they are shared by all satellites
+RGT_CACHE = LRUCache(maxsize=256)
+NODE_CROSSING_CACHE = LRUCache(maxsize=1024)
+
+#Lightweight view of a satellite's RGT schedule used when choosing satellites
+#per plane. sched is a reference to the ManeuverSchedule, it is not copied
+SchedRecord = namedtuple('SchedRecord', ['satKey', 'passType', 'driftTime', 'sched', 'backupChosen'])
+
+def _gen_GOM_2_RGT_sched_task(args):
+    "Process pool task of Constellation.gen_GOM_2_RGT_scheds"
+    sat, altChange, gs, tStep = args
+    return sat.gen_GOM_2_RGT_sched(altChange, gs, tStep)
+
 class Constellation():
     """
     Defines the Constellation class that holds a set of orbital planes
@@ -395,7 +408,45 @@ class Constellation():
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
-    def gen_GOM_2_RGT_scheds(self, altChange, gs, tStep=15*u.s):
+    def rank_sats_by_drift_time(self, altChange, gs, tStep=15*u.s):
+        """
+        Ranks the satellites of each plane by their estimated drift time to the
+        ascending and descending RGT passes (see
+        Satellite.estimate_GOM_2_RGT_drift_time)
+
+        Parameters
+        ----------
+        altChange: ~astropy.unit.Quantity
+            Altitude change to get to drift orbit
+        gs: satbox.GroundLoc
+            Ground location that RGT should pass
+        tStep: ~astropy.unit.Quantity
+            time step used when propagating satellite into drift orbit
+
+        Returns
+        -------
+        rankDict: Dict
+            Key is [planeID]['a' or 'd'], list of (satellite, drift time) sorted
+            by drift time. Planes that can't see gs are "skip"
+        """
+        rankDict = {}
+        for plane in self.planes:
+            if not plane:
+                continue
+            satTest = plane.sats[0]
+            planeID = satTest.planeID
+            if satTest.inc < gs.lat:
+                rankDict[f"Plane {planeID}"] = "skip"
+                continue
+
+            estimates = list(zip(plane.sats, Satellite.estimate_GOM_2_RGT_drift_times(plane.sats, altChange, gs, tStep)))
+            rankDict[f"Plane {planeID}"] = {
+                passType: sorted([(sat, est[passType]) for sat, est in estimates if passType in est],
+                                 key=lambda x: x[1])
+                for passType in ['a', 'd']}
+        return rankDict
+
+    def gen_GOM_2_RGT_scheds(self, altChange, gs, tStep=15*u.s, workers=None, topK=None):
         """
         Generates schedules to take each satellite in the constellation to the
         desired RGT track. This function doesn't decide which satellites are
@@ -411,6 +462,15 @@ class Constellation():
             Ground location that RGT should pass
         tSTep: ~astropy.unit.Quantity
             time step used when propagating satellite into drift orbit
+        workers: int
+            If greater than 1, the satellite schedules are generated on a
+            process pool of this size. Satellites of a plane are sent to the
+            same worker in chunks so they share its RGT caches
+        topK: int
+            If given, only the topK satellites per plane with the lowest
+            estimated ascending drift times and the topK with the lowest
+            descending drift times get a schedule (see rank_sats_by_drift_time).
+            At least two satellites per plane are kept
             
         Returns
         -------
@@ -422,6 +482,10 @@ class Constellation():
 
         schedDict = {}
 
+        #Satellites that need a schedule, in plane order
+        satsToSched = []
+        if topK is not None:
+            rankDict = self.rank_sats_by_drift_time(altChange, gs, tStep)
         for plane in self.planes:
             if not plane:
                 continue
@@ -432,16 +496,49 @@ class Constellation():
                 planeSkip = True
                 schedDict[f"Plane {planeID}"] = "skip"
                 continue
-            for sat in plane.sats:
+            schedDict[f"Plane {planeID}"] = {} #Initialize here to keep plane order
+            if topK is None:
+                satsToSched.extend(plane.sats)
+            else: #Best candidates for each pass type, in plane order
+                ranks = rankDict[f"Plane {planeID}"]
+                numBest = max(topK, 2)
+                candidates = []
+                for sat, _ in ranks['a'][:numBest] + ranks['d'][:numBest]:
+                    if not any(sat is c for c in candidates):
+                        candidates.append(sat)
+                #The same satellite can be best for both pass types, keep taking from the
+                #merged ranking until the plane has two (get_ascending_descending_per_plane)
+                for sat, _ in sorted(ranks['a'] + ranks['d'], key=lambda x: x[1]):
+                    if len(candidates) >= 2:
+                        break
+                    if not any(sat is c for c in candidates):
+                        candidates.append(sat)
+                satsToSched.extend([sat for sat in plane.sats if any(sat is c for c in candidates)])
+
+        if workers is not None and workers > 1 and len(satsToSched) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            chunksize = max(1, len(satsToSched) // (2 * workers))
+            tasks = [(sat, altChange, gs, tStep) for sat in satsToSched]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                scheds = list(pool.map(_gen_GOM_2_RGT_sched_task, tasks, chunksize=chunksize))
+            for sat, sched in zip(satsToSched, scheds):
+                sat.add_man_schedule(sched) #Same side effect as the serial call
+        else:
+            scheds = None
+
+        for idx, sat in enumerate(satsToSched):
+            if scheds is None:
                 sched = sat.gen_GOM_2_RGT_sched(altChange, gs, tStep)
-                satID = sat.satID
-                planeID = sat.planeID
+            else:
+                sched = scheds[idx]
+            satID = sat.satID
+            planeID = sat.planeID
 
-                if f"Plane {planeID}" in schedDict:
-                    schedDict[f"Plane {planeID}"][f"Sat {satID}"] = sched
-                else:
-                    schedDict[f"Plane {planeID}"] = {} #Initialize
-                    schedDict[f"Plane {planeID}"][f"Sat {satID}"] = sched
+            if f"Plane {planeID}" in schedDict:
+                schedDict[f"Plane {planeID}"][f"Sat {satID}"] = sched
+            else:
+                schedDict[f"Plane {planeID}"] = {} #Initialize
+                schedDict[f"Plane {planeID}"][f"Sat {satID}"] = sched
 
         return schedDict
 
@@ -548,45 +645,24 @@ class Constellation():
 
         #Calculate for second satellite
         for planeKey in sats2Maneuver.keys():
-            driftHolder = None
-
-            plane = deepcopy(schedDict[planeKey])
-            saveSat = sats2Maneuver[planeKey]
-            passType = scheds[f'{planeKey} {saveSat[0]}'].passType
-
-            #Remove satellite already chosen
-            for popSat in saveSat: 
-                plane.pop(popSat)
-
-            for satKey in plane.keys():
-                key = f'{planeKey} {satKey}'
-
-                backupChosen = 0 #Keep track of backup schedule chosen
-
-                #Same crossing type means you have to choose other type of crossing
-                if plane[satKey].passType == passType: 
-                    schedHolder = plane[satKey].scheduleBackup
-                    backupChosen = 1
-                else:
-                    schedHolder = plane[satKey]
-                    backupChosen = 0
-
-
-                tDrift = schedHolder.driftTime
-                if driftHolder is None: #First satellite in plane is default
-                    driftHolder = tDrift
-                    saveSat = satKey 
-                    sched = schedHolder
-                    backupTracker = backupChosen #Keep track if backup is chosen
-                elif driftHolder > tDrift: #Replace with better satellite
-                    driftHolder = tDrift
-                    saveSat = satKey
-                    sched = schedHolder
-                    backupTracker = backupChosen #Keep track if backup is chosen
-                elif driftHolder <= tDrift: #Skip satellite
-                    continue
-                else:
-                    print("something is wrong with tDrift comparison 2nd satellite")
+            chosenSats = sats2Maneuver[planeKey]
+            passType = scheds[f'{planeKey} {chosenSats[0]}'].passType
+
+            #Records of the remaining satellites (satellite already chosen removed).
+            #Same crossing type means you have to choose other type of crossing
+            records = self.__get_sched_records(schedDict[planeKey], exclude=chosenSats, passType=passType)
+
+            best = None
+            for record in records:
+                if best is None or best.driftTime > record.driftTime: #First satellite is default, replace with better satellite
+                    best = record
+
+            saveSat = best.satKey
+            driftHolder = best.driftTime
+            sched = best.sched
+            backupTracker = best.backupChosen #Keep track if backup is chosen
+            if backupTracker:
+                sched = copy(sched) #Shallow copy so the backup flag doesn't touch the original schedule
 
             sats2Maneuver[planeKey].append(saveSat)
             driftTimes[f'{planeKey} {saveSat}'] = driftHolder
@@ -613,6 +689,39 @@ class Constellation():
                 
         return sats2Maneuver, driftTimes, scheds
 
+    @staticmethod
+    def __get_sched_records(plane, exclude=(), passType=None):
+        """
+        Builds SchedRecords for the satellites of a plane without copying the schedules
+
+        Parameters
+        ----------
+        plane: Dict of satbox.ManeuverSchedules
+            Schedules of one plane. Key is satID
+        exclude: list
+            satIDs to leave out
+        passType: str ('a' or 'd')
+            If given, satellites whose schedule has this pass type are
+            represented by their backup schedule (other crossing type)
+
+        Returns
+        -------
+        records: list of SchedRecord
+        """
+        records = []
+        for satKey, satSched in plane.items():
+            if satKey in exclude:
+                continue
+            if passType is not None and satSched.passType == passType:
+                schedHolder = satSched.scheduleBackup
+                backupChosen = 1
+            else:
+                schedHolder = satSched
+                backupChosen = 0
+            records.append(SchedRecord(satKey, schedHolder.passType, schedHolder.driftTime,
+                                       schedHolder, backupChosen))
+        return records
+
 
     def generate_czml_file(self, prop_duration, sample_points, 
                             fname=None, satellites=None, objects=None, L_avail_ISL=None,L_poly_ISL=None, L_avail_GS=None, L_poly_GS=None, GS_pos=None, alt=None, conicSensorAngle=None, GS=False, scene3d=True, specificSats=False, show_polyline_ISL=False, show_polyline_GS=False, show_conicSensor=False, create_file=False):
@@ -1191,6 +1300,71 @@ class Satellite(Orbit):
     def reset_man_schedule(self):
         self.maneuverSchedule = None
 
+    def propagate_man_schedule(self, manSched=None, tStep=None, method="J2"):
+        """
+        Applies a maneuver schedule to the satellite state only and returns the
+        satellite after the last maneuver. Same burns and timing as
+        SimSatellite.propagate but without the sampled ephemeris or frame
+        conversions, for planners that only need the final orbit
+        (e.g. SimSatellite(...).satSegments[-1])
+
+        Parameters
+        ----------
+        manSched: satbox.ManeuverSchedule
+            Schedule to apply. Defaults to self.maneuverSchedule
+        tStep: ~astropy.unit.Quantity
+            If given, each post-burn state is propagated to the next multiple
+            of tStep from the segment start, as SimSatellite does to keep
+            satellites on the same time grid
+        method: str ("J2")
+            J2 to propagate using J2 perturbations, otherwise two body
+
+        Returns
+        -------
+        satFinal: ~satbox.Satellite
+            Satellite after the last maneuver (self if there are no maneuvers)
+        """
+        if manSched is None:
+            manSched = self.maneuverSchedule
+        if manSched is None or not manSched.schedule:
+            return self
+
+        if method == "J2":
+            propKwargs = {'method': cowell, 'f': self.j2_f}
+        else:
+            propKwargs = {}
+
+        currentSat = self
+        for man in sorted(manSched.schedule, key=lambda x: x.time):
+            assert man.time >= currentSat.epoch, "maneuver time before satellite epoch"
+
+            segmentTimeLen = (man.time - currentSat.epoch).to(u.s)
+            if segmentTimeLen.value == 0: #Burn at the start of the segment
+                sat_i = currentSat
+                t2propagateAtEnd = 0 * u.s
+            else:
+                sat_i = currentSat.propagate(segmentTimeLen, **propKwargs)
+                if tStep is None:
+                    t2propagateAtEnd = 0 * u.s
+                else: #Time to the next step of np.arange(0, segmentTimeLen, tStep)
+                    stepSec = tStep.to(u.s).value
+                    nextT = np.ceil(segmentTimeLen.value / stepSec) * stepSec
+                    t2propagateAtEnd = (nextT - segmentTimeLen.value) * u.s
+
+            sat_f = sat_i.apply_maneuver(Maneuver.impulse(man.deltaVVec))
+            if t2propagateAtEnd.value != 0:
+                sat_f = sat_f.propagate(t2propagateAtEnd, **propKwargs)
+
+            #Restore properties that are erased during propagation
+            sat_f.satID = self.satID
+            sat_f.planeID = self.planeID
+            sat_f.note = self.note
+            sat_f.task = self.task
+            sat_f.maneuverSchedule = manSched
+            currentSat = sat_f
+
+        return currentSat
+
     def gen_sched_rgt_acquisition(self, groundLoc, k_r=15, k_d=1):
         """
         Generates a burn schedule that takes a satellite in a drift orbit into
@@ -1223,9 +1397,9 @@ class Satellite(Orbit):
         rgtDesired = rgtOrbits[0] #Ascending pass
         rgtDesiredD = rgtOrbits[1] #Descending pass
 
-        #Propagate the RGT to the next node crossing
-        _, lon_eq_rgt = self.__get_lon_next_node_crossing(rgtDesired)
-        _, lon_eq_rgtD = self.__get_lon_next_node_crossing(rgtDesiredD)
+        #Propagate the RGT to the next node crossing (shared by satellites with the same ghost orbits)
+        _, lon_eq_rgt = self.__get_lon_next_node_crossing_cached(rgtDesired)
+        _, lon_eq_rgtD = self.__get_lon_next_node_crossing_cached(rgtDesiredD)
 
         ## Get other longitude crossings
         lonSplit = 360*u.deg / k_r
@@ -1271,42 +1445,9 @@ class Satellite(Orbit):
         minDist = eqDistsLeftSorted[0]
         minDistD = eqDistsLeftSortedD[0]
 
-        ## Define Hohmann transfer parameters
-        hoh_a, hoh_ecc = om.a_ecc_hohmann(self.a, rgtDesired.a)
-        hoh_aD, hoh_eccD = om.a_ecc_hohmann(self.a, rgtDesiredD.a)
-        pnHohmann = om.get_nodal_period(hoh_a, self.inc)
-        pnHohmannD = om.get_nodal_period(hoh_aD, self.inc)
-
-        # Get nodal periods
-        pnRGT = om.get_nodal_period(rgtDesired.a, rgtDesired.inc)
-        pnDrift = om.get_nodal_period(self.a, self.inc)
-
-        t_hoh = om.t_Hohmann(self.a, rgtDesired.a)
-
-        #Descending pass
-        pnRGTD = om.get_nodal_period(rgtDesiredD.a, rgtDesiredD.inc)
-        t_hohD = om.t_Hohmann(self.a, rgtDesiredD.a)
-
-
-
-
-
-
-        #Calculate equatorial nodal displacement
-        deltaL_hoh = om.nodal_period_displacement(pnRGT, rgtDesired.a, rgtDesired.ecc, rgtDesired.inc, hoh_a)
-        deltaL_hohD = om.nodal_period_displacement(pnRGTD, rgtDesiredD.a, rgtDesiredD.ecc, rgtDesiredD.inc, hoh_aD)
-        deltaL_drift = om.nodal_period_displacement(pnRGT, rgtDesired.a, rgtDesired.ecc, rgtDesired.inc, self.a)
-        deltaL_driftD = om.nodal_period_displacement(pnRGTD, rgtDesiredD.a, rgtDesiredD.ecc, rgtDesiredD.inc, self.a)
-        
-        # Get drift rate of drift orbit and hohmann orbit
-        deltaLDriftDot = deltaL_drift / pnDrift
-        deltaLDriftDotD = deltaL_driftD / pnDrift
-        deltaL_hohDot = deltaL_hoh / pnHohmann
-        deltaL_hohDotD = deltaL_hohD / pnHohmannD
-
-
-        deltaL_hoh_transfer = (t_hoh * deltaL_hohDot) * u.rad
-        deltaL_hoh_transferD = (t_hohD * deltaL_hohDotD) * u.rad
+        ## Ground track drift rate in the drift orbit and drift covered by the Hohmann transfer
+        deltaLDriftDot, deltaL_hoh_transfer = self.__rgt_drift_rates(self.a, self.inc, rgtDesired)
+        deltaLDriftDotD, deltaL_hoh_transferD = self.__rgt_drift_rates(self.a, self.inc, rgtDesiredD)
 
         # Subtract distance that will be covered by Hohmann Transfer
 
@@ -1362,52 +1503,271 @@ class Satellite(Orbit):
         return sched
 
     @staticmethod
-    def __get_lon_next_node_crossing(satellite):
+    def __rgt_drift_rates(aDrift, inc, rgtDesired):
         """
-        Gets the longitude of the next node crossing
+        Ground track drift rate of a drift orbit relative to a desired RGT orbit
+        and the drift covered while transferring into the RGT orbit.
+        From the nodal period displacement (Aorpimai eqn 20)
 
         Parameters
         ----------
-        satellite: ~satbox.satellite
-            Satellite object in equstion
+        aDrift: ~astropy.unit.Quantity
+            semi-major axis of drift orbit
+        inc: ~astropy.unit.Quantity
+            inclination of drift orbit
+        rgtDesired: ~satbox.Satellite
+            Desired RGT (ghost) orbit
 
         Returns
         -------
-        satEq: ~satbox.Satellite
-            Satellite object at equator
-        satLon: ~astropy.unit.Quantity
-            longitude of satellite at crossing
+        deltaLDriftDot: ~astropy.unit.Quantity
+            ground track drift rate in the drift orbit (1/s, radians implied)
+        deltaL_hoh_transfer: ~astropy.unit.Quantity
+            ground track drift during the Hohmann transfer to the RGT orbit
+        """
+        ## Define Hohmann transfer parameters
+        hoh_a, hoh_ecc = om.a_ecc_hohmann(aDrift, rgtDesired.a)
+        pnHohmann = om.get_nodal_period(hoh_a, inc)
+
+        # Get nodal periods
+        pnRGT = om.get_nodal_period(rgtDesired.a, rgtDesired.inc)
+        pnDrift = om.get_nodal_period(aDrift, inc)
 
+        t_hoh = om.t_Hohmann(aDrift, rgtDesired.a)
+
+        #Calculate equatorial nodal displacement
+        deltaL_hoh = om.nodal_period_displacement(pnRGT, rgtDesired.a, rgtDesired.ecc, rgtDesired.inc, hoh_a)
+        deltaL_drift = om.nodal_period_displacement(pnRGT, rgtDesired.a, rgtDesired.ecc, rgtDesired.inc, aDrift)
+
+        # Get drift rate of drift orbit and hohmann orbit
+        deltaLDriftDot = deltaL_drift / pnDrift
+        deltaL_hohDot = deltaL_hoh / pnHohmann
+
+        deltaL_hoh_transfer = (t_hoh * deltaL_hohDot) * u.rad
+        return deltaLDriftDot, deltaL_hoh_transfer
+
+    def estimate_GOM_2_RGT_drift_time(self, altChange, gs, tStep=15*u.s, k_r=15, k_d=1):
         """
-        #Propagate the RGT to the next node crossing
-        t2propagate = 1.5 * satellite.period.to(u.s).value
-        tofs = TimeDelta(np.arange(0, t2propagate, 1)*u.s)
+        Closed form estimate of the drift times gen_GOM_2_RGT_sched would find
+        for the ascending and descending RGT passes. Used to rank satellites
+        before running the detailed planner (see estimate_GOM_2_RGT_drift_times
+        to estimate several satellites at once)
 
-        node_event = NodeCrossEvent(terminal=True)
-        events = [node_event]
-        rr,vv = cowell(
-                Earth.k,
-                satellite.r,
-                satellite.v,
-                tofs,
-                f=satellite.j2_f,
-                events=events,
-        )
+        The drift satellite's state at the end of the Hohmann transfer into the
+        drift orbit is found from the secular J2 rates of the argument of
+        latitude and RAAN instead of propagating it. The ghost RGT orbits are
+        found from that state, at the epoch the planner's drift satellite has
 
-        #Propagate satellite to equatorial position
-        satEq = satellite.propagate(node_event.last_t, method=cowell, f=satellite.j2_f)
+        Parameters
+        ----------
+        altChange: ~astropy.unit.Quantity
+            Altitude change to get to drift orbit
+        gs: satbox.GroundLoc
+            Ground location that RGT should pass
+        tStep: ~astropy.unit.Quantity
+            Time step used when propagating satellite into drift orbit
+        k_r: int
+            Number of revolutions until repeat ground track
+        k_d: int
+            Number of days to repeat ground track
 
-        satECI = GCRS(rr[-1][0], rr[-1][1], rr[-1][2], representation_type="cartesian", obstime = satellite.epoch+node_event.last_t)
+        Returns
+        -------
+        driftTimes: Dict
+            Estimated drift times (~astropy.unit.Quantity) with keys 'a' and 'd'
+        """
+        return Satellite.estimate_GOM_2_RGT_drift_times([self], altChange, gs, tStep, k_r, k_d)[0]
+
+    @staticmethod
+    def estimate_GOM_2_RGT_drift_times(sats, altChange, gs, tStep=15*u.s, k_r=15, k_d=1):
+        """
+        estimate_GOM_2_RGT_drift_time of several satellites (usually a plane).
+        The node crossing longitudes of all drift satellites are found with a
+        single frame transform. Satellites of a plane start their drift orbits
+        in the same plane at the same epoch, so they share one ghost RGT solve
+        (RGT_CACHE)
+
+        Parameters
+        ----------
+        sats: list of satbox.Satellite
+            Satellites in global observation mode
+        altChange: ~astropy.unit.Quantity
+            Altitude change to get to drift orbit
+        gs: satbox.GroundLoc
+            Ground location that RGT should pass
+        tStep: ~astropy.unit.Quantity
+            Time step used when propagating satellite into drift orbit
+        k_r: int
+            Number of revolutions until repeat ground track
+        k_d: int
+            Number of days to repeat ground track
+
+        Returns
+        -------
+        driftTimes: list of Dict
+            Estimated drift times of each satellite, see estimate_GOM_2_RGT_drift_time
+        """
+        driftStarts = [sat.__drift_start_state(altChange, tStep, k_r, k_d) for sat in sats]
+
+        #Longitude of the next node crossing of every drift satellite
+        rEq = u.Quantity([start['rEq'] for start in driftStarts]).T
+        tNode = Time([start['tNode'] for start in driftStarts])
+        lon_eq_driftSats = Satellite.__lon_from_eci(rEq, tNode)
+
+        lonSplit = 360*u.deg / k_r
+        allDriftTimes = []
+        for start, lon_eq_driftSat in zip(driftStarts, lon_eq_driftSats):
+            driftSat = start['driftSat']
+            rgtOrbits = driftSat.get_rgt(gs, days=2, k_r=k_r, k_d=k_d)
+
+            driftTimes = {}
+            for rgtDesired in rgtOrbits[:2]:
+                _, lon_eq_rgt = Satellite.__get_lon_next_node_crossing_cached(rgtDesired)
+                if driftSat.a > rgtDesired.a: #Westward relative drift
+                    dist = lon_eq_driftSat - lon_eq_rgt
+                else: #Eastward relative drift
+                    dist = lon_eq_rgt - lon_eq_driftSat
+                #RGT crossings are lonSplit apart so the closest one is dist mod lonSplit
+                minDist = dist % lonSplit
+
+                deltaLDriftDot, deltaL_hoh_transfer = Satellite.__rgt_drift_rates(driftSat.a, driftSat.inc, rgtDesired)
+                if minDist < deltaL_hoh_transfer:
+                    minDist = minDist + lonSplit
+                driftTimes[rgtDesired.note] = ((minDist - deltaL_hoh_transfer) / (deltaLDriftDot * u.rad)).to(u.s)
+            allDriftTimes.append(driftTimes)
+
+        return allDriftTimes
+
+    def __drift_start_state(self, altChange, tStep, k_r, k_d):
+        """
+        State at the start of the drift orbit (end of the Hohmann transfer, on
+        the tStep grid) from the secular J2 rates, and the position and time of
+        its next node crossing
+
+        Returns
+        -------
+        driftStart: Dict
+            'driftSat' (~satbox.Satellite in the drift orbit), 'rEq' (node
+            crossing position in GCRS) and 'tNode' (node crossing time)
+        """
+        #Drift orbit as in gen_GOM_2_RGT_sched
+        a_out, alt_out = om.getRGTOrbit(k_r, k_d, self.ecc, self.inc)
+        if self.alt >= alt_out:
+            r_drift = self.a + altChange
+        else:
+            r_drift = self.a - altChange
+
+        #Hohmann transfer into drift orbit, ending on the tStep grid
+        hoh_a, hoh_ecc = om.a_ecc_hohmann(self.a, r_drift)
+        t_hoh = om.t_Hohmann(self.a, r_drift).to(u.s)
+        stepSec = tStep.to(u.s).value
+        tDrift = np.ceil(t_hoh.value / stepSec) * stepSec * u.s
+
+        #Argument of latitude and RAAN at the start of the drift orbit (secular J2 rates)
+        argLatDotDrift = om.precRate_argLat(r_drift, 0, self.inc)
+        raanDotDrift = om.precRate_RAAN(r_drift, 0, self.inc).to(u.rad / u.s, equivalencies=u.dimensionless_angles())
+        raanDotHoh = om.precRate_RAAN(hoh_a, hoh_ecc, self.inc).to(u.rad / u.s, equivalencies=u.dimensionless_angles())
+        argLat = ((self.argp + self.nu).to(u.rad) 
+                  + om.precRate_argLat(hoh_a, hoh_ecc, self.inc) * t_hoh
+                  + argLatDotDrift * (tDrift - t_hoh)).to_value(u.rad) % (2 * np.pi)
+        raan = (self.raan + raanDotHoh * t_hoh + raanDotDrift * (tDrift - t_hoh)).to_value(u.rad)
+
+        driftSat = Satellite.circular(Earth, alt = r_drift - Earth.R, inc = self.inc,
+                                      raan = (raan % (2 * np.pi)) * u.rad, arglat = argLat * u.rad,
+                                      epoch = self.epoch + tDrift)
+        driftSat.satID = self.satID
+        driftSat.planeID = self.planeID
+
+        #Next node crossing of the drift satellite
+        angle2Node = np.pi - argLat % np.pi
+        t2Node = (angle2Node * u.rad / argLatDotDrift).to(u.s)
+        nodeDir = raan + (raanDotDrift * t2Node).to_value(u.rad) + (np.pi if argLat < np.pi else 0) #Descending node if argLat < 180 deg
+        rEq = r_drift.to(u.km) * np.array([np.cos(nodeDir), np.sin(nodeDir), 0])
+
+        driftStart = {'driftSat': driftSat,
+                      'rEq': rEq,
+                      'tNode': self.epoch + tDrift + t2Node}
+        return driftStart
+
+    @staticmethod
+    def __lon_from_eci(rEq, obstime):
+        """
+        Longitude of an ECI (GCRS) position at obstime
+        """
+        satECI = GCRS(rEq[0], rEq[1], rEq[2], representation_type="cartesian", obstime = obstime)
 
         satECISky = SkyCoord(satECI)
         satECEF = satECISky.transform_to(ITRS)
         satEL = EarthLocation.from_geocentric(satECEF.x, satECEF.y, satECEF.z)
         ## Convert to LLA
-
-        ## 1st Node crossing of desired RGT track
         lla = satEL.to_geodetic() #to LLA
+        return lla.lon
+
+    @staticmethod
+    def __get_lon_next_node_crossing_cached(satellite):
+        """
+        __get_lon_next_node_crossing memoized on the satellite epoch and state
+        (see NODE_CROSSING_CACHE)
+        """
+        crossingKey = (satellite.epoch.jd1, satellite.epoch.jd2,
+                       tuple(satellite.r.to_value(u.km)), tuple(satellite.v.to_value(u.km / u.s)))
+        crossing = NODE_CROSSING_CACHE.get(crossingKey)
+        if crossing is None:
+            crossing = Satellite.__get_lon_next_node_crossing(satellite)
+            NODE_CROSSING_CACHE.put(crossingKey, crossing)
+        return crossing
+
+    @staticmethod
+    def __get_lon_next_node_crossing(satellite, newtonIters=3, tol=1e-3*u.s):
+        """
+        Gets the longitude of the next node crossing
+
+        The time to the crossing is first found in closed form from the
+        argument of latitude and its secular J2 rate, then refined with
+        Newton steps on z / vz of the J2 propagated state
+
+        Parameters
+        ----------
+        satellite: ~satbox.satellite
+            Satellite object in equstion
+        newtonIters: int
+            Maximum number of Newton refinement steps
+        tol: ~astropy.unit.Quantity
+            Stop refining once the Newton step is smaller than this
+
+        Returns
+        -------
+        satEq: ~satbox.Satellite
+            Satellite object at equator
+        satLon: ~astropy.unit.Quantity
+            longitude of satellite at crossing
+
+        """
+        r = satellite.r.to(u.km).value
+        v = satellite.v.to(u.km / u.s).value
+        h = np.cross(r, v)
+        raan = np.arctan2(h[0], -h[1])
+        rNorm = np.linalg.norm(r)
+        sinInc = np.linalg.norm(h[:2]) / np.linalg.norm(h)
 
-        satLon = lla.lon
+        #Argument of latitude and angle left to the next node (ascending or descending)
+        argLat = np.arctan2(r[2] / (rNorm * sinInc), (r[0] * np.cos(raan) + r[1] * np.sin(raan)) / rNorm)
+        angle2Node = np.pi - argLat % np.pi
+
+        argLatDot = om.precRate_argLat(satellite.a, satellite.ecc, satellite.inc)
+        t2Node = (angle2Node * u.rad / argLatDot).to(u.s)
+
+        #Propagate satellite to equatorial position
+        satEq = satellite.propagate(t2Node, method=cowell, f=satellite.j2_f)
+        for _ in range(newtonIters):
+            dt = -(satEq.r[2] / satEq.v[2]).to(u.s)
+            if abs(dt) < tol:
+                break
+            t2Node = t2Node + dt
+            satEq = satellite.propagate(t2Node, method=cowell, f=satellite.j2_f)
+
+        ## Longitude of node crossing
+        satLon = Satellite.__lon_from_eci(satEq.r, satEq.epoch)
         return satEq, satLon
 
     @staticmethod
@@ -1464,6 +1824,17 @@ class Satellite(Orbit):
         tInitMJDRaw = tInit.mjd
         tInitMJD = int(tInitMJDRaw)
 
+        #Ghost orbits only depend on these inputs, reuse them across satellites
+        gsGeocentricKey = tuple(c.to_value(u.m) for c in groundLoc.loc.to_geocentric())
+        rgtKey = (gsGeocentricKey,
+                  u.Quantity(groundLoc.lat, u.deg).value, u.Quantity(groundLoc.lon, u.deg).value,
+                  satInit.inc.to_value(u.rad), float(satInit.ecc), satInit.raan.to_value(u.rad),
+                  k_r, k_d, days, tInitMJD,
+                  self.epoch.jd1, self.epoch.jd2, refVernalEquinox.jd1, refVernalEquinox.jd2)
+        cachedOrbits = RGT_CACHE.get(rgtKey)
+        if cachedOrbits is not None:
+            return self.__tag_ghost_orbits(cachedOrbits)
+
         dayArray = np.arange(1, days + 2)
         days2InvestigateMJD = list(tInitMJD + dayArray) #Which days to plan over
         days = [Time(dayMJD, format='mjd', scale='utc')
@@ -1558,16 +1929,24 @@ class Satellite(Orbit):
             # ##Tag satellite with maneuver number
             # ghostSatFuture.manID = idx
 
-            ## Tag ghost satellites with sat and plane IDs
-            ghostSatFutureA.satID = self.satID
-            ghostSatFutureA.planeID = self.planeID
-            ghostSatFutureD.satID = self.satID
-            ghostSatFutureD.planeID = self.planeID
-
             rgtOrbits.append(ghostSatFutureA)
             rgtOrbits.append(ghostSatFutureD)
 
-        return rgtOrbits
+        RGT_CACHE.put(rgtKey, rgtOrbits)
+        return self.__tag_ghost_orbits(rgtOrbits)
+
+    def __tag_ghost_orbits(self, rgtOrbits):
+        """
+        Copies cached ghost orbits and tags them with this satellite's sat and plane IDs
+        (shallow copies, the orbit state is shared)
+        """
+        taggedOrbits = []
+        for ghostSat in rgtOrbits:
+            ghostSatCopy = copy(ghostSat)
+            ghostSatCopy.satID = self.satID
+            ghostSatCopy.planeID = self.planeID
+            taggedOrbits.append(ghostSatCopy)
+        return taggedOrbits
 
     # def get_rgt(self, groundLoc, days=7 , tInitSim=None, task=None, k_r=15, k_d=1,
     #                              refVernalEquinox=astropy.time.Time("2021-03-20T0:00:00", format = 'isot', scale = 'utc')):
@@ -1775,18 +2154,8 @@ class Satellite(Orbit):
         satDrift = self
         satDrift.add_man_schedule(sched)
         
-        #Get Hohmann Time
-        hohmannStartTime = sched.schedule[0].time
-        hohmannStopTime = sched.schedule[1].time
-        hohmannTime = hohmannStopTime - hohmannStartTime
-        
-        hohmannPropagateTime = hohmannTime + tStep #add tStep buffer
-        
-        #Propagate to drift orbit
-        satDriftSim = SimSatellite(satDrift, hohmannPropagateTime.sec * u.s, tStep, verbose=verbose)
-        satDriftSim.propagate()
-        
-        driftSat = satDriftSim.satSegments[2]
+        #Propagate to drift orbit (state only, the ephemeris is not needed)
+        driftSat = satDrift.propagate_man_schedule(sched, tStep=tStep)
         rgtAqSched = driftSat.gen_sched_rgt_acquisition(gs)
         driftSat.add_man_schedule(rgtAqSched)
         
@@ -2430,8 +2799,8 @@ class ManeuverSchedule():
 
         ## Debug statements ##
         # print(f"T_wait: {t_wait}")
-        orb_tgt_180 = orb_tgt.propagate(orb_i.epoch + t_wait + t_trans, method=cowell, f=f)
-        anomalyDiff = orb_i_1st_burn.arglat.to(u.deg) - orb_tgt_180.arglat.to(u.deg)
+        # orb_tgt_180 = orb_tgt.propagate(orb_i.epoch + t_wait + t_trans, method=cowell, f=f)
+        # anomalyDiff = orb_i_1st_burn.arglat.to(u.deg) - orb_tgt_180.arglat.to(u.deg)
         # print(f"Anomaly Diff: {anomalyDiff}")
         # print("T_transfer: ", t_trans)
         # print("a_trans: ", a_trans)
@@ -2439,6 +2808,72 @@ class ManeuverSchedule():
 
         self.gen_hohmann_schedule(orb_i_1st_burn, orb_tgt_i.a)
 
+    @staticmethod
+    def plan_intersect_batch(chasers, targets, method="J2"):
+        """
+        Evaluates the phasing used by gen_intersect_sched for every
+        (chaser, target) combination at once. Targets are advanced to each
+        chaser epoch with the secular J2 rate of the argument of latitude
+        instead of being propagated, and the phasing (Vallado Algorithm 45) is
+        solved on arrays. Use the arrays to choose an assignment, then
+        gen_intersect_sched for the chosen pairs
+
+        Parameters
+        ----------
+        chasers: list of ~satbox.Satellite
+            Satellites in their current state (circular orbits)
+        targets: list of ~satbox.Satellite
+            Desired orbits (target slots) in any state (epoch)
+        method: string
+            "J2" to advance targets with secular J2 rates, otherwise two body
+
+        Returns
+        -------
+        plan: Dict
+            (chaser, target) arrays with keys
+            v_i     - initial phase of chaser ahead of target (rad)
+            t_wait  - wait before the first burn (s), nan if in the same orbit
+            t_trans - Hohmann transfer time (s)
+            t_total - t_wait + t_trans (s)
+            delV    - total delta V (m/s)
+            a_trans - semi-major axis of transfer orbit (m)
+        """
+        a_int = np.array([sat.a.to_value(u.m) for sat in chasers])
+        argLat_int = np.array([sat.arglat.to_value(u.rad) for sat in chasers])
+        a_tgt = np.array([sat.a.to_value(u.m) for sat in targets])
+        ecc_tgt = np.array([sat.ecc.value for sat in targets])
+        inc_tgt = np.array([sat.inc.to_value(u.rad) for sat in targets])
+        argLat_tgt = np.array([sat.arglat.to_value(u.rad) for sat in targets])
+
+        #Time from each target epoch to each chaser epoch
+        epochRef = chasers[0].epoch
+        chaserSec = np.array([(sat.epoch - epochRef).to_value(u.s) for sat in chasers])
+        targetSec = np.array([(sat.epoch - epochRef).to_value(u.s) for sat in targets])
+        dt = chaserSec[:, np.newaxis] - targetSec[np.newaxis, :]
+
+        #Advance targets to the chaser epochs
+        if method == "J2":
+            argLatDot_tgt = om.fast.precRate_argLat(a_tgt, ecc_tgt, inc_tgt)
+        else:
+            argLatDot_tgt = np.sqrt(om.fast.MU_EARTH / a_tgt**3)
+        argLat_tgt_i = argLat_tgt[np.newaxis, :] + argLatDot_tgt[np.newaxis, :] * dt
+
+        #Phase angle from the target to the chaser, wrapped to [-pi, pi)
+        v_i = (argLat_int[:, np.newaxis] - argLat_tgt_i + np.pi) % (2 * np.pi) - np.pi
+
+        t_trans, delV, a_trans, t_wait = om.fast.coplanar_phase_different_orbs(
+            v_i, a_int[:, np.newaxis], a_tgt[np.newaxis, :])
+
+        plan = {
+            'v_i': v_i,
+            't_wait': t_wait,
+            't_trans': t_trans,
+            't_total': t_wait + t_trans,
+            'delV': delV,
+            'a_trans': a_trans,
+        }
+        return plan
+
     def get_delV_total(self):
         """
         Get total V of all the maneuvers held in the schedule
@@ -2471,8 +2906,8 @@ class CommsPayload():
     Define a communications payload.
 
     Args:
-        freq : frequency (easier for rf payloads)
-        wavelength : wavelength (easier for optical payloads)
+        freq (Hz) : frequency (easier for rf payloads)
+        wavelength (m) : wavelength (easier for optical payloads)
         p_tx (W) : Transmit power
         g_tx (dB) : Transmit gain
         sysLoss_tx (dB) : Transmit system loss
@@ -2504,19 +2939,19 @@ class CommsPayload():
         self.aperture = aperture
         self.l_line = l_line
 
+        #Plain numbers are taken as Hz and m, the missing one is a Quantity
         c = 3e8 * u.m / u.s
         if self.freq == None:
-            self.freq = c / self.wavelength
+            self.freq = (c / u.Quantity(self.wavelength, u.m)).to(u.Hz)
         elif self.wavelength == None:
-            self.wavelength = c / self.freq
+            self.wavelength = (c / u.Quantity(self.freq, u.Hz)).to(u.m)
 
     def print_instance_attributes(self):
         for attribute, value in self.__dict__.items():
             print(attribute, '=', value)
 
     def get_EIRP(self):
-        # TRY WITH ASTROPY UNITS
-        P_tx = self.p_tx
+        P_tx = u.Quantity(self.p_tx, u.W).value #W if given as a number
         P_tx_dB = 10 * np.log10(P_tx)
 
         l_tx_dB = self.l_tx
@@ -2544,11 +2979,52 @@ class CommsPayload():
         self.t_sys = Tsys
 
     def get_GonT(self):
-        # TRY WITH ASTROPY UNITS
-        T_dB = 10 * np.log10(self.t_sys)
+        T_dB = 10 * np.log10(u.Quantity(self.t_sys, u.K).value) #K if given as a number
         GonT_dB = self.g_rx - T_dB - self.l_line
         return GonT_dB
 
+    def get_link_budget(self, slantRange, EbN0_req=None, bandwidth=None, margin=0, maxRate=None):
+        """
+        Link budget at every slant range sample. Works on whole arrays
+        (ex: every time sample of every satellite/ground station pair)
+
+        Args:
+            slantRange (m) : Slant ranges (array or Quantity of any shape)
+            EbN0_req (dB) : Required Eb/N0 of the modulation and coding
+            bandwidth (Hz) : Receiver noise bandwidth. If given, the data rate is the
+                Shannon capacity instead of the rate closing the link at EbN0_req
+            margin (dB) : Link margin
+            maxRate (bit/s) : Maximum rate of the modem
+
+        Returns:
+            linkBudget (dict) : arrays shaped like slantRange
+                'L_fs' (dB) : free space loss
+                'CN0' (dB-Hz) : carrier to noise density ratio
+                'SNR' (dB) : signal to noise ratio in bandwidth (None without bandwidth)
+                'rate' (bit/s) : achievable data rate
+                'EbN0' (dB) : Eb/N0 at the achievable rate
+        """
+        D = u.Quantity(slantRange, u.m).value
+        wavelength = u.Quantity(self.wavelength, u.m).value
+        EIRP_dB = self.get_EIRP()
+        GonT_dB = self.get_GonT()
+        otherLoss_dB = self.sysLoss_tx + self.pointingErr + self.sysLoss_rx
+
+        CN0 = com.CN0_fromSlantRange(EIRP_dB, GonT_dB, D, wavelength, otherLoss_dB)
+        rate, SNR = com.dataRate_fromCN0(CN0, EbN0_req=EbN0_req, bandwidth=bandwidth,
+                                         margin=margin, maxRate=maxRate)
+        with np.errstate(divide='ignore'):
+            EbN0 = CN0 - 10 * np.log10(rate)
+
+        linkBudget = {
+            'L_fs': com.fspl_dB(D, wavelength),
+            'CN0': CN0,
+            'SNR': SNR,
+            'rate': rate,
+            'EbN0': EbN0,
+        }
+        return linkBudget
+
 class RemoteSensor():
     """
     Class to describe a remote sensor
@@ -2623,6 +3099,7 @@ class DataAccessSat():
         self.accessMask = None
         self.accessIntervalLengths = None
         self.accessElevations = None
+        self.accessSlantRanges = None
 
     def calc_access(self, constraint_type, constraint_angle):
         """
@@ -2663,7 +3140,7 @@ class DataAccessSat():
         #Get satellite altitudes
         alts = satECEFNorm - constants.R_earth
 
-        nu, ele, _ = com.slantRange_fromAltECA(alts, ECA)
+        nu, ele, slantRange = com.slantRange_fromAltECA(alts, ECA)
 
         #See what angles satisfy the constraints
         if constraint_type == 'elevation':
@@ -2716,10 +3193,48 @@ class DataAccessSat():
         self.accessIntervalLengths = intervalLengths
         self.accessIntervalLengthsLighting = intervalLengthsLighting
         self.accessElevations = ele
+        self.accessSlantRanges = slantRange
         self.time = timesAll
 
         #Remove propagated data to save space
         self.sat = self.sat.initSat
+
+    def calc_link_budget(self, commsPL, lighting=False, **kwargs):
+        """
+        Link budget at every time sample and data volume of every access pass
+
+        Parameters:
+        -----------
+        commsPL: ~satbox.CommsPayload
+            Communications payload of the link (transmit and receive sides)
+        lighting: bool
+            If True, uses the access with the daylight lighting constraint
+        kwargs:
+            EbN0_req, bandwidth, margin, maxRate of CommsPayload.get_link_budget
+
+        Returns:
+        --------
+        linkBudget: Dict
+            CommsPayload.get_link_budget arrays per time sample (rate is zero
+            outside of access) plus the access passes
+            'passStart', 'passEnd' (~astropy.time.Time) first and last sample of each pass
+            'passBytes' data volume of each pass (bytes)
+        """
+        assert self.accessSlantRanges is not None, "run calc_access() first"
+        mask = self.accessMaskLighting if lighting else self.accessMask
+        mask = np.asarray(mask, dtype=bool)
+
+        linkBudget = commsPL.get_link_budget(self.accessSlantRanges, **kwargs)
+        linkBudget['rate'] = np.where(mask, linkBudget['rate'], 0.)
+
+        tSec = (self.time - self.time[0]).sec
+        _, startIdx, endIdx, bits = com.pass_data_volumes(tSec, linkBudget['rate'], mask)
+        linkBudget['passStart'] = self.time[startIdx]
+        linkBudget['passEnd'] = self.time[endIdx]
+        linkBudget['passBytes'] = bits / 8
+
+        self.linkBudget = linkBudget
+        return linkBudget
         
     def plot_tombstone(self):
         """
@@ -2879,6 +3394,63 @@ class DataAccessConstellation():
         #Remove propagated data to reduce size of object
         self.constellation = self.constellation.initConstellation
 
+    def calc_link_budget(self, commsPL, lighting=False, **kwargs):
+        """
+        Link budget of every satellite/ground location pair at every time
+        sample and data volume of every access pass. All pairs are evaluated
+        in one array call (pairs with fewer samples are padded without access)
+
+        Parameters:
+        -----------
+        commsPL: ~satbox.CommsPayload
+            Communications payload of the links (transmit and receive sides)
+        lighting: bool
+            If True, uses the access with the daylight lighting constraint
+        kwargs:
+            EbN0_req, bandwidth, margin, maxRate of CommsPayload.get_link_budget
+
+        Returns:
+        --------
+        linkBudget: Dict
+            'satIDs', 'groundLocIDs' ids of each pair (row of the arrays)
+            CommsPayload.get_link_budget (pairs, samples) arrays (rate is zero
+            outside of access, padded samples are nan)
+            'passSatID', 'passGroundLocID' ids of the pair of each pass
+            'passStart', 'passEnd' (~astropy.time.Time) first and last sample of each pass
+            'passBytes' data volume of each pass (bytes)
+        """
+        accessData = self.allAccessData
+        assert all(data.accessSlantRanges is not None for data in accessData), "run calc_access() first"
+        numSamples = max(len(data.time) for data in accessData)
+
+        #Stack pairs, padding to the longest time series
+        slantRanges = np.full((len(accessData), numSamples), np.nan)
+        masks = np.zeros((len(accessData), numSamples), dtype=bool)
+        tSec = np.zeros((len(accessData), numSamples))
+        for rowIdx, data in enumerate(accessData):
+            numRow = len(data.time)
+            slantRanges[rowIdx, :numRow] = data.accessSlantRanges.to_value(u.m)
+            masks[rowIdx, :numRow] = data.accessMaskLighting if lighting else data.accessMask
+            tSec[rowIdx, :numRow] = (data.time - accessData[0].time[0]).sec
+            tSec[rowIdx, numRow:] = tSec[rowIdx, numRow - 1]
+
+        linkBudget = commsPL.get_link_budget(slantRanges, **kwargs)
+        linkBudget['rate'] = np.where(masks, linkBudget['rate'], 0.)
+
+        rowIdx, startIdx, endIdx, bits = com.pass_data_volumes(tSec, linkBudget['rate'], masks)
+        satIDs = np.array([data.satID for data in accessData])
+        groundLocIDs = np.array([data.groundLocID for data in accessData])
+        linkBudget['satIDs'] = satIDs
+        linkBudget['groundLocIDs'] = groundLocIDs
+        linkBudget['passSatID'] = satIDs[rowIdx]
+        linkBudget['passGroundLocID'] = groundLocIDs[rowIdx]
+        linkBudget['passStart'] = accessData[0].time[0] + tSec[rowIdx, startIdx] * u.s
+        linkBudget['passEnd'] = accessData[0].time[0] + tSec[rowIdx, endIdx] * u.s
+        linkBudget['passBytes'] = bits / 8
+
+        self.linkBudget = linkBudget
+        return linkBudget
+
     def plot_total_access(self, gLocs, plot_style = 'b-'):
         """
         plots total coverage (satellite agnostic) for a particular
@@ -13,6 +13,8 @@ from astropy import time
 
 import matplotlib.pyplot as plt
 
+import pareto
+
 def getNuIntersect(orb1, orb2):
     """Given two orbits, determine true anomaly (argument of latitude)
     of each circular orbit for the position of closest approach of the orbits
@@ -282,6 +284,167 @@ def desiredRAAN_FromPassTime(tPass, gs, i):
     
     return raans, Anoms
 
+def get_pass_times_anomalies_vec(incs, raans, gs, dates,
+                                 refVernalEquinox = astropy.time.Time("2021-03-20T0:00:00", format = 'isot', scale = 'utc')):
+    """
+    Array version of get_pass_times_anomalies for many orbits and days at once
+
+    Inputs:
+    incs (np.array, rad): Inclinations of the orbits, any shape (ex: (plane, sat))
+    raans (np.array, rad): RAANs of the orbits, same shape as incs
+    gs (GroundStation orbject from satClasses): Ground site for overpass
+    dates (astropy time object): Days for which pass times are provided, shape (day,)
+    refVernalEquinox (astropy time object): Date of vernal equinox. Default is for 2021
+
+    Outputs:
+    times (List of astropy time objects): [ascending, descending] pass times, each shape incs.shape + (day,)
+    anoms (np.array, rad): True anomalies required to complete pass, shape incs.shape + (2,).
+                           Last index is 0 for ascending pass, 1 for descending pass
+    """
+    incs = np.asarray(incs, dtype=float)
+    raans = np.asarray(raans, dtype=float)
+    lon = gs.lon.to_value(u.rad)
+    lat = gs.lat.to_value(u.rad)
+
+    delLam = np.arcsin(np.tan(lat) / np.tan(incs)) #Longitudinal offset
+    theta_GMST_a = raans + delLam - lon #ascending sidereal angle of pass
+    theta_GMST_d = raans - delLam - lon - np.pi #deescending sidereal angle of pass
+
+    delDDateDecimalYr = (dates - refVernalEquinox).to_value('year') #Decimal year value of date difference, shape (day,)
+
+    #Get solar time values for ascending and descending pass, shape incs.shape + (day,)
+    theta_GMT_a = np.mod(theta_GMST_a[..., np.newaxis] - 2*np.pi * delDDateDecimalYr + np.pi, 2*np.pi)
+    theta_GMT_d = np.mod(theta_GMST_d[..., np.newaxis] - 2*np.pi * delDDateDecimalYr + np.pi, 2*np.pi)
+
+    radToHrs = 12 / np.pi
+    tPass_a = dates + theta_GMT_a * radToHrs * u.hr
+    tPass_d = dates + theta_GMT_d * radToHrs * u.hr
+    times = [tPass_a, tPass_d]
+
+    #Anomalies from the first day's ascending pass
+    raansDesired, anoms = desiredRAAN_FromPassTime_vec(tPass_a[..., 0], gs, incs)
+
+    return times, anoms
+
+def desiredRAAN_FromPassTime_vec(tPass, gs, i):
+    """
+    Array version of desiredRAAN_FromPassTime for many pass times and inclinations at once
+
+    Inputs
+    tPass (astropy time object): Desired times of pass, any shape
+    gs (GroundStation object): Ground station/location of pass
+    i (np.array, rad): Inclinations of orbits, same shape as tPass
+
+    Outputs
+    raans (np.array, rad): shape tPass.shape + (2,). Last index is 0 for the ascending case
+                           and 1 for the descending case
+    Anoms (np.array, rad): true Anomalies (circular orbit), same layout as raans
+    """
+    theta_GMST = tPass.sidereal_time('mean', 'greenwich').to_value(u.rad) #Greenwich mean sidereal time
+
+    ## Check if astropy class. Make astropy class if not
+    if not isinstance(gs.lat, astropy.units.quantity.Quantity):
+        gs.lat = gs.lat * u.deg
+    if not isinstance(gs.lon, astropy.units.quantity.Quantity):
+        gs.lon = gs.lon * u.deg
+    if isinstance(i, astropy.units.quantity.Quantity):
+        i = i.to_value(u.rad)
+
+    dLam = np.arcsin(np.tan(gs.lat.to_value(u.rad)) / np.tan(i))
+    lon = gs.lon.to_value(u.rad)
+
+    #From Legge eqn 3.10 pg.69
+    raan_ascending = theta_GMST - dLam + lon
+    raan_descending = theta_GMST + dLam + lon + np.pi
+
+    #Get mean anomaly (assuming circular earth): https://en.wikipedia.org/wiki/Great-circle_distance
+    gsECI = gs.loc.get_gcrs(tPass).cartesian.xyz.to_value(u.m) #shape (3,) + tPass.shape
+    n2 = np.moveaxis(gsECI / np.linalg.norm(gsECI, axis=0), 0, -1) #norm of ground station vector in ECI
+
+    caList = []
+    for raan in [raan_ascending, raan_descending]:
+        n1 = np.stack([np.cos(raan), np.sin(raan), np.zeros_like(raan)], axis=-1) #RAAN in ECI norm
+        n1Xn2_norm = np.linalg.norm(np.cross(n1, n2), axis=-1)
+        n1Dn2 = np.sum(n1 * n2, axis=-1)
+        caList.append(np.arctan2(n1Xn2_norm, n1Dn2)) #Central angle
+
+    if gs.lat > 0 * u.deg and gs.lat < 90 * u.deg: #Northern Hemisphere case
+        ca_a, ca_d = caList
+    elif gs.lat < 0 * u.deg and gs.lat > -90 * u.deg: #Southern Hemisphere case
+        ca_a = 2 * np.pi - caList[0]
+        ca_d = 2 * np.pi - caList[1]
+    elif gs.lat == 0 * u.deg: #Equatorial case
+        ca_a = np.zeros(np.shape(theta_GMST))
+        ca_d = np.full(np.shape(theta_GMST), np.pi)
+    elif gs.lat == 90 * u.deg or gs.lat == -90 * u.deg: #polar cases
+        ca_a = np.full(np.shape(theta_GMST), np.pi)
+        ca_d = np.full(np.shape(theta_GMST), 3 * np.pi / 2)
+    else:
+        print("non valid latitude")
+    raans = np.stack([raan_ascending, raan_descending], axis=-1)
+    Anoms = np.stack([ca_a, ca_d], axis=-1)
+
+    return raans, Anoms
+
+def getDesiredPassOrbit(sat0, passTime, tInit, alt, inc, anom, passType, planeIdx, satIdx):
+    """
+    Desired orbit that passes the ground station at passTime, back propagated to tInit
+    (one entry of getDesiredPassOrbits)
+
+    Inputs:
+    sat0 (Satellite): Current satellite
+    passTime (astropy time object): Desired pass time
+    tInit (astropy time object): Initialization time
+    alt (astropy u.km): Altitude of the satellite
+    inc (astropy u.rad): Inclination of the satellite
+    anom (astropy u.rad): Anomaly of the satellite during the pass
+    passType (str): 'a' or 'd' for ascending or descending pass
+    planeIdx (int): Id of the plane
+    satIdx (int): Id of the satellite within the plane
+
+    Outputs:
+    backDict (Dict): See getDesiredPassOrbits
+    """
+    dataDescrip = ('*orbPass    : Desired orbit that will make the ground pass \n\
+                    *orb0       : Desired orbit back propagated to inital epoch \n\
+                    *nuBack     : Mean anomly of back propagated orbit \n\
+                    *phaseAng   : Difference in mean anomaly between desired orbit and actual orbit \n\
+                    *t2Pass     : Time until pass. Counting from initialized orbit to pass time \n\
+                    *passType   : Pass occurs on either the ascending ~a~ or descending ~d~ part of orbit \n\
+                    *planeIdx   : Id of which plane the desired satellite refers to \n\
+                    *satIdx     : Id of which satellite within the plane the desired sat refers to \n\
+                    *dataDescrip: Description of variables in this dictionary')
+
+    orbit_back = Satellite.circular(Earth,
+                                    alt=alt,
+                                    inc=inc,
+                                    raan=sat0.raan,
+                                    arglat=anom,
+                                    epoch=passTime)
+
+    # Back propagate orbits as well
+    orbit_back0 = orbit_back.propagate(tInit)
+    nu = orbit_back0.nu
+
+    # Find nu difference
+    phaseAng = sat0.nu - nu
+
+    # Find time to pass
+    t2Pass = passTime - sat0.epoch
+
+    backDict = {
+        "orbPass": orbit_back, #Desired orbit
+        "orb0": orbit_back0, #Back propagated orbits
+        "nuBack": nu,
+        "phaseAng": phaseAng,
+        "t2Pass": t2Pass,
+        "passType": passType,
+        "planeIdx": planeIdx,
+        "satIdx": satIdx,
+        "dataDescrip": dataDescrip
+    }
+    return backDict
+
 def getDesiredPassOrbits(constellation, passTimes, tInit, alts, incs, anoms):
     """
     For a constellation and ground station, returns a set of desired Satellite objects that will
@@ -302,89 +465,20 @@ def getDesiredPassOrbits(constellation, passTimes, tInit, alts, incs, anoms):
     passOrbits_a = []  # Index is passOrbits_a[plane][sat][day]
     passOrbits_d = []
     passOrbits = []
-    dataDescrip = ('*orbPass    : Desired orbit that will make the ground pass \n\
-                    *orb0       : Desired orbit back propagated to inital epoch \n\
-                    *nuBack     : Mean anomly of back propagated orbit \n\
-                    *phaseAng   : Difference in mean anomaly between desired orbit and actual orbit \n\
-                    *t2Pass     : Time until pass. Counting from initialized orbit to pass time \n\
-                    *passType   : Pass occurs on either the ascending ~a~ or descending ~d~ part of orbit \n\
-                    *planeIdx   : Id of which plane the desired satellite refers to \n\
-                    *satIdx     : Id of which satellite within the plane the desired sat refers to \n\
-                    *dataDescrip: Description of variables in this dictionary')
 
     for idxPlane, plane in enumerate(passTimes):
         planeSats_a = []
         planeSats_d = []
         for idxSat, sat in enumerate(plane):
-            satTimes_a = []
-            satTimes_d = []
-
             sat0 = constellation.planes[idxPlane].sats[idxSat] #Get current satellite
-            sat0Epoch = sat0.epoch
-            sat0Nu = sat0.nu
-            for idxTime, times_a in enumerate(sat[0]):
-                orbit_back_a = Satellite.circular(Earth, 
-                                                  alt=alts[idxPlane][idxSat],
-                                                  inc=incs[idxPlane][idxSat],
-                                                  raan=constellation.planes[idxPlane].sats[idxSat].raan,
-                                                  arglat=anoms[idxPlane][idxSat][0],
-                                                  epoch=times_a)
-
-                # Back propagate orbits as well
-                orbit_back0_a = orbit_back_a.propagate(tInit)
-                nu = orbit_back0_a.nu
-
-                # Find nu difference
-                phaseAng = sat0Nu - nu
-
-                # Find time to pass
-                t2Pass = times_a - sat0Epoch
-
-                backDict = {
-                    "orbPass": orbit_back_a, #Desired orbit
-                    "orb0": orbit_back0_a, #Back propagated orbits
-                    "nuBack": nu,
-                    "phaseAng": phaseAng,
-                    "t2Pass": t2Pass,
-                    "passType": 'a',
-                    "planeIdx": idxPlane,
-                    "satIdx": idxSat,
-                    "dataDescrip": dataDescrip
-                }
-                satTimes_a.append(backDict)
-                passOrbits.append(backDict)
-
-            for idxTime, times_d in enumerate(sat[1]):
-                orbit_back_d = Satellite.circular(Earth,
-                                                  alt=alts[idxPlane][idxSat],
-                                                  inc=incs[idxPlane][idxSat], 
-                                                  raan=constellation.planes[idxPlane].sats[idxSat].raan,
-                                                  arglat=anoms[idxPlane][idxSat][1],
-                                                  epoch=times_d)
-
-                # Back propagate orbits as well
-                orbit_back0_d = orbit_back_d.propagate(tInit)
-                nu = orbit_back0_d.nu
-
-                # Find nu difference
-                phaseAng = sat0Nu - nu
-
-                # Find time to pass
-                t2Pass = times_d - sat0Epoch
-
-                backDict = {
-                    "orbPass": orbit_back_d,
-                    "orb0": orbit_back0_d, #Back propagated orbits
-                    "nuBack": nu,
-                    "phaseAng": phaseAng,
-                    "t2Pass": t2Pass,
-                    "passType": 'd',
-                    "planeIdx": idxPlane,
-                    "satIdx": idxSat,
-                    "dataDescrip": dataDescrip
-                }
-                satTimes_d.append(backDict)
-                passOrbits.append(backDict)
+            satTimes_a = [getDesiredPassOrbit(sat0, times_a, tInit, alts[idxPlane][idxSat], incs[idxPlane][idxSat],
+                                              anoms[idxPlane][idxSat][0], 'a', idxPlane, idxSat)
+                          for times_a in sat[0]]
+            satTimes_d = [getDesiredPassOrbit(sat0, times_d, tInit, alts[idxPlane][idxSat], incs[idxPlane][idxSat],
+                                              anoms[idxPlane][idxSat][1], 'd', idxPlane, idxSat)
+                          for times_d in sat[1]]
+            passOrbits.extend(satTimes_a)
+            passOrbits.extend(satTimes_d)
 
             planeSats_a.append(satTimes_a)
             planeSats_d.append(satTimes_d)
@@ -408,28 +502,9 @@ def findNonDominated(timesPassFlat, delVFlat):
     timesEff (np.array): array of the most efficient values from timesPassFlat
     delVEff (np.array): array of the most efficient valuees from delVFlat
     """
-    idSort = np.argsort(timesPassFlat)
-
-    timesSorted = timesPassFlat[idSort]
-    delVSorted = delVFlat[idSort]
-
-    timesInLoop = np.copy(timesSorted)
-    delVInLoop = np.copy(delVSorted)
-
-    is_efficient = np.arange(timesSorted.shape[0])
-    n_points = timesSorted.shape[0]
-    next_pt_idx = 0
-    while next_pt_idx < len(timesInLoop):
-        # Find delta Vs that took less fuel, but more time
-        # Already starting with 'fastest' time because times werre sorted
-        nondominated_point_mask = delVInLoop < delVInLoop[next_pt_idx]
-        nondominated_point_mask[:next_pt_idx+1] = True
-        is_efficient = is_efficient[nondominated_point_mask]
-        timesInLoop = timesInLoop[nondominated_point_mask]
-        delVInLoop = delVInLoop[nondominated_point_mask]
-        next_pt_idx += 1
-    timesEff = timesSorted[is_efficient]
-    delVEff = delVSorted[is_efficient]
+    paretoIdx = pareto.pareto_indices(np.column_stack((timesPassFlat, delVFlat)), unique=True)
+    timesEff = timesPassFlat[paretoIdx]
+    delVEff = delVFlat[paretoIdx]
     return timesEff, delVEff
 
 def findParetoIds(delVEff, timesEff, t_a, t_d, delv_a, delv_d):
@@ -502,67 +577,32 @@ def getPassSats(constellation, gs, tInit, daysAhead, plot = False, savePlot = Fa
     
     dayArray = np.arange(0, daysAhead + 1)
     days2InvestigateMJD = list(tInitMJD + dayArray) #Which days to plan over
-    days2Investigate = [time.Time(dayMJD, format='mjd', scale='utc')
-                        for dayMJD in days2InvestigateMJD]
-
-    passTimes = []  # First layer down depicts satellites in a plane. Second layer depicts individual satellites in a plane. 3rd layer 1st idx is for ascending pass, 2nd idx is for descending pass, 4th idx is pass corresopnding to day after initialization
-    anoms = []
-    aSats = getSatValues_const(constellation, 'a') #Semi Major axes
-    alts = [[sat.a - poliastro.constants.R_earth for sat in plane.sats] for plane in constellation.planes]
-    incs = getSatValues_const(constellation, 'inc')
-    for plane in constellation.planes:
-        passTimesPlane = []
-        anomaliesPlane = []
-        incPlane = []
-        for sat in plane.sats:
-            passTime, anom = get_pass_times_anomalies(
-                sat, gs, days2Investigate)
-            
-            #Append to each list representing each plane
-            passTimesPlane.append(passTime)
-            anomaliesPlane.append(anom)
-            
-        passTimes.append(passTimesPlane)
-        anoms.append(anomaliesPlane)
-
-    passOrbits_a, passOrbits_d, passOrbits = getDesiredPassOrbits(constellation, 
-                                                      passTimes, 
-                                                      tInit,
-                                                      alts, 
-                                                      incs, 
-                                                      anoms)
-    # import ipdb; ipdb.set_trace()
-    # Extract nus and times
-    phaseAngs_a_raw = [[[satID["phaseAng"] for satID in sat]
-                        for sat in plane] for plane in passOrbits_a]
-    phaseAngs_d_raw = [[[satID["phaseAng"] for satID in sat]
-                        for sat in plane] for plane in passOrbits_d]
-#     phaseAngs_a_raw = getSatValues_constPlan(passOrbits_a, 'phaseAng')
-#     phaseAngs_d_raw = getSatValues_constPlan(passOrbits_d, 'phaseAng')
-
-    phaseAngs_a = [[[np.mod(ang, 360 * u.deg) - 180 * u.deg for ang in sat]
-                    for sat in plane] for plane in phaseAngs_a_raw]
-    phaseAngs_d = [[[np.mod(ang, 360 * u.deg) - 180 * u.deg for ang in sat]
-                    for sat in plane] for plane in phaseAngs_d_raw]
-
-    t2obs_a = [[[satID["t2Pass"] for satID in sat]
-                for sat in plane] for plane in passOrbits_a]
-    t2obs_d = [[[satID["t2Pass"] for satID in sat]
-                for sat in plane] for plane in passOrbits_d]
-
-    timesSec_a = [[[timeVal.to_value('s') for timeVal in sat]
-                   for sat in plane] for plane in t2obs_a]
-    timesSec_d = [[[timeVal.to_value('s') for timeVal in sat]
-                   for sat in plane] for plane in t2obs_d]
-
-    timesArr_a = np.array(timesSec_a)
-    timesArr_d = np.array(timesSec_d)
-
-    period = [[sat.period.value for sat in plane.sats] for plane in constellation.planes]
-    periodArr = np.array(period)
-
-    semiMajors = [[sat.a.to(u.m).value for sat in plane.sats] for plane in constellation.planes]
-    semiMajorArr = np.array(semiMajors)
+    days2Investigate = time.Time(days2InvestigateMJD, format='mjd', scale='utc')
+
+    # Orbit parameters as (plane, sat) arrays
+    sats = [plane.sats for plane in constellation.planes]
+    incArr = np.array([[sat.inc.to_value(u.rad) for sat in plane] for plane in sats])
+    raanArr = np.array([[sat.raan.to_value(u.rad) for sat in plane] for plane in sats])
+    nuArr = np.array([[sat.nu.to_value(u.rad) for sat in plane] for plane in sats])
+    semiMajorArr = np.array([[sat.a.to_value(u.m) for sat in plane] for plane in sats])
+    periodArr = np.array([[sat.period.value for sat in plane] for plane in sats])
+    epochSec = np.array([[(sat.epoch - tInit).to_value(u.s) for sat in plane] for plane in sats])
+
+    # Pass times (plane, sat, day) and anomalies (plane, sat, pass type)
+    passTimes, anoms = get_pass_times_anomalies_vec(incArr, raanArr, gs, days2Investigate)
+    passSec_a = (passTimes[0] - tInit).to_value(u.s)
+    passSec_d = (passTimes[1] - tInit).to_value(u.s)
+
+    # Time until pass, counted from each satellite's epoch
+    timesArr_a = passSec_a - epochSec[..., np.newaxis]
+    timesArr_d = passSec_d - epochSec[..., np.newaxis]
+
+    # Phase angle between each satellite and its desired pass orbit back propagated (two body, circular) to tInit
+    meanMotion = np.sqrt(poliastro.constants.GM_earth.to_value(u.m**3 / u.s**2) / semiMajorArr**3)[..., np.newaxis]
+    nuBack_a = anoms[..., 0:1] - meanMotion * passSec_a
+    nuBack_d = anoms[..., 1:2] - meanMotion * passSec_d
+    phaseAngsArr_a = np.mod(nuArr[..., np.newaxis] - nuBack_a, 2 * np.pi) - np.pi
+    phaseAngsArr_d = np.mod(nuArr[..., np.newaxis] - nuBack_d, 2 * np.pi) - np.pi
 
     if timesArr_a.ndim != periodArr.ndim:
         periodArr = np.repeat(periodArr[:, :, np.newaxis], np.shape(timesArr_a)[-1], axis=2)
@@ -572,11 +612,6 @@ def getPassSats(constellation, gs, tInit, daysAhead, plot = False, savePlot = Fa
     orbRaw_d = timesArr_d / periodArr
     orbKInt_d = orbRaw_d.astype(int)
 
-    phaseAngsArr_a = [[[ang.to(u.rad).value for ang in sat]
-                       for sat in plane] for plane in phaseAngs_a]
-    phaseAngsArr_d = [[[ang.to(u.rad).value for ang in sat]
-                       for sat in plane] for plane in phaseAngs_d]
-
     t_a, delv_a, delv1_a, delv2_a, aphase_a, flag_a = t_phase_coplanar(
         semiMajorArr, phaseAngsArr_a, orbKInt_a, orbKInt_a)
     t_d, delv_d, delv1_d, delv2_d, aphase_d, flag_d = t_phase_coplanar(
@@ -641,10 +676,15 @@ def getPassSats(constellation, gs, tInit, daysAhead, plot = False, savePlot = Fa
             'tAll'    : tAll_out
     }
 
-    ## Get feasible orbits
-    orb_a_out =  [passOrbits_a[x[0]][x[1]][x[2]] for x,t in zip(ids, tags) if t == 'a']#[passOrbits_a[tuple(x)] for x,t in zip(ids, tags) if t == 'a']
-    orb_d_out =  [passOrbits_d[x[0]][x[1]][x[2]] for x,t in zip(ids, tags) if t == 'd']#[passOrbits_d[tuple(x)] for x,t in zip(ids, tags) if t == 'd']
-    # orb_a_out_test = [passOrbits_a[x[0]][x[1]][x[2]] if t == 'a' else None for x,t in zip(ids, tags)]#[passOrbits_a[tuple(x)] for x,t in zip(ids, tags) if t == 'a']
+    ## Get feasible orbits (only the pareto orbits are built)
+    def passOrbit(x, t):
+        passTypeIdx = 0 if t == 'a' else 1
+        sat0 = sats[x[0]][x[1]]
+        return getDesiredPassOrbit(sat0, passTimes[passTypeIdx][tuple(x)], tInit,
+                                   sat0.a - poliastro.constants.R_earth, sat0.inc,
+                                   anoms[x[0], x[1], passTypeIdx] * u.rad, t, x[0], x[1])
+    orb_a_out = [passOrbit(x, t) for x,t in zip(ids, tags) if t == 'a']
+    orb_d_out = [passOrbit(x, t) for x,t in zip(ids, tags) if t == 'd']
     orb_a_ids = [idx for idx,t in zip(ids, tags) if t == 'a']
     orb_d_ids = [idx for idx,t in zip(ids, tags) if t == 'd']
     orbOut = {
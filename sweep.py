@@ -0,0 +1,267 @@
+##Design sweep runner for temporal resolution studies
+
+import os
+import json
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+from astropy import time
+
+import satbox as sb
+import utils
+
+
+def get_sweep_points(totalSats, incs, alts):
+    """
+    Gets the design points of a walker constellation sweep: every t/p/f
+    combination (utils.get_walker_params) for each inclination and altitude
+
+    Parameters
+    ----------
+    totalSats: int or list of int
+        Total number of satellites in the constellation
+    incs: ~astropy.unit.Quantity
+        Inclinations to sweep
+    alts: ~astropy.unit.Quantity
+        Altitudes to sweep
+
+    Returns
+    -------
+    points: list of Dict
+        Design points with keys t, p, f, i_deg, alt_km
+    """
+    if np.isscalar(totalSats):
+        totalSats = [totalSats]
+    points = []
+    for t in totalSats:
+        for walkerParams in utils.get_walker_params(int(t)):
+            for inc in np.atleast_1d(incs.to_value(u.deg)):
+                for alt in np.atleast_1d(alts.to_value(u.km)):
+                    points.append({'t': int(walkerParams[0]),
+                                   'p': int(walkerParams[1]),
+                                   'f': int(walkerParams[2]),
+                                   'i_deg': float(inc),
+                                   'alt_km': float(alt)})
+    return points
+
+def get_run_config(gs, ascendDescend=True, epoch=False, altChange=100*u.km, constraint_type='nadir',
+                   constraint_angle=25*u.deg, t2propagate=5*u.day, tStep=15*u.s):
+    """
+    Run settings of run_temp_resolution_sweep shared by every design point,
+    as plain values that can be stored next to the results
+
+    Parameters
+    ----------
+    See run_temp_resolution_sweep
+
+    Returns
+    -------
+    config: Dict
+        Keys gs_lon_deg, gs_lat_deg, gs_h_m, ascendDescend, epoch (utc isot,
+        None for J2000), altChange_km, constraint_type, constraint_angle_deg,
+        t2propagate_s, tStep_s
+    """
+    config = {'gs_lon_deg': float(gs.loc.lon.deg),
+              'gs_lat_deg': float(gs.loc.lat.deg),
+              'gs_h_m': float(gs.loc.height.to_value(u.m)),
+              'ascendDescend': bool(ascendDescend),
+              'epoch': None if epoch is False else time.Time(epoch).utc.isot,
+              'altChange_km': float(altChange.to_value(u.km)),
+              'constraint_type': constraint_type,
+              'constraint_angle_deg': float(constraint_angle.to_value(u.deg)),
+              't2propagate_s': float(t2propagate.to_value(u.s)),
+              'tStep_s': float(tStep.to_value(u.s))}
+    return config
+
+def get_point_key(point, config=None):
+    """
+    Unique key of a design point under a run config (see get_run_config),
+    used to find completed points in the results store
+    """
+    if config is not None:
+        point = dict(point, **config)
+    return json.dumps(point, sort_keys=True)
+
+def load_sweep_results(storePath, includeFailed=False, points=None, config=None):
+    """
+    Loads the results store written by run_temp_resolution_sweep
+
+    A truncated last line (run interrupted while writing) is ignored
+
+    Parameters
+    ----------
+    storePath: str
+        Path to the results store (json lines, one design point per line)
+    includeFailed: bool
+        If True, also returns the points whose evaluation raised an error
+    points: list of Dict
+        If given, only returns these design points
+    config: Dict
+        Run config of points (see get_run_config)
+
+    Returns
+    -------
+    results: ~pandas.DataFrame
+        One row per design point and run config (later records of the same
+        point replace earlier ones)
+    """
+    records = _read_store(storePath, includeFailed=includeFailed)
+    if points is not None:
+        keys = [get_point_key(point, config) for point in points]
+        records = {key: records[key] for key in dict.fromkeys(keys) if key in records}
+    results = pd.DataFrame(list(records.values()))
+    if len(results):
+        results = results.drop(columns='key')
+        if not includeFailed:
+            results = results.drop(columns='error')
+    return results
+
+def _read_store(storePath, includeFailed=False):
+    "Records of the results store by point key (last record of a point wins)"
+    records = {}
+    if os.path.exists(storePath):
+        with open(storePath, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError: #Partially written line
+                    continue
+                if record.get('error') is not None and not includeFailed:
+                    continue
+                records[record['key']] = record
+    return records
+
+def _seconds(values):
+    "Float seconds of a list of TimeDeltas or time Quantities"
+    return np.array([time.TimeDelta(v).sec for v in values], dtype=float)
+
+def _eval_temp_resolution_point(args):
+    """
+    Process pool task of run_temp_resolution_sweep. Builds the walker
+    constellation of a design point and summarizes its temporal resolution
+    """
+    point, config, gs, ascendDescend, epoch, kwargs = args
+    t0 = perf_counter()
+    record = dict(point, **config)
+    record['key'] = get_point_key(point, config)
+    try:
+        constellation = sb.Constellation.from_walker(point['i_deg'] * u.deg, point['t'], point['p'],
+                                                     point['f'], point['alt_km'] * u.km, epoch=epoch)
+        if ascendDescend:
+            output = utils.calc_temp_resolution_ascend_descend(constellation, gs, **kwargs)
+        else:
+            output = utils.calc_temp_resolution(constellation, gs, **kwargs)
+
+        revisits = _seconds(output['dataOut']['startResolutions'])
+        driftTimes = _seconds(list(output['driftTimes'].values()))
+
+        record['numSenseSats'] = len(output['driftTimes'])
+        record['revisitMean_s'] = float(np.mean(revisits)) if revisits.size else np.nan
+        record['revisitMax_s'] = float(np.max(revisits)) if revisits.size else np.nan
+        record['revisitMin_s'] = float(np.min(revisits)) if revisits.size else np.nan
+        record['driftTimeMean_s'] = float(np.mean(driftTimes)) if driftTimes.size else np.nan
+        record['driftTimeMax_s'] = float(np.max(driftTimes)) if driftTimes.size else np.nan
+        record['error'] = None
+    except Exception as e: #Recorded so the rest of the sweep keeps going
+        record['error'] = repr(e)
+    record['evalTime_s'] = perf_counter() - t0
+    return record
+
+def _ends_with_newline(storePath):
+    with open(storePath, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+def _append_record(f, record):
+    "Appends a record to the open results store and flushes it to disk"
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+def run_temp_resolution_sweep(points, gs, storePath, ascendDescend=True, epoch=False,
+                              altChange=100*u.km, constraint_type='nadir', constraint_angle=25*u.deg,
+                              t2propagate=5*u.day, tStep=15*u.s, workers=None, verbose=False):
+    """
+    Evaluates the temporal resolution of walker constellation design points
+    (utils.calc_temp_resolution_ascend_descend or utils.calc_temp_resolution)
+
+    Each result is appended to the results store as soon as it finishes, and
+    points already in the store are skipped, so an interrupted sweep is resumed
+    by calling this again with the same storePath. A point is only skipped if
+    it was run with the same ground location and settings (get_run_config), so
+    several runs can share a store. Points that raised an error are retried
+
+    Parameters
+    ----------
+    points: list of Dict
+        Design points (see get_sweep_points)
+    gs: ~satbox.groundLoc class
+        Ground location to target for observing
+    storePath: str
+        Path to the append-only results store (json lines)
+    ascendDescend: bool
+        If True, uses calc_temp_resolution_ascend_descend (two satellites per
+        plane), otherwise calc_temp_resolution
+    epoch: ~astropy.time.Time
+        Epoch of the walker constellations. Default of False defines satellites at J2000
+    altChange: ~astropy.unit.Quantity
+        Altitude change to get to drift orbit
+    constraint_type: ~string | "nadir" or "elevation"
+        constrain angles with either a "nadir" or "elevation" constraint
+    constraint_angle: ~astropy.unit.Quantity
+        angle used as the access threshold to determine access calculation
+    t2propagate: ~astropy.unit.Quantity
+        Amount of time to Propagate starting from satellite.epoch
+    tStep: ~astropy.unit.Quantity
+        Time step used in the propagation
+    workers: int
+        If greater than 1, design points are evaluated on a process pool of this size
+    verbose: Boolean
+        Prints out progress if True
+
+    Returns
+    -------
+    results: ~pandas.DataFrame
+        One row per completed design point of points: design parameters (t, p,
+        f, i_deg, alt_km), run config (see get_run_config), numSenseSats,
+        revisitMean_s, revisitMax_s, revisitMin_s, driftTimeMean_s,
+        driftTimeMax_s, evalTime_s
+    """
+    config = get_run_config(gs, ascendDescend=ascendDescend, epoch=epoch, altChange=altChange,
+                            constraint_type=constraint_type, constraint_angle=constraint_angle,
+                            t2propagate=t2propagate, tStep=tStep)
+    doneKeys = set(_read_store(storePath).keys())
+    todo = [point for point in points if get_point_key(point, config) not in doneKeys]
+    if verbose:
+        print(f"{len(points) - len(todo)} of {len(points)} design points already in {storePath}")
+
+    kwargs = {'altChange': altChange,
+              'constraint_type': constraint_type,
+              'constraint_angle': constraint_angle,
+              't2propagate': t2propagate,
+              'tStep': tStep,
+              'verbose': False}
+    tasks = [(point, config, gs, ascendDescend, epoch, kwargs) for point in todo]
+
+    with open(storePath, 'a') as f:
+        if f.tell() > 0 and not _ends_with_newline(storePath): #Close a partially written line
+            f.write('\n')
+        if workers is not None and workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_eval_temp_resolution_point, task) for task in tasks]
+                for count, future in enumerate(as_completed(futures)):
+                    record = future.result()
+                    _append_record(f, record)
+                    if verbose:
+                        print(f"{count + 1}/{len(tasks)}: {record['key']} error={record['error']}")
+        else:
+            for count, task in enumerate(tasks):
+                record = _eval_temp_resolution_point(task)
+                _append_record(f, record)
+                if verbose:
+                    print(f"{count + 1}/{len(tasks)}: {record['key']} error={record['error']}")
+
+    return load_sweep_results(storePath, points=points, config=config)
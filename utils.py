@@ -27,44 +27,39 @@ import matplotlib.pyplot as plt
 
 import satbox as sb
 import orbitalMechanics as om
+import routing
+import pareto
+from cache import LRUCache
 
 
+def _attr_array(flatArray, attribute):
+    "Float array of a (possibly dotted) attribute of each instance, Quantities given by value"
+    keyfun = operator.attrgetter(attribute)
+    values = [keyfun(f) for f in flatArray]
+    return np.array([getattr(v, 'value', v) for v in values], dtype=float)
+
 def find_non_dominated_time_deltaV(flatArray):
     """
     Find non-dominated trade space instances when looking at time to pass and delta V value
-    of manuever to achieve the pass
-
-    ToDo: Need to look back in code to figure out what this is doing in more detail
-    """
-    keyfun = operator.attrgetter('time2Pass.value')
-    flatSort = copy.deepcopy(flatArray)
-    flatSort.sort(key=keyfun) # Sort list by key value (usually time2Pass.value)
-    next_idx = 0
-    paretoList = copy.deepcopy(flatSort) #List of efficient points that will continually be cut
-    paretoSats = [] #List of satellites on pareto front
-    while next_idx < len(paretoList) and next_idx < 100:
-        best = paretoList[next_idx] #Best satellite, lowest value by key
-        paretoList = [f for f in paretoList if f.deltaV < best.deltaV] #Cut out all longer times that take more deltaV
-        paretoSats.append(best) #Add best satellite to list
-    return paretoSats
+    of manuever to achieve the pass (see pareto.pareto_indices)
+
+    Returns the instances sorted by time to pass, without copying them
+    """
+    return find_non_dominated(flatArray, 'time2Pass.value', 'deltaV')
 
 def find_non_dominated(flatArray, attribute1, attribute2):
     """
-    find non-dominated trade space instances between two attributes, attribute 1 and attribute 2
-    
-    ToDo: Need to look back in code to figure out how this is working
-
-    """
-    keyfun = operator.attrgetter(attribute1)
-    flatSort = copy.deepcopy(flatArray)
-    flatSort.sort(key=keyfun) # Sort list by key value (usually time2Pass.value)
-    next_idx = 0
-    paretoList = copy.deepcopy(flatSort) #List of efficient points that will continually be cut
-    paretoSats = [] #List of satellites on pareto front
-    while next_idx < len(paretoList) and next_idx < 100:
-        best = paretoList[next_idx] #Best satellite, lowest value by key
-        paretoList = [f for f in paretoList if getattr(f, attribute2) < gettattr(best, attribute2)] #Cut out all longer times that take more deltaV
-        paretoSats.append(best) #Add best satellite to list
+    find non-dominated trade space instances between two attributes, attribute 1 and attribute 2,
+    both minimized (see pareto.pareto_indices)
+
+    Returns the instances sorted by attribute1, without copying them.
+    Only the first of instances with the same attribute values is kept
+    """
+    if len(flatArray) == 0:
+        return []
+    points = np.column_stack((_attr_array(flatArray, attribute1), _attr_array(flatArray, attribute2)))
+    paretoIdx = pareto.pareto_indices(points, unique=True)
+    paretoSats = [flatArray[idx] for idx in paretoIdx] #List of satellites on pareto front
     return paretoSats
     
 def flatten(x): # Flattens a nested list
@@ -469,6 +464,81 @@ def get_false_intervals(mask, refArray):
 
     return startStopIntervals
 
+def remove_short_intervals(masks, refArray, minLength):
+    """
+    Sets runs of True values that are shorter than minLength to False, for one
+    mask or a stack of masks at once. Runs are found by labelling the diff of
+    the masks, so there is no loop over intervals.
+
+    Uses the same intervals as get_start_stop_intervals: a run is measured from
+    the sample before its first True entry (or from the first sample if the
+    run starts the array) to its last True entry, and a run that starts the
+    array keeps its first entry
+
+    Args
+        masks (array of bools) : Array of booleans (T,) or stack of arrays (N, T)
+        refArray (astropy Time) : Times of the mask entries (T,)
+        minLength (astropy Quantity) : Runs shorter than this are removed
+
+    Returns
+        trimmedMasks (array of bools) : Copy of masks with the short runs removed
+    """
+    masks = np.asarray(masks, dtype=bool)
+    masks2D = np.atleast_2d(masks)
+    numMasks, numTimes = masks2D.shape
+
+    #Label runs with the diff of the zero padded masks
+    padded = np.zeros((numMasks, numTimes + 2), dtype=np.int8)
+    padded[:, 1:-1] = masks2D
+    runEdges = np.diff(padded, axis=1)
+    runMask, runStart = np.nonzero(runEdges == 1)
+    _, runEnd = np.nonzero(runEdges == -1) #One past the last True entry
+
+    if len(runStart) == 0:
+        return masks.copy()
+
+    leadIdx = np.maximum(runStart - 1, 0)
+    runLengths = (refArray[runEnd - 1] - refArray[leadIdx]).to(u.min) #One Time difference for all runs
+    short = np.atleast_1d(runLengths < minLength)
+
+    #Entries to clear, as +1/-1 markers that are cumsummed into a mask
+    clearStart = np.maximum(runStart[short], 1)
+    clearEnd = runEnd[short]
+    clearRows = runMask[short]
+    keep = clearStart < clearEnd
+    markers = np.zeros((numMasks, numTimes + 1), dtype=np.int32)
+    np.add.at(markers, (clearRows[keep], clearStart[keep]), 1)
+    np.add.at(markers, (clearRows[keep], clearEnd[keep]), -1)
+    clearMask = np.cumsum(markers, axis=1)[:, :-1] > 0
+
+    trimmedMasks = masks2D & ~clearMask
+    return trimmedMasks.reshape(masks.shape)
+
+def remove_short_contacts(contactMasks, contactTimes, minLength):
+    """
+    Applies remove_short_intervals to a dictionary of contact masks. Masks
+    that share the same time array are trimmed together in one call
+
+    Args
+        contactMasks (dict) : Boolean arrays of contacts, keys of the form 'i-j'
+        contactTimes (dict) : astropy times of each contact mask
+        minLength (astropy Quantity) : Contacts shorter than this are removed
+
+    Returns
+        trimmedMasks (dict) : Trimmed contact masks with the same keys
+    """
+    timeGroups = {}
+    for key in contactMasks:
+        timeGroups.setdefault(id(contactTimes[key]), []).append(key)
+
+    trimmedMasks = {}
+    for keys in timeGroups.values():
+        stacked = np.stack([contactMasks[key] for key in keys])
+        trimmed = remove_short_intervals(stacked, contactTimes[keys[0]], minLength)
+        for key, mask in zip(keys, trimmed):
+            trimmedMasks[key] = mask
+    return {key: trimmedMasks[key] for key in contactMasks}
+
 class TimeVaryingGraph(object):
     def __init__(self, contacts, relaySats):
         """
@@ -486,12 +556,16 @@ class TimeVaryingGraph(object):
             -----
         relay_sats: ~list
             List of sat IDs for the satellites that can act as relays
-        
+
+        The adjacency index (routing.ContactGraph) is built once here so that
+        neighbor queries are O(degree) and edge values are a binary search over
+        the contact windows of the edge. Only edges between relay nodes are indexed.
         """
         self.contacts = contacts.get('contacts')
         self.contactTimes = contacts.get('time')
         relaySatsStr = [str(s) for s in relaySats]
         self.relaySats = relaySatsStr
+        self.index = routing.ContactGraph(contacts, relaySatsStr)
     
     def get_relay_sats(self):
         "Returns the nodes of the graph."
@@ -508,35 +582,16 @@ class TimeVaryingGraph(object):
             are considered
         
         """
-        
-        connections = []
-        for key in self.contacts.keys(): #loop over each pair of nodes
-            sats = key.split('-')
-            satSource = sats[0]
-            if satSource != str(node):
-                continue
-            satDestination = sats[1]
-            
-            currentTimeMask = currentTime < self.contactTimes.get(key)
-            
-            relevantContacts = self.contacts.get(key)[currentTimeMask]
-            if any(relevantContacts):
-                connections.append(satDestination)
-        return connections
+        currentTimeSec = routing.time_to_seconds(currentTime, self.index.refTime)
+        return self.index.get_outgoing_edges(node, currentTimeSec)
     
     def value(self, node1, node2, currentTime):
         "Returns the value of an edge between two nodes."
-        key = f'{node1}-{node2}'
+        currentTimeSec = routing.time_to_seconds(currentTime, self.index.refTime)
         
         #Only care about future contacts
-        currentTimeMask = currentTime < self.contactTimes.get(key)
-        
-        #Time array and contacts array truncated so only future times available
-        relevantTime = self.contactTimes.get(key)[currentTimeMask]
-        relevantContacts = self.contacts.get(key)[currentTimeMask]
-        
-        firstContactIdx = np.argmax(relevantContacts)
-        timeOfFirstContact = relevantTime[firstContactIdx]
+        tContactSec = self.index.next_contact(node1, node2, currentTimeSec)
+        timeOfFirstContact = routing.seconds_to_time(tContactSec, self.index.refTime)
         
         time2FirstContact = timeOfFirstContact - currentTime        
         
@@ -628,6 +683,37 @@ def print_dijkstra_result(previous_nodes, shortest_path, start_node, target_node
 
     return pathStr
 
+def get_pass_downlink(previous_nodes, shortest_path, sat, groundStationNodes):
+    """
+    Gets the fastest downlink of one pass from its Dijkstra result
+
+    Parameters
+    ----------
+    previous_nodes: ~dict
+        Output of time_varying_dijkstra_algorithm()
+    shortest_path: ~dict
+        Output of time_varying_dijkstra_algorithm()
+    sat: ~str
+        Sensing satellite (start node)
+    groundStationNodes: ~list
+        Ground station nodes
+
+    Returns
+    -------
+    downlink: ~dict
+        Time of the fastest downlink keyed by the ground station
+    path: ~list
+        Nodes along the route to that ground station (None for empty passes)
+    """
+    downlinkOptions = {my_key: shortest_path[my_key] for my_key in groundStationNodes}
+    quickestDownlinkKey = min(downlinkOptions, key=downlinkOptions.get)
+    downlink = {f'{quickestDownlinkKey}': downlinkOptions.get(quickestDownlinkKey)}
+
+    path = None
+    if any(previous_nodes) and quickestDownlinkKey in previous_nodes.keys(): #Check for empty passes
+        path = print_dijkstra_result(previous_nodes, shortest_path, start_node=sat, target_node=quickestDownlinkKey)
+    return downlink, path
+
 def prep_dijkstra(constellation, groundStations, groundTarget,
                          recon=True,
                          altChange=100*u.km,
@@ -637,6 +723,8 @@ def prep_dijkstra(constellation, groundStations, groundTarget,
                          constraint_angle_sense=20*u.deg,
                          t2propagate=3*u.day,
                          tStep=15*u.s,
+                         workers=None,
+                         topK=None,
                          verbose=False):
     """
     Propagates satellites and creates schedules in preparation for Dijkstra routing
@@ -667,6 +755,13 @@ def prep_dijkstra(constellation, groundStations, groundTarget,
         Amount of time to Propagate starting from satellite.epoch
     tStep: ~astropy.unit.Quantity
         Time step used in the propagation
+    workers: int
+        Number of processes used to generate the satellite schedules
+        (see satbox.Constellation.gen_GOM_2_RGT_scheds)
+    topK: int
+        If given, only the topK satellites per plane and pass type with the
+        lowest estimated drift times are scheduled
+        (see satbox.Constellation.rank_sats_by_drift_time)
     verbose: Boolean
         Prints out debug statements if True
 
@@ -695,7 +790,7 @@ def prep_dijkstra(constellation, groundStations, groundTarget,
         print("Step 1 of 5: Generating Schedule")
 
     t0_sched = perf_counter()
-    schedDict = constellation.gen_GOM_2_RGT_scheds(altChange, groundTarget)
+    schedDict = constellation.gen_GOM_2_RGT_scheds(altChange, groundTarget, workers=workers, topK=topK)
     tf_sched = perf_counter()
 
     t_sched = tf_sched - t0_sched
@@ -754,6 +849,9 @@ def run_dijkstra_routing(prep_dijkstra_output,
                          downlinkTimeThreshold=30*u.s,
                          lightingRestraint = False,
                          simTime = 3*u.day,
+                         fastRun=True,
+                         sweep=False,
+                         workers=None,
                          verbose=False):
     """
     Run the dijkstra routing given the data prepared in prep_dijkstra
@@ -776,6 +874,18 @@ def run_dijkstra_routing(prep_dijkstra_output,
         Ground contact must be longer than this to transmit the images in full
     lightingRestraint: Boolean
         If true, implements lighting restraint (TODO: This can be optimized in the workflow where we only calculate it once)
+    fastRun: Boolean
+        If true, routes with the heap based routing.earliest_arrival_dijkstra over
+        precomputed contact windows instead of time_varying_dijkstra_algorithm
+    sweep: Boolean
+        If true, gets the downlink time of every pass with one
+        routing.earliest_arrival_sweep instead of one Dijkstra per pass.
+        Only downlinks_all is filled; paths_all, previous_nodes_all and
+        shortest_path_all are returned empty
+    workers: int
+        If greater than 1 (and fastRun), the per pass routing queries are run
+        on a process pool of this size with the contact graph in shared memory
+        (python >= 3.8, otherwise the graph is pickled once to each worker)
     verbose: Boolean
         Prints out debug statements if True
 
@@ -826,62 +936,30 @@ def run_dijkstra_routing(prep_dijkstra_output,
             contactMask = np.logical_and(LOSPosMask, slewRateMask)
             
             times = satPairData.get('times')
-            ssIntervals = get_start_stop_intervals(contactMask, times) #start_stop_intervals
-
-            if any(ssIntervals[0]): #Make sure there are intervals
-                ssIntsVals = [(s[1]-s[0]).to(u.min) for s in ssIntervals]
-
-                #Convert to numpy array
-                ssIntsNp = [s.to(u.min).value for s in ssIntsVals] * u.min
-
-                #Find where it is less than time threshold
-                ints2CutIdx = ssIntsNp < islTimeThreshold
-                ints2Cut = ssIntervals[ints2CutIdx]
-
-                for interval in ints2Cut: #Loop through intervals to turn false
-                    t0Cut = interval[0]
-                    t1Cut = interval[1]
-
-                    id0Cut = np.where(times == t0Cut)[0][0]
-                    id1Cut = np.where(times == t1Cut)[0][0]
-
-                    contactMask[id0Cut+1:id1Cut+1] = False
-
             contacts['contacts'][key] = contactMask
             contacts['time'][key] = times
+
+        #Cut out contacts that are too short to transmit the message, all pairs at once
+        contacts['contacts'] = remove_short_contacts(contacts['contacts'], contacts['time'], islTimeThreshold)
         
     #Calculate access between ground stations and satellites
+    gsMasks = {}
+    gsTimes = {}
+    gsKeys = []
     for access in accessObjectGS.allAccessData:
         key = f'{access.groundLocID}-{access.satID}' #Ground as source
         key2 = f'{access.satID}-{access.groundLocID}' #Ground as sink
-
-        cutMask = copy.deepcopy(access.accessMask)
-
-        #Cut out access times that are less than time required to transfer data
-        intervalLengths = access.accessIntervalLengths
-
-        if any(intervalLengths): #Makes sure there are access intervals
-
-            accessIntervals = access.accessIntervals
-
-            #Convert to numpy array
-            intsLenNp = [s.to(u.min).value for s in intervalLengths] * u.min
-
-            #Find where it is less than time threshold
-            ints2CutIdx = intsLenNp < downlinkTimeThreshold
-            ints2Cut = accessIntervals[ints2CutIdx]
-
-            for interval in ints2Cut: #Loop through intervals to turn false
-                t0Cut = interval[0]
-                t1Cut = interval[1]
-
-                id0Cut = np.where(access.time == t0Cut)[0][0]
-                id1Cut = np.where(access.time == t1Cut)[0][0]
-                cutMask[id0Cut+1:id1Cut+1] = False
-        contacts.get('contacts')[key] = cutMask#access.accessMask
-        contacts.get('contacts')[key2] = cutMask#access.accessMask
-        contacts.get('time')[key] = access.time
-        contacts.get('time')[key2] = access.time
+        gsMasks[key] = access.accessMask
+        gsTimes[key] = access.time
+        gsKeys.append((key, key2))
+
+    #Cut out access times that are less than time required to transfer data
+    gsMasks = remove_short_contacts(gsMasks, gsTimes, downlinkTimeThreshold)
+    for key, key2 in gsKeys:
+        contacts.get('contacts')[key] = gsMasks[key]
+        contacts.get('contacts')[key2] = gsMasks[key]
+        contacts.get('time')[key] = gsTimes[key]
+        contacts.get('time')[key2] = gsTimes[key]
 
     # get nodes
     nodesGS = []
@@ -919,72 +997,145 @@ def run_dijkstra_routing(prep_dijkstra_output,
                 passTimes[satIDStr]['intervals'] = obj.accessIntervals
                 passTimes[satIDStr]['length'] = obj.accessIntervalLengths
     
-    walkerGraph = TimeVaryingGraph(contacts, nodesGS)
-
     previous_nodes_all = {}
     shortest_path_all = {}
+    downlinks_all = {}
+    paths_all = {}
 
-    for sat in maneuverSatIDs:
+    if sweep: #All passes of all sensing satellites in one sweep
         if verbose:
-            print(f'Dijkstra for Sat {sat}')
-        passNum = 0
-        satKey = f'sat {sat}'
-        previous_nodes_all[satKey] = {}
-        shortest_path_all[satKey] = {}
+            print('Routing sweep for all passes')
+        querySats = []
+        queryTimes = []
+        queryKeys = []
+        for sat in maneuverSatIDs:
+            downlinks_all[f'sat {sat}'] = {}
+            paths_all[f'sat {sat}'] = {}
+            passNum = 0
+            for intervals in passTimes[sat]['intervals']:
+                if not any(intervals): #skip if no passes
+                    continue
+                querySats.append(sat)
+                queryTimes.append(intervals[1]) #End of pass
+                queryKeys.append((f'sat {sat}', f'pass {passNum}'))
+                passNum += 1
+        #Without ISLs only ground contacts exist, so satellites cannot relay
+        arrivalTimes, arrivalNodes = routing.earliest_arrival_sweep(contacts,
+                                                                    groundStationNodes,
+                                                                    querySats,
+                                                                    queryTimes,
+                                                                    sim_start_time=simStartTime,
+                                                                    sim_time=simTime,
+                                                                    nodes=nodesGS)
+        for idx, (satKey, passKey) in enumerate(queryKeys):
+            downlinks_all[satKey][passKey] = {f'{arrivalNodes[idx]}': arrivalTimes[idx]}
+    else:
+        if fastRun:
+            walkerGraph = routing.ContactGraph(contacts, nodesGS, refTime=simStartTime)
+        else:
+            walkerGraph = TimeVaryingGraph(contacts, nodesGS)
+
+        if fastRun and workers is not None and workers > 1: #Queries are independent, route them on a process pool
+            startNodes = []
+            startTimes = []
+            queryNodes = []
+            queryKeys = []
+            for sat in maneuverSatIDs:
+                satKey = f'sat {sat}'
+                previous_nodes_all[satKey] = {}
+                shortest_path_all[satKey] = {}
+                if not isl: #No satellite nodes except for sensing satellite
+                    nodesNoISL = copy.deepcopy(groundStationNodes)
+                    nodesNoISL.append(str(sat)) #Just add satellite
+                else:
+                    nodesNoISL = None
+                passNum = 0
+                for intervals in passTimes[sat]['intervals']:
+                    if not any(intervals): #skip if no passes
+                        continue
+                    startNodes.append(sat)
+                    startTimes.append(intervals[1]) #End of pass
+                    queryNodes.append(nodesNoISL)
+                    queryKeys.append((satKey, f'pass {passNum}'))
+                    passNum += 1
+            if verbose:
+                print(f'Dijkstra for {len(queryKeys)} passes on {workers} workers')
+            results = routing.earliest_arrival_pool(walkerGraph,
+                                                    startNodes,
+                                                    startTimes,
+                                                    sim_start_time=simStartTime,
+                                                    sim_time=simTime,
+                                                    nodes=queryNodes,
+                                                    workers=workers)
+            for (satKey, passKey), (previous_nodes, shortest_path) in zip(queryKeys, results):
+                previous_nodes_all[satKey][passKey] = previous_nodes
+                shortest_path_all[satKey][passKey] = shortest_path
+        else:
+            for sat in maneuverSatIDs:
+                if verbose:
+                    print(f'Dijkstra for Sat {sat}')
+                passNum = 0
+                satKey = f'sat {sat}'
+                previous_nodes_all[satKey] = {}
+                shortest_path_all[satKey] = {}
         
-        if not isl: #No satellite nodes except for sensing satellite
-            nodesNoISL = copy.deepcopy(groundStationNodes)
-            nodesNoISL.append(str(sat)) #Just add satellite 
-            allContactKeys = list(contacts['contacts'].keys())
-            keys2keep = []
-            for k in allContactKeys:
-                keySplit = k.split('-')
-                source = keySplit[0]
-                destination = keySplit[1]
-                if source in nodesNoISL and destination in nodesNoISL:
-                    keys2keep.append(k)
-            newContacts = { my_key: contacts['contacts'][my_key] for my_key in keys2keep}
-            newTimes = { my_key: contacts['time'][my_key] for my_key in keys2keep}
-            newContactGraph = {}
-            newContactGraph['contacts'] = newContacts
-            newContactGraph['time'] = newTimes
-            walkerGraph = TimeVaryingGraph(newContactGraph, nodesNoISL)
-
-        for intervals in passTimes[sat]['intervals']:
-            if not any(intervals): #skip if no passes
-                continue
-            passKey = f'pass {passNum}'
-            startTime = intervals[1] #End of pass
-            previous_nodes, shortest_path = time_varying_dijkstra_algorithm(graph=walkerGraph, 
-                                                                            start_node=sat, 
-                                                                            start_time=startTime, 
-                                                                            sim_time=simTime, 
-                                                                            sim_start_time=simStartTime,
-                                                                            verbose=True)
-            previous_nodes_all[satKey][passKey] = previous_nodes
-            shortest_path_all[satKey][passKey] = shortest_path
-            passNum += 1
-
-    downlinks_all = {}
-    paths_all = {}
-    for sat in maneuverSatIDs:
-        satKey = f'sat {sat}'
-        downlinks_all[satKey] = {}
-        paths_all[satKey] = {}
-        shortest_path_sat = shortest_path_all.get(satKey)
-        for passNum in shortest_path_sat:
-            passKey = passNum
-            passData = shortest_path_sat.get(passNum)
-            
-            downlinkOptions = {my_key: passData[my_key] for my_key in groundStationNodes}
-            quickestDownlinkKey = min(downlinkOptions, key=downlinkOptions.get)
-            downlinks_all[satKey][passKey] = {f'{quickestDownlinkKey}': downlinkOptions.get(quickestDownlinkKey)}
-            
-            previousNodesPass = previous_nodes_all.get(satKey).get(passKey)
-            
-            if any(previousNodesPass) and quickestDownlinkKey in previousNodesPass.keys(): #Check for empty passes
-                path = print_dijkstra_result(previousNodesPass, passData, start_node=sat, target_node=quickestDownlinkKey)
-                paths_all[satKey][passKey] = path
+                if not isl: #No satellite nodes except for sensing satellite
+                    nodesNoISL = copy.deepcopy(groundStationNodes)
+                    nodesNoISL.append(str(sat)) #Just add satellite 
+                    if fastRun: #ContactGraph drops edges to nodes outside of nodesNoISL
+                        walkerGraph = routing.ContactGraph(contacts, nodesNoISL, refTime=simStartTime)
+                    else:
+                        allContactKeys = list(contacts['contacts'].keys())
+                        keys2keep = []
+                        for k in allContactKeys:
+                            keySplit = k.split('-')
+                            source = keySplit[0]
+                            destination = keySplit[1]
+                            if source in nodesNoISL and destination in nodesNoISL:
+                                keys2keep.append(k)
+                        newContacts = { my_key: contacts['contacts'][my_key] for my_key in keys2keep}
+                        newTimes = { my_key: contacts['time'][my_key] for my_key in keys2keep}
+                        newContactGraph = {}
+                        newContactGraph['contacts'] = newContacts
+                        newContactGraph['time'] = newTimes
+                        walkerGraph = TimeVaryingGraph(newContactGraph, nodesNoISL)
+
+                for intervals in passTimes[sat]['intervals']:
+                    if not any(intervals): #skip if no passes
+                        continue
+                    passKey = f'pass {passNum}'
+                    startTime = intervals[1] #End of pass
+                    if fastRun:
+                        previous_nodes, shortest_path = routing.earliest_arrival_dijkstra(graph=walkerGraph,
+                                                                                        start_node=sat,
+                                                                                        start_time=startTime,
+                                                                                        sim_time=simTime,
+                                                                                        sim_start_time=simStartTime)
+                    else:
+                        previous_nodes, shortest_path = time_varying_dijkstra_algorithm(graph=walkerGraph, 
+                                                                                        start_node=sat, 
+                                                                                        start_time=startTime, 
+                                                                                        sim_time=simTime, 
+                                                                                        sim_start_time=simStartTime,
+                                                                                        verbose=True)
+                    previous_nodes_all[satKey][passKey] = previous_nodes
+                    shortest_path_all[satKey][passKey] = shortest_path
+                    passNum += 1
+
+        for sat in maneuverSatIDs:
+            satKey = f'sat {sat}'
+            downlinks_all[satKey] = {}
+            paths_all[satKey] = {}
+            shortest_path_sat = shortest_path_all.get(satKey)
+            for passNum in shortest_path_sat:
+                passKey = passNum
+                passData = shortest_path_sat.get(passNum)
+                previousNodesPass = previous_nodes_all.get(satKey).get(passKey)
+
+                downlink, path = get_pass_downlink(previousNodesPass, passData, sat, groundStationNodes)
+                downlinks_all[satKey][passKey] = downlink
+                if path is not None:
+                    paths_all[satKey][passKey] = path
 
     tf_routing = perf_counter()
 
@@ -1012,6 +1163,133 @@ def run_dijkstra_routing(prep_dijkstra_output,
 
     return outputDict
 
+def update_dijkstra_routing(dijkstraOutput,
+                            contactDelta,
+                            groundStationNodes,
+                            simStartTime,
+                            isl=True,
+                            simTime=3*u.day,
+                            passTimes=None,
+                            verbose=False):
+    """
+    Updates the output of run_dijkstra_routing after some contacts changed
+    (e.g. one satellite got a new maneuver schedule) without rerouting the
+    whole constellation. Only the passes whose shortest path trees used a
+    removed contact, or could use an added one, are rerouted
+    (see routing.is_route_affected)
+
+    Parameters
+    ----------
+    dijkstraOutput: ~dict
+        Output of run_dijkstra_routing (run with sweep=False)
+    contactDelta: ~dict
+        Added and removed contacts, output of routing.get_contact_delta.
+        Contacts must already be trimmed to the ISL/downlink time thresholds
+    groundStationNodes: ~list
+        Ground station nodes (prep_dijkstra_output['groundStationNodes'])
+    simStartTime: ~astropy.time.core.Time
+        Start time of the simulation
+    isl: ~bool
+        Must match the value used in run_dijkstra_routing
+    simTime: astropy.Quantity.Quantity
+        Simulation time - affects maximum cost of Dijkstra graph
+    passTimes: ~dict
+        New pass times (same structure as dijkstraOutput['passTimes']) of
+        sensing satellites whose passes changed. Every pass of these
+        satellites is rerouted
+    verbose: Boolean
+        Prints out debug statements if True
+
+    Returns
+    -------
+    outputDict: ~dict
+        Same keys as the output of run_dijkstra_routing, plus
+        rerouted - List of (sat, pass) keys that were rerouted
+    """
+    t0_update = perf_counter()
+    if passTimes is None:
+        passTimes = {}
+
+    contacts = routing.apply_contact_delta(dijkstraOutput.get('contacts'), contactDelta)
+    deltaSeconds = routing.get_delta_seconds(contactDelta, simStartTime)
+    nodesGS = routing.get_contact_nodes(contacts)
+    walkerGraph = routing.ContactGraph(contacts, nodesGS, refTime=simStartTime)
+
+    allPassTimes = dict(dijkstraOutput.get('passTimes'))
+    allPassTimes.update(passTimes)
+
+    downlinks_all = {}
+    paths_all = {}
+    previous_nodes_all = {}
+    shortest_path_all = {}
+    rerouted = []
+    for sat in allPassTimes:
+        satKey = f'sat {sat}'
+        downlinks_all[satKey] = {}
+        paths_all[satKey] = {}
+        previous_nodes_all[satKey] = {}
+        shortest_path_all[satKey] = {}
+        oldPrevious = dijkstraOutput.get('previous_nodes_all').get(satKey, {})
+        oldShortest = dijkstraOutput.get('shortest_path_all').get(satKey, {})
+        newPasses = sat in passTimes
+
+        nodesNoISL = None
+        if not isl: #No satellite nodes except for sensing satellite
+            nodesNoISL = copy.deepcopy(groundStationNodes)
+            nodesNoISL.append(str(sat))
+
+        passNum = 0
+        for intervals in allPassTimes[sat]['intervals']:
+            if not any(intervals): #skip if no passes
+                continue
+            passKey = f'pass {passNum}'
+            passNum += 1
+
+            if (not newPasses and passKey in oldShortest and
+                    not routing.is_route_affected(oldPrevious[passKey], oldShortest[passKey],
+                                                  deltaSeconds, simStartTime)):
+                previous_nodes_all[satKey][passKey] = oldPrevious[passKey]
+                shortest_path_all[satKey][passKey] = oldShortest[passKey]
+                downlinks_all[satKey][passKey] = dijkstraOutput.get('downlinks_all')[satKey][passKey]
+                if passKey in dijkstraOutput.get('paths_all')[satKey]:
+                    paths_all[satKey][passKey] = dijkstraOutput.get('paths_all')[satKey][passKey]
+                continue
+
+            if verbose:
+                print(f'Rerouting {satKey} {passKey}')
+            previous_nodes, shortest_path = routing.earliest_arrival_dijkstra(graph=walkerGraph,
+                                                                            start_node=sat,
+                                                                            start_time=intervals[1], #End of pass
+                                                                            sim_time=simTime,
+                                                                            sim_start_time=simStartTime,
+                                                                            nodes=nodesNoISL)
+            previous_nodes_all[satKey][passKey] = previous_nodes
+            shortest_path_all[satKey][passKey] = shortest_path
+            downlink, path = get_pass_downlink(previous_nodes, shortest_path, sat, groundStationNodes)
+            downlinks_all[satKey][passKey] = downlink
+            if path is not None:
+                paths_all[satKey][passKey] = path
+            rerouted.append((satKey, passKey))
+
+    tf_routing = perf_counter()
+    times_perf = dict(dijkstraOutput.get('timesPerf'))
+    times_perf['t_update'] = tf_routing - t0_update
+
+    outputDict = dict(dijkstraOutput)
+    outputDict.update({
+                    'downlinks_all': downlinks_all,
+                    'paths_all':     paths_all,
+                    'shortest_path_all': shortest_path_all,
+                    'previous_nodes_all': previous_nodes_all,
+                    'passTimes': allPassTimes,
+                    'contacts': contacts,
+                    'tfRouting': tf_routing,
+                    'timesPerf': times_perf,
+                    'rerouted': rerouted,
+    })
+
+    return outputDict
+
 def get_fastest_downlink(constellation, groundStations, groundTarget,
                          simStartTime,
                          recon=True, isl=True,
@@ -1028,6 +1306,7 @@ def get_fastest_downlink(constellation, groundStations, groundTarget,
                          downlinkTimeThreshold=30*u.s,
                          lightingRestraint=False,
                          simTime=3*u.day,
+                         workers=None,
                          verbose=False):
     """
     Gets the route for fastest downlink for a reconfigurable constellation 
@@ -1073,6 +1352,9 @@ def get_fastest_downlink(constellation, groundStations, groundTarget,
         If true, implements lighting restraint (TODO: This can be optimized in the workflow where we only calculate it once)
     simTime: astropy.Quantity.Quantity
         Simulation time - affects maximum cost of Dijkstra graph
+    workers: int
+        Number of processes used for schedule generation and routing queries
+        (see prep_dijkstra and run_dijkstra_routing)
     verbose: Boolean
         Prints out debug statements if True
 
@@ -1096,6 +1378,7 @@ def get_fastest_downlink(constellation, groundStations, groundTarget,
                          constraint_angle_sense=constraint_angle_sense,
                          t2propagate=t2propagate,
                          tStep=tStep,
+                         workers=workers,
                          verbose=verbose)
     dijkstraOutput = run_dijkstra_routing(prepOutput, 
                          simStartTime,
@@ -1106,6 +1389,7 @@ def get_fastest_downlink(constellation, groundStations, groundTarget,
                          downlinkTimeThreshold=downlinkTimeThreshold,
                          lightingRestraint=lightingRestraint,
                          simTime=simTime,
+                         workers=workers,
                          verbose=verbose)
     return dijkstraOutput
 
@@ -1125,6 +1409,7 @@ def get_fastest_downlink_lighting(constellation, groundStations, groundTarget,
                          islTimeThreshold=2.5*u.min,
                          downlinkTimeThreshold=30*u.s,
                          simTime=3*u.day,
+                         workers=None,
                          verbose=False):
     """
     Gets the route for fastest downlink for a reconfigurable constellation 
@@ -1169,6 +1454,9 @@ def get_fastest_downlink_lighting(constellation, groundStations, groundTarget,
         Ground contact must be longer than this to transmit the images in full
     simTime: astropy.Quantity.Quantity
         Simulation time - affects maximum cost of Dijkstra graph
+    workers: int
+        Number of processes used for schedule generation and routing queries
+        (see prep_dijkstra and run_dijkstra_routing)
     verbose: Boolean
         Prints out debug statements if True
 
@@ -1193,6 +1481,7 @@ def get_fastest_downlink_lighting(constellation, groundStations, groundTarget,
                          constraint_angle_sense=constraint_angle_sense,
                          t2propagate=t2propagate,
                          tStep=tStep,
+                         workers=workers,
                          verbose=verbose)
     dijkstraOutputLighting = run_dijkstra_routing(prepOutput, 
                          simStartTime,
@@ -1203,6 +1492,7 @@ def get_fastest_downlink_lighting(constellation, groundStations, groundTarget,
                          downlinkTimeThreshold=downlinkTimeThreshold,
                          lightingRestraint=True,
                          simTime=simTime,
+                         workers=workers,
                          verbose=verbose)
     # dijkstraOutputNoLighting = run_dijkstra_routing(prepOutput, isl=isl,
     #                      distanceThreshold=distanceThreshold,
@@ -1217,25 +1507,24 @@ def get_fastest_downlink_lighting(constellation, groundStations, groundTarget,
     return output
     
 
-def calc_metrics(dijkstraData, T=3*u.day):
+def get_downlink_arrays(dijkstraData):
     """
-    Calculates Age of Information
-    
+    Gets the downlink and pass end times of a routing run as float arrays,
+    the input of calc_aoi_batch
+
     Parameters
     ----------
     dijkstraData: dict
         Output of utils.get_fastest_downlink
-    T: ~astropy.unit.Quantity
-        Time of entire simulation (to calculate average)
-        
+
     Returns
     -------
-    AoI: ~astropy.unit.Quantity
-        average age of information
-    srt: ~astropy.unit.Quantity
-        system response time
-    passTimeSum: ~astropy.unit.Quantity
-        total sum of pass time over target
+    downlinkTimes: ~np.array
+        Downlink time of every pass (seconds from start of sim)
+    passEndTimes: ~np.array
+        End time of every pass (seconds from start of sim)
+    tEnd: float
+        End of sim (seconds from start of sim)
     """
     downlinks_all = dijkstraData.get('downlinks_all')
     passTimes = dijkstraData.get('passTimes')
@@ -1245,56 +1534,129 @@ def calc_metrics(dijkstraData, T=3*u.day):
     t0 = timeStream[tStreamKeys[0]][0] #Get start of sim
     tf = timeStream[tStreamKeys[0]][-1] #Get end time of sim
 
-    downlinks_all_flat = {}
-    #Flatten downlinks data dictionary
+    downlinkList = []
+    passEndList = []
     for satKey in downlinks_all:
         satDict = downlinks_all.get(satKey)
+        sat = satKey.split()[1]
         for passKey in satDict:
             passDict = satDict.get(passKey)
-            for gsKey in passDict:
+            passNum = int(passKey.split()[1])
+            for gsKey in passDict: #Last ground station wins, same as calc_metrics
                 dlTime = passDict.get(gsKey)
-                newKey = satKey + '|' + passKey# + '|' + gsKey
-                downlinks_all_flat[newKey] = dlTime
-
-    downlinks_all_sorted = dict(sorted(downlinks_all_flat.items(), key=lambda item: item[1]))
-    #Remove edge cases
-    passNoDownlink = False #Notes if there is a pass at the end that isn't downlinked by end of time span in question
-    # downlinks_all_sorted = {}
-    # for key in downlinks_all_sorted_raw:
-    #     if downlinks_all_sorted_raw[key] <= tf:
-    #         downlinks_all_sorted[key] = downlinks_all_sorted_raw[key]
-    #     elif downlinks_all_sorted_raw[key] > tf:
-    #         passNoDownlink = True #There is a pass/downlink combo where downlink is beyond length of simulation in question
-    #     else:
-    #         continue    
-
-    passTimeDict = {}
-    passTimeSum = 0 * u.s
-    #Flatten passTimes
-    for key in downlinks_all_sorted:
-        satPassGS = key.split('|')
-        sat = satPassGS[0].split()[1]
-        passNum = satPassGS[1].split()[1]
-
-        passTime = passTimes[sat].get('intervals')[int(passNum)][1]
+            downlinkList.append(dlTime)
+            passEndList.append(passTimes[sat].get('intervals')[passNum][1])
 
-        passTimeLength = passTimes[sat].get('length')[int(passNum)]
+    if not downlinkList:
+        return np.array([]), np.array([]), (tf - t0).sec
 
+    #One Time subtraction per array
+    downlinkTimes = np.atleast_1d((time.Time(downlinkList) - t0).sec)
+    passEndTimes = np.atleast_1d((time.Time(passEndList) - t0).sec)
+    return downlinkTimes, passEndTimes, (tf - t0).sec
 
-        # passTimeSum += passTimeLength
+def calc_aoi_batch(downlinkTimes, passEndTimes, tEnd, T):
+    """
+    Calculates the average Age of Information (AoI) and system response time
+    (srt) of many scenarios at once. The AoI sawtooth is integrated in closed
+    form on float arrays with the same terms as calc_metrics
 
-        finalKey = f'sat {sat}|pass {passNum}'
+    Parameters
+    ----------
+    downlinkTimes: ~np.array or list
+        Downlink times (seconds from start of sim). Either an (S, N) array
+        padded with NaN or a list of S 1D arrays of any length
+    passEndTimes: ~np.array or list
+        End time of the pass of each downlink (seconds), same shape
+    tEnd: float or ~np.array
+        End of sim of each scenario (seconds from start of sim)
+    T: float or ~np.array
+        Time of entire simulation of each scenario (seconds, to calculate average)
 
-        passTimeDict[finalKey] = passTime
+    Returns
+    -------
+    outputMetrics: ~dict
+        Dictionary with keys
+        AoI         - average age of information of each scenario (seconds)
+        srt         - system response time of each scenario (seconds)
+        numDownlinks - number of downlinks of each scenario
+        Scenarios without downlinks get AoI = srt = T
+    """
+    if isinstance(downlinkTimes, list): #Pad ragged scenarios with NaN
+        numCols = max([len(d) for d in downlinkTimes] + [1])
+        downlinkPad = np.full((len(downlinkTimes), numCols), np.nan)
+        passEndPad = np.full((len(downlinkTimes), numCols), np.nan)
+        for row, (dl, pe) in enumerate(zip(downlinkTimes, passEndTimes)):
+            downlinkPad[row, :len(dl)] = dl
+            passEndPad[row, :len(pe)] = pe
+        downlinkTimes = downlinkPad
+        passEndTimes = passEndPad
+    downlinkTimes = np.atleast_2d(np.asarray(downlinkTimes, dtype=float))
+    passEndTimes = np.atleast_2d(np.asarray(passEndTimes, dtype=float))
+    numScenarios = downlinkTimes.shape[0]
+    tEnd = np.broadcast_to(np.asarray(tEnd, dtype=float), (numScenarios,))
+    T = np.broadcast_to(np.asarray(T, dtype=float), (numScenarios,))
+
+    #Sort each scenario by downlink time (stable, NaN padding goes last)
+    order = np.argsort(downlinkTimes, axis=1, kind='stable')
+    d = np.take_along_axis(downlinkTimes, order, axis=1)
+    p = np.take_along_axis(passEndTimes, order, axis=1)
+    numDownlinks = np.sum(~np.isnan(d), axis=1)
+    rows = np.arange(numScenarios)
+    hasDownlink = numDownlinks > 0
+
+    #First downlink, age grows from the start of the sim
+    d0 = np.where(hasDownlink, d[:, 0], 0)
+    area = d0**2 / 2
+
+    #Between downlinks i-1 and i the age is measured from pass end i-1
+    if d.shape[1] > 1:
+        steps = ((d[:, 1:] - p[:, :-1])**2 - (d[:, :-1] - p[:, :-1])**2) / 2
+        validSteps = np.arange(1, d.shape[1])[None, :] < numDownlinks[:, None]
+        area += np.where(validSteps, steps, 0).sum(axis=1)
+
+    #Until the end of the sim (calc_metrics uses the second to last downlink here)
+    lastIdx = np.clip(numDownlinks - 2, 0, None)
+    pLast = p[rows, lastIdx]
+    dLast = d[rows, lastIdx]
+    tail = ((tEnd - pLast)**2 - (dLast - pLast)**2) / 2
+    area += np.where(hasDownlink, tail, 0)
+
+    AoI = np.where(hasDownlink, area / T, T)
+    srt = np.where(hasDownlink, d0, T)
 
-    # Calculate age of information
-    keys = list(downlinks_all_sorted.keys())
-    # keys = list(downlinks_all_sorted_raw.keys())
-    startIdx = 1
+    outputMetrics = {
+                        'AoI': AoI,
+                        'srt': srt,
+                        'numDownlinks': numDownlinks,
+    }
+    return outputMetrics
 
-    frac = 0
+def calc_metrics(dijkstraData, T=3*u.day):
+    """
+    Calculates Age of Information
+    
+    Parameters
+    ----------
+    dijkstraData: dict
+        Output of utils.get_fastest_downlink
+    T: ~astropy.unit.Quantity
+        Time of entire simulation (to calculate average)
+        
+    Returns
+    -------
+    AoI: ~astropy.unit.Quantity
+        average age of information
+    srt: ~astropy.unit.Quantity
+        system response time
+    passTimeSum: ~astropy.unit.Quantity
+        total sum of pass time over target
+    """
+    passTimes = dijkstraData.get('passTimes')
+    downlinkTimes, passEndTimes, tEnd = get_downlink_arrays(dijkstraData)
 
     # Calculate overall pass time
+    passTimeSum = 0 * u.s
     for satPass in passTimes:
         passLengths = passTimes[satPass]['length']
         if passLengths:
@@ -1302,39 +1664,13 @@ def calc_metrics(dijkstraData, T=3*u.day):
             passTimeSum += sumPass
 
     # Calculate AoI
-    if not keys: #No downlinks, AoI is the length of simulation
+    if len(downlinkTimes) == 0: #No downlinks, AoI is the length of simulation
         AoI = T
         srtMin = T.to(u.min)
     else:
-        for idx in range(0, len(keys)):
-            key_i = keys[idx]
-            key_im1 = keys[idx-1]
-
-            if idx == 0: #Area under curve for first downlink
-                t21 = (downlinks_all_sorted[key_i] - t0).sec**2
-                t11 = 0
-            else: #Else for later curves need to subtract the overlapping portion
-                t21 = (downlinks_all_sorted[key_i] - passTimeDict[key_im1]).sec**2
-                t11 = (downlinks_all_sorted[key_im1] - passTimeDict[key_im1]).sec**2
-
-            if idx == len(keys)-1: #This is the last pass, take last point as tf, but this is the special case with only 1 downlink
-                t21_0 = t21
-                t11_0 = t11
-
-                frac += (t21_0 - t11_0)/2 *u.s*u.s
-
-                t21 = (tf - passTimeDict[key_im1]).sec**2
-                t11 = (downlinks_all_sorted[key_im1] - passTimeDict[key_im1]).sec**2
-            
-            # elif idx == len(keys)-1: #This is the last pass, take last point as tf
-            #     t21 = (tf - passTimeDict[key_im1]).sec**2
-            #     t11 = (downlinks_all_sorted[key_im1] - passTimeDict[key_im1]).sec**2
-
-            frac += (t21 - t11)/2 *u.s*u.s
-        AoI = (frac/T).decompose().to(u.min)
-
-        srt = (downlinks_all_sorted[keys[0]] - t0).sec #In seconds
-        srtMin = srt/60 * u.min
+        metrics = calc_aoi_batch(downlinkTimes, passEndTimes, tEnd, T.to(u.s).value)
+        AoI = (metrics['AoI'][0] * u.s).to(u.min)
+        srtMin = metrics['srt'][0]/60 * u.min
 
     outputMetrics = {
                         'AoI': AoI,
@@ -1606,23 +1942,13 @@ def pareto_frontier(Xs, Ys, maxX = True, maxY = True):
     or both of the parameters.
 
     # From https://oco-carbon.com/metrics/find-pareto-frontiers-in-python/
+    # Uses pareto.pareto_indices (weakly dominated points are no longer kept)
 
     '''
-    # Sort the list in either ascending or descending order of X
-    myList = sorted([[Xs[i], Ys[i]] for i in range(len(Xs))], reverse=maxX)
-    # Start the Pareto frontier with the first value in the sorted list
-    p_front = [myList[0]]    
-    # Loop through the sorted list
-    for pair in myList[1:]:
-        if maxY: 
-            if pair[1] >= p_front[-1][1]: # Look for higher values of Y…
-                p_front.append(pair) # … and add them to the Pareto frontier
-        else:
-            if pair[1] <= p_front[-1][1]: # Look for lower values of Y…
-                p_front.append(pair) # … and add them to the Pareto frontier
-    # Turn resulting pairs back into a list of Xs and Ys
-    p_frontX = [pair[0] for pair in p_front]
-    p_frontY = [pair[1] for pair in p_front]
+    points = np.column_stack((np.asarray(Xs, dtype=float), np.asarray(Ys, dtype=float)))
+    paretoIdx = pareto.pareto_indices(points, maximize=[maxX, maxY])
+    p_frontX = [Xs[i] for i in paretoIdx]
+    p_frontY = [Ys[i] for i in paretoIdx]
     return p_frontX, p_frontY
 
 def get_potential_isl_keys(satID, keys, excludeList = None):